@@ -44,6 +44,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'store.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
@@ -51,6 +52,7 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'store.carts.CartCookieMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -68,6 +70,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'django.template.context_processors.i18n',
+                'store.context_processors.catalogue_cache',
             ],
         },
     },
@@ -83,8 +86,30 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Keep connections (and their PRAGMAs) across requests
+        'CONN_MAX_AGE': int(os.environ.get('STORE_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {'timeout': 20},
     }
 }
+# Catalogue reads use a separate read-only connection to the same file
+# (store.database.ReadWriteRouter); writes and transactions stay on default.
+DATABASES['catalogue_read'] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+DATABASE_ROUTERS = ['store.database.ReadWriteRouter']
+STORE_DATABASE_READ_ALIAS = 'catalogue_read'
+
+# PRAGMAs run on every new SQLite connection (store.database.apply_pragmas).
+# Only per-connection PRAGMAs belong here: the journal mode is stored in the
+# database file, so switch it once with `manage.py set_journal_mode wal`.
+# WAL lets readers and the writer work concurrently; with WAL, synchronous=NORMAL
+# stays consistent and only syncs on checkpoints. cache_size < 0 is in KiB.
+STORE_SQLITE_PRAGMAS = {
+    'synchronous': 'normal',
+    'busy_timeout': 20000,
+    'cache_size': -64000,
+    'mmap_size': 256 * 2 ** 20,
+    'temp_store': 'memory',
+}
 
 
 # Password validation
@@ -151,6 +176,124 @@ CRISPY_TEMPLATE_PACK = "bootstrap5"
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Full-text product search backend
+STORE_SEARCH_BACKEND = 'store.search.SQLiteFTSBackend'
+
+# Product list facets: specification keys and price bucket lower bounds (₽)
+STORE_FACET_SPECIFICATIONS = ['Чип', 'Объем памяти']
+STORE_PRICE_BUCKETS = [0, 20000, 50000, 100000, 200000]
+STORE_FACET_CACHE_TIMEOUT = 5
+
+# Per-view query/latency instrumentation (store.instrumentation).
+# Disabled middleware is removed from the chain entirely.
+STORE_INSTRUMENTATION = False
+STORE_INSTRUMENTATION_WINDOW = 500
+STORE_ENFORCE_QUERY_BUDGETS = False
+STORE_QUERY_BUDGETS = {
+    'store:home': 2,
+    'store:product_list': 5,
+    'store:product_detail': 5,
+    # Plus the category slug map, loaded once per catalogue version
+    'store:category_detail': 6,
+    'store:cart': 7,
+    # First add for a new visitor: session, cart, daily counter and stock reservation
+    'store:add_to_cart': 12,
+    'store:update_cart_item': 9,
+    'store:remove_from_cart': 9,
+    'store:cart_batch': 16,
+    'store:checkout': 13,
+    'store:order_success': 4,
+    'store:api_category_list': 1,
+    'store:api_product_list': 3,
+    'store:api_product_detail': 2,
+    # Building the typeahead index on first use; later requests make no queries
+    'store:api_suggestions': 3,
+}
+
+# Inventory: cart lines reserve tracked stock for STORE_RESERVATION_TTL seconds.
+# Expired reservations are returned by `manage.py release_expired_reservations`.
+STORE_RESERVE_ON_ADD_TO_CART = True
+STORE_RESERVATION_TTL = 900
+
+# Anonymous carts: 'database' keeps Cart/CartItem rows (the cart id is cached
+# in the session); 'cookie' keeps product ids and quantities in a signed
+# cookie and writes nothing until checkout or login. Signed-in users always
+# use the database.
+STORE_CART_BACKEND = 'database'
+STORE_CART_COOKIE_NAME = 'store_cart'
+STORE_CART_COOKIE_AGE = 60 * 60 * 24 * 30
+STORE_CART_COOKIE_MAX_LINES = 50
+
+# Read-only catalogue JSON API (store.api). Responses carry strong ETags and
+# may be stored by clients for STORE_API_MAX_AGE seconds before revalidation.
+STORE_API_PAGE_SIZE = 24
+STORE_API_MAX_PAGE_SIZE = 100
+STORE_API_MAX_AGE = 0
+
+# Search-as-you-type suggestions (store.typeahead): an in-process index of
+# product names, category names and these specification values. It is rebuilt
+# when the catalogue version changes or after STORE_TYPEAHEAD_MAX_AGE seconds,
+# which picks up new sales for popularity ranking.
+STORE_TYPEAHEAD_SPECIFICATIONS = ['Чип', 'Объем памяти', 'Цвет']
+STORE_TYPEAHEAD_MAX_AGE = 900
+
+# "Bought together" recommendations (store.recommendations): top-K neighbours
+# per product from order history. Orders with more distinct products than
+# STORE_RECOMMENDATIONS_MAX_BASKET are left out of the co-purchase counts.
+STORE_RECOMMENDATIONS_TOP_K = 8
+STORE_RECOMMENDATIONS_MAX_BASKET = 50
+
+# Product and category image renditions, built off-request by store.images.
+# 'thread' runs jobs in a pool inside the web process; 'external' leaves them
+# to `manage.py process_image_jobs`. Rendition file names carry a content
+# hash, so the web server may serve them with a one-year immutable
+# Cache-Control header.
+STORE_IMAGE_WORKER = 'thread'
+STORE_IMAGE_WORKERS = 2
+STORE_IMAGE_RENDITIONS = {
+    'thumbnail': (160, 160),
+    'small': (320, 320),
+    'card': (560, 560),
+    'detail': (800, 800),
+    'large': (1200, 1200),
+}
+STORE_IMAGE_FORMATS = ['JPEG', 'WEBP']
+
+# Where home, catalogue (without search) and category listings come from:
+# 'database' queries SQLite on every request; 'snapshot' filters, sorts and
+# paginates an in-process column snapshot of the catalogue (store.snapshot),
+# rebuilt when the catalogue version changes, and reads only the page's
+# products from the database when their card fragments are not cached.
+STORE_CATALOGUE_SOURCE = os.environ.get('STORE_CATALOGUE_SOURCE', 'database')
+# Availability derived from stock only bumps the product's category version,
+# so the snapshot picks it up after at most this many seconds.
+STORE_SNAPSHOT_MAX_AGE = 300
+
+# Rendered catalogue pages and fragments (store.caching). Set
+# STORE_CATALOGUE_CACHE=file to share the cache between worker processes.
+STORE_CATALOGUE_CACHE = os.environ.get('STORE_CATALOGUE_CACHE', 'locmem')
+STORE_CATALOGUE_CACHE_ALIAS = 'catalogue'
+STORE_FRAGMENT_CACHE_TIMEOUT = 600
+STORE_PAGE_CACHE_TIMEOUT = 300
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalogue': {
+        'locmem': {
+            'BACKEND': 'store.caching.CountingLocMemCache',
+            'LOCATION': 'store-catalogue',
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        },
+        'file': {
+            'BACKEND': 'store.caching.CountingFileBasedCache',
+            'LOCATION': BASE_DIR / 'cache' / 'catalogue',
+            'OPTIONS': {'MAX_ENTRIES': 20000},
+        },
+    }[STORE_CATALOGUE_CACHE],
+}
+
 # Number formatting for Russian currency
 USE_THOUSAND_SEPARATOR = True
 THOUSAND_SEPARATOR = ' '
@@ -1,5 +1,15 @@
+import io
+
+from django import forms
 from django.contrib import admin
-from .models import Category, Product, Cart, CartItem, Order, OrderItem
+from django.core.exceptions import PermissionDenied
+from django.db.models import OuterRef, Subquery, Sum
+from django.template.response import TemplateResponse
+from django.urls import path
+from .analytics import PERIODS, sales_dashboard
+from .imports import format_change, guess_format, import_products, read_rows
+from .models import Category, Product, Cart, CartItem, DailySales, Order, OrderItem, Stock
+from .pagination import CachedCountPaginator
 
 
 @admin.register(Category)
@@ -11,6 +21,21 @@ class CategoryAdmin(admin.ModelAdmin):
     ordering = ['name']
 
 
+class StockInline(admin.StackedInline):
+    model = Stock
+    readonly_fields = ['reserved', 'available']
+    fields = ['on_hand', 'reserved', 'available']
+
+    @admin.display(description='Свободно')
+    def available(self, obj):
+        return obj.available
+
+
+class ProductImportForm(forms.Form):
+    file = forms.FileField(label='Файл', help_text='CSV с заголовком или JSON Lines (.jsonl); обязательная колонка slug')
+    dry_run = forms.BooleanField(label='Только показать изменения', required=False, initial=True)
+
+
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
     list_display = ['name', 'category', 'price', 'availability', 'featured', 'created_at']
@@ -18,8 +43,13 @@ class ProductAdmin(admin.ModelAdmin):
     search_fields = ['name', 'description']
     prepopulated_fields = {'slug': ('name',)}
     list_editable = ['price', 'availability', 'featured']
+    list_select_related = ['category']
     ordering = ['-created_at']
     list_per_page = 20
+    paginator = CachedCountPaginator
+    show_full_result_count = False
+    inlines = [StockInline]
+    change_list_template = 'admin/store/product/change_list.html'
 
     fieldsets = (
         ('Основная информация', {
@@ -37,37 +67,99 @@ class ProductAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_urls(self):
+        return [
+            path('import/', self.admin_site.admin_view(self.import_view), name='store_product_import'),
+            *super().get_urls(),
+        ]
 
-class CartItemInline(admin.TabularInline):
-    model = CartItem
+    def import_view(self, request):
+        """Импорт прайс-листа через store.imports: сначала пробный прогон, затем запись"""
+        if not (self.has_add_permission(request) and self.has_change_permission(request)):
+            raise PermissionDenied
+        form = ProductImportForm(request.POST or None, request.FILES or None)
+        result = None
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['file']
+            stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+            result = import_products(read_rows(stream, guess_format(upload.name)), dry_run=form.cleaned_data['dry_run'])
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Импорт товаров',
+            'form': form,
+            'result': result,
+            'changes': [format_change(*change) for change in result.changes] if result else [],
+            'dry_run': form.cleaned_data.get('dry_run') if result else None,
+        }
+        return TemplateResponse(request, 'admin/store/product/import.html', context)
+
+
+class ProductLineInline(admin.TabularInline):
+    """
+    Позиции корзины или заказа: товар загружается вместе с позицией (для total_price),
+    а поле товара — автодополнение вместо списка из всего каталога в каждой строке.
+    """
     extra = 0
-    readonly_fields = ['total_price']
+    readonly_fields = ['line_total']
+    autocomplete_fields = ['product']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
+
+    @admin.display(description='Сумма')
+    def line_total(self, obj):
+        # Пустая форма для новой строки ещё без товара и количества
+        return obj.total_price if obj.pk else '—'
+
+
+class CartItemInline(ProductLineInline):
+    model = CartItem
 
 
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
-    list_display = ['__str__', 'user', 'total_items', 'total_price', 'created_at']
+    # Итоги корзины хранятся в самой строке (items_count, subtotal) — без запросов к позициям
+    list_display = ['__str__', 'user', 'items_count', 'subtotal', 'updated_at', 'created_at']
     list_filter = ['created_at']
+    list_select_related = ['user']
     search_fields = ['user__username', 'user__email']
     inlines = [CartItemInline]
-    readonly_fields = ['total_price', 'total_items']
+    readonly_fields = ['items_count', 'subtotal']
+    raw_id_fields = ['user']
+    paginator = CachedCountPaginator
+    show_full_result_count = False
 
 
-class OrderItemInline(admin.TabularInline):
+class OrderItemInline(ProductLineInline):
     model = OrderItem
-    extra = 0
-    readonly_fields = ['total_price']
 
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ['id', 'user', 'first_name', 'last_name', 'status', 'total_amount', 'created_at']
+    list_display = ['id', 'user', 'first_name', 'last_name', 'status', 'units', 'total_amount', 'created_at']
     list_filter = ['status', 'created_at']
+    list_select_related = ['user']
     search_fields = ['first_name', 'last_name', 'email', 'phone']
     list_editable = ['status']
     inlines = [OrderItemInline]
     readonly_fields = ['created_at', 'updated_at']
+    raw_id_fields = ['user']
     ordering = ['-created_at']
+    paginator = CachedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # Подзапрос считается только для строк страницы, а не GROUP BY по всем заказам
+        units = (
+            OrderItem.objects.filter(order=OuterRef('pk')).order_by()
+            .values('order').annotate(units=Sum('quantity')).values('units')
+        )
+        return super().get_queryset(request).annotate(units=Subquery(units))
+
+    @admin.display(description='Товаров')
+    def units(self, obj):
+        return obj.units or 0
 
     fieldsets = (
         ('Информация о заказе', {
@@ -81,3 +173,37 @@ class OrderAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+
+
+@admin.register(DailySales)
+class SalesDashboardAdmin(admin.ModelAdmin):
+    """Панель продаж вместо списка строк: читает только таблицы итогов (store.analytics)"""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        try:
+            days = int(request.GET.get('days', 30))
+        except ValueError:
+            days = 30
+        days = days if days in PERIODS else 30
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Продажи',
+            'days': days,
+            'periods': PERIODS,
+            **sales_dashboard(days),
+            **(extra_context or {}),
+        }
+        return TemplateResponse(request, 'admin/store/dailysales/dashboard.html', context)
+
@@ -0,0 +1,134 @@
+"""
+Отчёты о продажах из таблиц дневных итогов.
+
+DailySales, DailyProductSales и DailyCarts пополняются при оформлении заказа,
+смене его статуса и создании корзины (Order.add_to_sales, store.signals).
+Панель в админке читает только эти таблицы: объём запросов зависит от длины
+выбранного периода, а не от истории заказов. rebuild_sales_rollups
+пересчитывает итоги по заказам целиком — для первого заполнения и после
+массовых изменений в обход моделей. Корзины удаляются (purge_carts, оформление
+cookie-корзины), поэтому DailyCarts по ним не пересчитывается: заполняются
+только дни без счётчика.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Cart, Category, DailyCarts, DailyProductSales, DailySales, Order, OrderItem, Product
+
+
+PERIODS = (7, 30, 90, 365)
+# Отменённые заказы видны в разбивке по статусам, но не входят в выручку и конверсию
+EXCLUDED_STATUSES = ('cancelled',)
+
+
+def _local_day(field):
+    return TruncDate(field, tzinfo=timezone.get_current_timezone())
+
+
+def rebuild_sales_rollups(batch_size=2000):
+    """Пересчитать итоги по заказам и дописать недостающие дни корзин; число записанных строк"""
+    units = {
+        (row['day'], row['order__status']): row['units']
+        for row in OrderItem.objects.annotate(day=_local_day('order__created_at'))
+        .values('day', 'order__status').annotate(units=Sum('quantity')).order_by()
+    }
+    sales = [
+        DailySales(
+            day=row['day'], status=row['status'], orders=row['orders'], revenue=row['revenue'],
+            units=units.get((row['day'], row['status']), 0),
+        )
+        for row in Order.objects.annotate(day=_local_day('created_at'))
+        .values('day', 'status').annotate(orders=Count('id'), revenue=Sum('total_amount')).order_by()
+    ]
+    products = (
+        DailyProductSales(
+            day=row['day'], status=row['order__status'], product_id=row['product_id'],
+            category_id=row['product__category_id'], orders=row['orders'], units=row['units'],
+            revenue=row['revenue'],
+        )
+        for row in OrderItem.objects.annotate(day=_local_day('order__created_at'))
+        .values('day', 'order__status', 'product_id', 'product__category_id')
+        .annotate(orders=Count('order_id', distinct=True), units=Sum('quantity'), revenue=Sum(F('price') * F('quantity')))
+        .order_by().iterator(chunk_size=batch_size)
+    )
+    # Существующие счётчики корзин не перезаписываются: удалённые корзины в них уже учтены
+    counted = set(DailyCarts.objects.values_list('day', flat=True))
+    carts = [
+        DailyCarts(day=row['day'], carts=row['carts'])
+        for row in Cart.objects.annotate(day=_local_day('created_at')).values('day').annotate(carts=Count('id')).order_by()
+        if row['day'] not in counted
+    ]
+
+    with transaction.atomic():
+        for model in (DailySales, DailyProductSales):
+            model.objects.all().delete()
+        DailySales.objects.bulk_create(sales, batch_size=batch_size)
+        DailyCarts.objects.bulk_create(carts, batch_size=batch_size)
+        product_rows = 0
+        batch = []
+        for row in products:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                product_rows += len(DailyProductSales.objects.bulk_create(batch))
+                batch = []
+        product_rows += len(DailyProductSales.objects.bulk_create(batch))
+    return {'sales': len(sales), 'product sales': product_rows, 'carts': len(carts)}
+
+
+def sales_dashboard(days=30, top=10, today=None):
+    """Выручка, заказы, конверсия корзин, продажи по дням, статусам, категориям и лидеры продаж"""
+    today = today or timezone.localdate()
+    start = today - timedelta(days=days - 1)
+    sales = DailySales.objects.filter(day__gte=start, day__lte=today)
+    placed = sales.exclude(status__in=EXCLUDED_STATUSES)
+    products = DailyProductSales.objects.filter(day__gte=start, day__lte=today).exclude(status__in=EXCLUDED_STATUSES)
+
+    totals = placed.aggregate(orders=Sum('orders'), units=Sum('units'), revenue=Sum('revenue'))
+    totals = {name: value or 0 for name, value in totals.items()}
+    carts = DailyCarts.objects.filter(day__gte=start, day__lte=today).aggregate(carts=Sum('carts'))['carts'] or 0
+    totals['carts'] = carts
+    totals['average'] = totals['revenue'] / totals['orders'] if totals['orders'] else Decimal(0)
+    totals['conversion'] = totals['orders'] / carts * 100 if carts else None
+
+    by_day = {row['day']: row for row in placed.values('day').annotate(orders=Sum('orders'), revenue=Sum('revenue')).order_by()}
+    peak = max((row['revenue'] for row in by_day.values()), default=0) or 1
+    daily = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        row = by_day.get(day, {'orders': 0, 'revenue': Decimal(0)})
+        daily.append({'day': day, 'orders': row['orders'], 'revenue': row['revenue'], 'share': row['revenue'] / peak * 100})
+
+    statuses = dict(Order.STATUS_CHOICES)
+    by_status = [
+        {**row, 'label': statuses.get(row['status'], row['status'])}
+        for row in sales.values('status').annotate(orders=Sum('orders'), revenue=Sum('revenue')).order_by('-orders')
+        if row['orders']
+    ]
+    # Группировка только по id, названия — отдельным запросом для немногих строк результата
+    categories = list(
+        products.values('category_id').annotate(units=Sum('units'), revenue=Sum('revenue')).order_by('-revenue')
+    )
+    top_sellers = list(
+        products.values('product_id').annotate(orders=Sum('orders'), units=Sum('units'), revenue=Sum('revenue'))
+        .order_by('-revenue')[:top]
+    )
+    names = Category.objects.in_bulk([row['category_id'] for row in categories])
+    for row in categories:
+        row['category'] = names.get(row['category_id'])
+    names = Product.objects.only('name', 'slug').in_bulk([row['product_id'] for row in top_sellers])
+    for row in top_sellers:
+        row['product'] = names.get(row['product_id'])
+    return {
+        'start': start,
+        'end': today,
+        'totals': totals,
+        'daily': daily,
+        'by_status': by_status,
+        'categories': [row for row in categories if row['units']],
+        'top_sellers': [row for row in top_sellers if row['units']],
+    }
@@ -0,0 +1,251 @@
+"""
+Read-only JSON API каталога: категории, список товаров и товар по slug.
+
+Ответы собираются из .values() только нужных колонок, без экземпляров
+моделей; параметр fields=id,name,price оставляет в ответе перечисленные поля.
+Список товаров принимает те же фильтры и сортировки, что и каталог
+(store.catalogue.CatalogueQuery), и листается курсором.
+
+Каждый ответ несёт сильный ETag, который считается до построения ответа: для
+товара — из его updated_at и версии категории, для списка — из числа товаров
+выборки и максимального updated_at (одним агрегатным запросом, который
+кешируется до изменения каталога; число заодно идёт в ответ) и версии каталога.
+Запрос с совпавшим If-None-Match получает 304 без выборки и сериализации строк.
+
+Подсказки поиска (suggestions) отвечают из индекса в памяти (store.typeahead)
+без запросов к базе.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.http import Http404, JsonResponse
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_safe
+
+from .caching import catalogue_cache, get_version
+from .catalogue import CatalogueQuery
+from .models import Category, Product
+from .pagination import SORT_KEYS, CursorPaginator
+from .typeahead import MAX_LIMIT, suggest
+
+
+class Field:
+    """Поле ответа: колонки для .values() и преобразование строки в значение"""
+
+    def __init__(self, *columns, to_json=None):
+        self.columns = columns
+        self.to_json = to_json or (lambda row: row[columns[0]])
+
+
+def _image_url(row, storage=Product._meta.get_field('image').storage):
+    if row['image']:
+        return storage.url(row['image'])
+    return row.get('fallback_image_url') or None
+
+
+PRODUCT_FIELDS = {
+    'id': Field('id'),
+    'name': Field('name'),
+    'slug': Field('slug'),
+    'category': Field('category__slug'),
+    'price': Field('price'),
+    'availability': Field('availability'),
+    'featured': Field('featured'),
+    'description': Field('description'),
+    'specifications': Field('specifications'),
+    'url': Field('slug', to_json=lambda row: reverse('store:product_detail', args=[row['slug']])),
+    'image': Field('image', 'fallback_image_url', to_json=_image_url),
+    'created_at': Field('created_at'),
+    'updated_at': Field('updated_at'),
+}
+PRODUCT_LIST_FIELDS = ('id', 'name', 'slug', 'category', 'price', 'availability', 'url', 'image')
+
+CATEGORY_FIELDS = {
+    'id': Field('id'),
+    'name': Field('name'),
+    'slug': Field('slug'),
+    'description': Field('description'),
+    'url': Field('slug', to_json=lambda row: reverse('store:category_detail', args=[row['slug']])),
+    'image': Field('image', to_json=_image_url),
+}
+
+
+class FieldError(ValueError):
+    pass
+
+
+def select_fields(request, available, default):
+    """Поля из параметра fields= (через запятую); по умолчанию — default"""
+    raw = request.GET.get('fields')
+    if not raw:
+        return {name: available[name] for name in default}
+    names = [name.strip() for name in raw.split(',') if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown or not names:
+        raise FieldError('Неизвестные поля: ' + ', '.join(unknown) if unknown else 'Пустой список полей')
+    return {name: available[name] for name in names}
+
+
+def columns(fields):
+    return list(dict.fromkeys(column for field in fields.values() for column in field.columns))
+
+
+def serialize(rows, fields):
+    return [{name: field.to_json(row) for name, field in fields.items()} for row in rows]
+
+
+def page_size(request):
+    default = getattr(settings, 'STORE_API_PAGE_SIZE', 24)
+    try:
+        size = int(request.GET.get('limit', default))
+    except ValueError:
+        size = default
+    return min(max(size, 1), getattr(settings, 'STORE_API_MAX_PAGE_SIZE', 100))
+
+
+def make_etag(*parts):
+    return hashlib.md5('|'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def canonical_query(request):
+    return '&'.join(f'{key}={value}' for key, values in sorted(request.GET.lists()) for value in sorted(values))
+
+
+def api_response(data, status=200):
+    response = JsonResponse(data, status=status, json_dumps_params={'ensure_ascii': False})
+    if status == 200:
+        # Клиент может хранить ответ, но перед использованием сверяет ETag
+        patch_cache_control(response, public=True, max_age=getattr(settings, 'STORE_API_MAX_AGE', 0))
+    return response
+
+
+def api_errors(view):
+    """Ошибки API — JSON, а не HTML-страницы"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except FieldError as error:
+            return api_response({'error': str(error)}, status=400)
+        except Http404 as error:
+            return api_response({'error': str(error) or 'Не найдено'}, status=404)
+    return wrapper
+
+
+# Категории
+
+def categories_etag(request):
+    return make_etag('categories', canonical_query(request), get_version('catalogue'))
+
+
+@api_errors
+@require_safe
+@condition(etag_func=categories_etag)
+def category_list(request):
+    """Все категории"""
+    fields = select_fields(request, CATEGORY_FIELDS, CATEGORY_FIELDS)
+    rows = Category.objects.order_by('name').values(*columns(fields))
+    return api_response({'results': serialize(rows, fields)})
+
+
+# Товары
+
+# Параметры, не меняющие состав выборки
+PAGE_PARAMS = {'fields', 'cursor', 'limit', 'page', 'sort'}
+
+
+def _catalogue(request):
+    """
+    Выборка и агрегаты списка товаров; считаются один раз на запрос — для ETag и для ответа.
+
+    Агрегаты кешируются до следующего изменения каталога: повторный запрос
+    с If-None-Match обходится без обращения к базе.
+    """
+    if not hasattr(request, '_api_catalogue'):
+        query = CatalogueQuery(request, Category.objects.only('id', 'slug'))
+        products = query.filter(query.search(Product.objects.all()))
+        filters = '&'.join(f'{key}={sorted(values)}' for key, values in sorted(request.GET.lists()) if key not in PAGE_PARAMS)
+        key = 'store:api:stats:' + make_etag(filters, get_version('catalogue'))
+        cache = catalogue_cache()
+        stats = cache.get(key)
+        if stats is None:
+            stats = products.order_by().aggregate(count=Count('id'), last_modified=Max('updated_at'))
+            cache.set(key, stats, getattr(settings, 'STORE_PAGE_CACHE_TIMEOUT', 300))
+        request._api_catalogue = query, products, stats
+    return request._api_catalogue
+
+
+def products_etag(request):
+    try:
+        _, _, stats = _catalogue(request)
+    except Http404:
+        return None
+    return make_etag(
+        'products', canonical_query(request), stats['count'],
+        stats['last_modified'] and stats['last_modified'].isoformat(), get_version('catalogue'),
+    )
+
+
+@api_errors
+@require_safe
+@condition(etag_func=products_etag)
+def product_list(request):
+    """Товары с фильтрами и сортировками каталога, курсорная пагинация"""
+    fields = select_fields(request, PRODUCT_FIELDS, PRODUCT_LIST_FIELDS)
+    query, products, stats = _catalogue(request)
+    limit = page_size(request)
+    products = query.order(products)
+
+    if query.sort_by in SORT_KEYS:
+        ordering = SORT_KEYS[query.sort_by]
+        values = products.values(*dict.fromkeys([*columns(fields), *(name.lstrip('-') for name in ordering)]))
+        page = CursorPaginator(values, ordering, limit).page(request.GET.get('cursor'))
+        rows, links = page.object_list, {'next': page.next_cursor, 'previous': page.previous_cursor}
+    else:
+        # Релевантность поиска не даёт ключа для курсора — листаем номером страницы
+        try:
+            number = max(int(request.GET.get('page', 1)), 1)
+        except ValueError:
+            number = 1
+        rows = list(products.values(*columns(fields))[(number - 1) * limit:number * limit + 1])
+        links = {'next': number + 1 if len(rows) > limit else None, 'previous': number - 1 or None}
+        rows = rows[:limit]
+
+    return api_response({'count': stats['count'], **links, 'results': serialize(rows, fields)})
+
+
+def product_etag(request, slug):
+    row = Product.objects.filter(slug=slug).values_list('updated_at', 'category_id').first()
+    if row is None:
+        return None
+    updated_at, category_id = row
+    return make_etag('product', slug, canonical_query(request), updated_at.isoformat(), get_version('category', category_id))
+
+
+@api_errors
+@require_safe
+@condition(etag_func=product_etag)
+def product_detail(request, slug):
+    """Товар по slug"""
+    fields = select_fields(request, PRODUCT_FIELDS, PRODUCT_FIELDS)
+    row = Product.objects.filter(slug=slug).values(*columns(fields)).first()
+    if row is None:
+        raise Http404('Товар не найден')
+    return api_response(serialize([row], fields)[0])
+
+
+# Подсказки поиска
+
+@api_errors
+@require_safe
+def suggestions(request):
+    """Подсказки по началу слов: товары, категории и значения характеристик"""
+    query = request.GET.get('q', '')
+    try:
+        limit = min(max(int(request.GET.get('limit', 8)), 1), MAX_LIMIT)
+    except ValueError:
+        limit = 8
+    return api_response({'query': query, 'results': suggest(query, limit) if query.strip() else []})
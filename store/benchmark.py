@@ -0,0 +1,273 @@
+"""
+Сквозной бенчмарк представлений магазина.
+
+Каждый сценарий — один запрос к представлению через тестовый клиент Django,
+то есть через весь стек middleware. Подготовка (наполнение корзины, новый
+товар для удаления) выполняется до замера. Для каждого сценария считаются
+перцентили времени ответа, число SQL-запросов и выделения памяти: память
+меряется отдельным проходом под tracemalloc, чтобы трассировка не искажала
+время.
+
+Результаты сохраняются в JSON и сравниваются с сохранённой базовой линией:
+регрессией считается рост p50 или p95 больше чем на порог (и не меньше
+min_delta_ms, чтобы не реагировать на шум быстрых запросов) и любой
+рост числа запросов.
+"""
+import gc
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+from contextlib import ExitStack
+
+import django
+from django.conf import settings
+from django.db import connections
+from django.test import Client
+from django.urls import reverse
+
+from .caching import VERSION_PREFIX, catalogue_cache, get_version
+from .carts import SESSION_KEY
+from .instrumentation import RequestRecord, _percentile
+from .models import Cart, Product, Stock
+from .synthetic import PREFIX, generate_dataset
+
+
+CUSTOMER = {
+    'first_name': 'Бенчмарк',
+    'last_name': 'Представлений',
+    'email': 'benchmark@example.com',
+    'phone': '+70000000000',
+    'address': '—',
+}
+
+
+class Scenario:
+    """Запрос к представлению; setup выполняется перед каждым запросом и не замеряется"""
+
+    def __init__(self, name, request, setup=None):
+        self.name = name
+        self.request = request
+        self.setup = setup
+
+
+def _post_json(client, path, data):
+    return client.post(path, json.dumps(data), content_type='application/json')
+
+
+def _add(client, product_id, quantity=1):
+    return _post_json(client, reverse('store:add_to_cart'), {'product_id': product_id, 'quantity': quantity})
+
+
+def _cart(client):
+    return Cart.objects.get(pk=client.session[SESSION_KEY])
+
+
+class Fixtures:
+    """Данные, на которые ссылаются сценарии"""
+
+    def __init__(self):
+        # Товары без учёта остатка: бесконечные добавления в корзину не упираются в склад
+        untracked = Product.objects.filter(
+            slug__startswith=PREFIX, availability='available',
+        ).exclude(pk__in=Stock.objects.values('product')).order_by('id')
+        self.products = list(untracked.values_list('id', flat=True)[:20])
+        product = untracked.select_related('category').first()
+        self.product_slug = product.slug
+        self.category_slug = product.category.slug
+        self.search_query = ' '.join(product.name.split()[:2])
+
+        self.cart_client = Client()
+        for product_id in self.products[:3]:
+            _add(self.cart_client, product_id)
+        self.order_client = Client()
+        _add(self.order_client, self.products[0])
+        response = self.order_client.post(reverse('store:checkout'), CUSTOMER)
+        self.order_id = int(response.url.rstrip('/').rsplit('/', 1)[1])
+        self.item_client = Client()
+        _add(self.item_client, self.products[0])
+        self.item_id = _cart(self.item_client).items.get().id
+        self.quantity = 1
+
+
+def build_scenarios(fixtures):
+    f = fixtures
+    product_list = reverse('store:product_list')
+
+    def toggle_quantity(client):
+        f.quantity = 3 - f.quantity
+        return _post_json(client, reverse('store:update_cart_item'), {'item_id': f.item_id, 'quantity': f.quantity})
+
+    def batch_quantities(client):
+        f.batch_quantity = 3 - getattr(f, 'batch_quantity', 1)
+        return _post_json(client, reverse('store:cart_batch'), {'operations': [
+            {'op': 'set', 'product_id': product_id, 'quantity': f.batch_quantity} for product_id in f.products[6:10]
+        ]})
+
+    def add_removable(client):
+        _add(f.cart_client, f.products[5])
+        f.removable = _cart(f.cart_client).items.get(product_id=f.products[5]).id
+
+    def fill_checkout(client):
+        f.checkout_client = Client()
+        _add(f.checkout_client, f.products[1])
+        _add(f.checkout_client, f.products[2], 2)
+
+    return [
+        Scenario('home', lambda c: c.get(reverse('store:home'))),
+        Scenario('product_list', lambda c: c.get(product_list)),
+        Scenario('product_list:page', lambda c: c.get(product_list, {'sort': 'price_asc', 'page': 3})),
+        Scenario('product_list:facets', lambda c: c.get(product_list, {'category': f.category_slug, 'price': 2})),
+        Scenario('product_list:search', lambda c: c.get(product_list, {'search': f.search_query})),
+        Scenario('product_list:json', lambda c: c.get(product_list, {'format': 'json'})),
+        Scenario('product_detail', lambda c: c.get(reverse('store:product_detail', args=[f.product_slug]))),
+        Scenario('category_detail', lambda c: c.get(reverse('store:category_detail', args=[f.category_slug]))),
+        Scenario('cart', lambda c: f.cart_client.get(reverse('store:cart'))),
+        Scenario('add_to_cart', lambda c: _add(f.cart_client, f.products[4])),
+        Scenario('update_cart_item', lambda c: toggle_quantity(f.item_client)),
+        Scenario('cart_batch', lambda c: batch_quantities(f.item_client)),
+        Scenario(
+            'remove_from_cart',
+            lambda c: f.cart_client.get(reverse('store:remove_from_cart', args=[f.removable])),
+            setup=add_removable,
+        ),
+        Scenario('checkout', lambda c: f.cart_client.get(reverse('store:checkout'))),
+        Scenario(
+            'checkout:submit',
+            lambda c: f.checkout_client.post(reverse('store:checkout'), CUSTOMER),
+            setup=fill_checkout,
+        ),
+        Scenario('order_success', lambda c: f.order_client.get(reverse('store:order_success', args=[f.order_id]))),
+    ]
+
+
+def seed_dataset(products, orders, seed):
+    generate_dataset(categories=12, products=products, carts=100, orders=orders, seed=seed)
+    return Fixtures()
+
+
+class Measurement:
+    """Замеры одного сценария, накопленные за несколько раундов"""
+
+    def __init__(self, scenario, cold=False):
+        self.scenario = scenario
+        self.cold = cold
+        self.client = Client()
+        self.timings, self.queries, self.statuses = [], [], set()
+        self.peaks, self.retained = [], []
+
+    def prepare(self):
+        if self.scenario.setup:
+            self.scenario.setup(self.client)
+        if self.cold:
+            # Версия каталога переживает очистку: иначе каждый запрос пересобирал бы снимок каталога
+            version = get_version('catalogue')
+            catalogue_cache().clear()
+            catalogue_cache().set(VERSION_PREFIX + 'catalogue', version, None)
+
+    def warm_up(self, count):
+        for _ in range(count):
+            self.prepare()
+            self.scenario.request(self.client)
+
+    def measure(self, count):
+        for _ in range(count):
+            self.prepare()
+            record = RequestRecord()
+            # Сборка мусора посреди запроса — главный источник разброса между прогонами
+            gc.collect()
+            gc.disable()
+            try:
+                with ExitStack() as stack:
+                    for connection in connections.all():
+                        stack.enter_context(connection.execute_wrapper(record))
+                    started = time.perf_counter()
+                    response = self.scenario.request(self.client)
+                    self.timings.append((time.perf_counter() - started) * 1000)
+            finally:
+                gc.enable()
+            self.queries.append(record.queries)
+            self.statuses.add(response.status_code)
+
+    def measure_allocations(self, count):
+        tracemalloc.start()
+        try:
+            for _ in range(count):
+                self.prepare()
+                before, _ = tracemalloc.get_traced_memory()
+                tracemalloc.reset_peak()
+                self.scenario.request(self.client)
+                current, peak = tracemalloc.get_traced_memory()
+                self.peaks.append(peak - before)
+                self.retained.append(current - before)
+        finally:
+            tracemalloc.stop()
+
+    def result(self):
+        timings = sorted(self.timings)
+        result = {
+            'requests': len(timings),
+            'status': sorted(self.statuses),
+            'mean_ms': round(statistics.fmean(timings), 3),
+            'p50_ms': round(_percentile(timings, 50), 3),
+            'p95_ms': round(_percentile(timings, 95), 3),
+            'p99_ms': round(_percentile(timings, 99), 3),
+            'max_ms': round(timings[-1], 3),
+            'queries': statistics.median_low(self.queries),
+            'max_queries': max(self.queries),
+        }
+        if self.peaks:
+            result['alloc_peak_kib'] = round(statistics.median(self.peaks) / 1024, 1)
+            result['alloc_retained_kib'] = round(statistics.median(self.retained) / 1024, 1)
+        return result
+
+
+def run_benchmark(scenarios, iterations=50, warmup=5, alloc_iterations=5, cold=False, rounds=5):
+    """
+    Прогнать сценарии и вернуть результаты по имени сценария.
+
+    Замеры чередуются по раундам: медленный дрейф машины (соседние процессы,
+    троттлинг) распределяется по всем сценариям, а не достаётся одному.
+    """
+    measurements = [Measurement(scenario, cold) for scenario in scenarios]
+    for measurement in measurements:
+        measurement.warm_up(warmup)
+    rounds = max(min(rounds, iterations), 1)
+    for index in range(rounds):
+        count = iterations // rounds + (index < iterations % rounds)
+        for measurement in measurements:
+            measurement.measure(count)
+    for measurement in measurements:
+        measurement.measure_allocations(alloc_iterations)
+    return {measurement.scenario.name: measurement.result() for measurement in measurements}
+
+
+def environment(**extra):
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connections['default'].vendor,
+        'debug': settings.DEBUG,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        **extra,
+    }
+
+
+def compare(results, baseline, threshold=0.25, min_delta_ms=2.0):
+    """Регрессии относительно базовой линии: список строк с описанием"""
+    regressions = []
+    for name, current in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if previous is None:
+            continue
+        for metric in ('p50_ms', 'p95_ms'):
+            delta = current[metric] - previous[metric]
+            if delta > min_delta_ms and current[metric] > previous[metric] * (1 + threshold):
+                regressions.append(
+                    f'{name}: {metric} {previous[metric]:.2f} -> {current[metric]:.2f} '
+                    f'(+{delta / previous[metric]:.0%})'
+                )
+        if current['queries'] > previous['queries']:
+            regressions.append(f"{name}: queries {previous['queries']} -> {current['queries']}")
+    return regressions
@@ -0,0 +1,205 @@
+"""
+Кеширование страниц и фрагментов каталога.
+
+Фрагменты (карточки товаров, блок рекомендуемых товаров, карточка товара на
+детальной странице) кешируются встроенным тегом {% cache %} в отдельном кеше
+STORE_CATALOGUE_CACHE_ALIAS. Ключи включают язык и версию объекта: updated_at
+товара и счётчики версий категории и каталога, которые увеличиваются сигналами
+post_save/post_delete. Устаревшие записи не удаляются, а перестают
+запрашиваться и вытесняются по TTL.
+
+Бэкенды кеша считают попадания и промахи по группам ключей, чтобы подбирать TTL.
+"""
+import hashlib
+import threading
+import time
+from collections import defaultdict
+from functools import partial, wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import HttpResponse
+
+
+VERSION_PREFIX = 'store:version:'
+PAGE_PREFIX = 'store:page:'
+FRAGMENT_PREFIX = 'template.cache.'
+
+_missing = object()
+
+
+def cache_alias():
+    return getattr(settings, 'STORE_CATALOGUE_CACHE_ALIAS', 'catalogue')
+
+
+def catalogue_cache():
+    return caches[cache_alias()]
+
+
+# Счётчик попаданий
+
+class CacheStats:
+    """Попадания и промахи по группам ключей"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = defaultdict(lambda: [0, 0])
+
+    def record(self, key, hit):
+        group = key_group(key)
+        with self._lock:
+            self._counts[group][0 if hit else 1] += 1
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+    def snapshot(self):
+        with self._lock:
+            counts = {group: tuple(values) for group, values in self._counts.items()}
+        return {
+            group: {
+                'hits': hits,
+                'misses': misses,
+                'hit_ratio': round(hits / (hits + misses), 3) if hits + misses else None,
+            }
+            for group, (hits, misses) in sorted(counts.items())
+        }
+
+
+def key_group(key):
+    """Группа ключа: имя фрагмента для {% cache %}, иначе префикс до последнего двоеточия"""
+    if key.startswith(FRAGMENT_PREFIX):
+        return 'fragment:' + key[len(FRAGMENT_PREFIX):].split('.', 1)[0]
+    if key.startswith(VERSION_PREFIX):
+        return 'version'
+    if key.startswith(PAGE_PREFIX):
+        return 'page'
+    return key.rsplit(':', 1)[0]
+
+
+stats = CacheStats()
+
+
+class CountingCacheMixin:
+    """Считает попадания и промахи get() в общем CacheStats"""
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _missing, version)
+        stats.record(key, value is not _missing)
+        return default if value is _missing else value
+
+
+class CountingLocMemCache(CountingCacheMixin, LocMemCache):
+    pass
+
+
+class CountingFileBasedCache(CountingCacheMixin, FileBasedCache):
+    pass
+
+
+# Версии
+
+def get_version(*parts):
+    """Текущая версия сущности; начальное значение — время, чтобы не повторять старые ключи"""
+    cache = catalogue_cache()
+    key = VERSION_PREFIX + ':'.join(str(part) for part in parts)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(*parts):
+    cache = catalogue_cache()
+    key = VERSION_PREFIX + ':'.join(str(part) for part in parts)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+class VersionedObject:
+    """
+    Объект в памяти процесса, построенный по данным сущности версии parts.
+
+    Пересобирается, когда версия меняется или истекает max_age_setting секунд.
+    Новый объект собирается рядом со старым и подменяет его одним
+    присваиванием: первую сборку ждут все потоки, а пока идёт пересборка,
+    остальные потоки получают предыдущий объект.
+    """
+
+    def __init__(self, build, *parts, max_age_setting=None):
+        self.build = build
+        self.parts = parts or ('catalogue',)
+        self.max_age_setting = max_age_setting
+        self.current = None
+        self.lock = threading.Lock()
+
+    def _is_stale(self, current, version):
+        if current is None or current[0] != version:
+            return True
+        max_age = getattr(settings, self.max_age_setting, None) if self.max_age_setting else None
+        return max_age is not None and time.monotonic() - current[1] > max_age
+
+    def get(self):
+        version = get_version(*self.parts)
+        current = self.current
+        if not self._is_stale(current, version):
+            return current[2]
+        if not self.lock.acquire(blocking=current is None):
+            return current[2]
+        try:
+            if self._is_stale(self.current, version):
+                self.current = (version, time.monotonic(), self.build())
+            return self.current[2]
+        finally:
+            self.lock.release()
+
+    def clear(self):
+        self.current = None
+
+
+# Кеширование страниц
+
+def cache_catalogue_page(view=None, *, scope=None):
+    """
+    Кешировать ответ GET-запроса анонимного посетителя до следующего изменения каталога.
+
+    Ключ включает полный путь с параметрами, язык, версию каталога и версии
+    сущностей, которые scope(request, *args, **kwargs) называет для страницы.
+    Ответы со всплывающими сообщениями не кешируются.
+    """
+    if view is None:
+        return partial(cache_catalogue_page, scope=scope)
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if (
+            request.method != 'GET'
+            or request.user.is_authenticated
+            or len(get_messages(request))
+        ):
+            return view(request, *args, **kwargs)
+
+        cache = catalogue_cache()
+        parts = [request.get_full_path(), getattr(request, 'LANGUAGE_CODE', ''), str(get_version('catalogue'))]
+        if scope is not None:
+            parts.extend(str(get_version(*entity)) for entity in scope(request, *args, **kwargs))
+        raw_key = '|'.join(parts)
+        key = PAGE_PREFIX + hashlib.md5(raw_key.encode()).hexdigest()
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200 and not response.streaming:
+            timeout = getattr(settings, 'STORE_PAGE_CACHE_TIMEOUT', 300)
+            cache.set(key, (response.content, response['Content-Type']), timeout)
+        return response
+    return wrapper
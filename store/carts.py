@@ -0,0 +1,520 @@
+"""
+Корзина текущего посетителя.
+
+Представления работают с корзиной через open_cart(request), который
+возвращает один из двух бэкендов с общим интерфейсом (total_items,
+total_price, items(), add(), update(), remove(), apply(), checkout()):
+
+* DatabaseCart — строки Cart/CartItem. Идентификатор корзины хранится в
+  сессии (SESSION_KEY), поэтому корзина находится одним запросом по первичному
+  ключу. Корзина создаётся только при первом добавлении товара: просмотр пустой
+  корзины не создаёт ни корзины, ни сессии.
+* SignedCookieCart — для анонимных посетителей при STORE_CART_BACKEND = 'cookie':
+  пары «товар: количество» хранятся в подписанной cookie, и корзина не пишет в
+  базу ничего, пока посетитель не оформит заказ или не войдёт. Резерв остатка
+  при добавлении не берётся — остаток только проверяется и списывается при
+  оформлении.
+
+При входе анонимная корзина (строки в базе или cookie) переходит пользователю
+или сливается с его корзиной (сигнал user_logged_in). Ключ сессии при входе
+меняется, поэтому после входа корзина находится только по сохранённому
+идентификатору.
+
+apply() выполняет пакет операций add/set/remove (см. parse_operations):
+операции сводятся к итоговому количеству каждого товара, и корзина приводится
+к нему одной транзакцией — bulk_create новых позиций, bulk_update изменённых и
+одно удаление.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.signing import BadSignature
+from django.db import transaction
+from django.http import Http404
+from django.utils import timezone
+
+from .models import Cart, CartItem, CheckoutError, InsufficientStock, Product, Stock
+
+
+SESSION_KEY = 'store_cart_id'
+COOKIE_SALT = 'store.cart'
+BATCH_OPERATIONS = ('add', 'set', 'remove')
+MAX_BATCH_OPERATIONS = 100
+
+
+def cart_backend():
+    return getattr(settings, 'STORE_CART_BACKEND', 'database')
+
+
+def open_cart(request):
+    """Корзина посетителя в бэкенде STORE_CART_BACKEND; пользователи всегда используют базу"""
+    cart = getattr(request, '_store_cart_backend', None)
+    if cart is None:
+        if cart_backend() == 'cookie' and not request.user.is_authenticated:
+            cart = cookie_cart(request)
+        else:
+            cart = DatabaseCart(request)
+        request._store_cart_backend = cart
+    return cart
+
+
+# Корзина в базе
+
+def get_cart(request, create=False):
+    """Строка Cart посетителя; None, если её нет и create=False"""
+    cart = getattr(request, '_store_cart', None)
+    if cart is None:
+        cart = _find_cart(request)
+        if cart is None and create:
+            cart = _create_cart(request)
+        request._store_cart = cart
+    return cart
+
+
+def _find_cart(request):
+    session = request.session
+    user = request.user if request.user.is_authenticated else None
+    cart_id = session.get(SESSION_KEY)
+    if cart_id:
+        cart = Cart.objects.filter(pk=cart_id, user=user).first()
+        if cart is not None:
+            return cart
+
+    if user is not None:
+        cart = Cart.objects.filter(user=user).order_by('pk').first()
+    elif session.session_key and SESSION_KEY not in session:
+        # Корзины, созданные до того, как идентификатор стал храниться в сессии
+        cart = Cart.objects.filter(session_key=session.session_key, user=None).first()
+    else:
+        return None
+    remember_cart(request, cart)
+    return cart
+
+
+def _create_cart(request):
+    if request.user.is_authenticated:
+        cart = Cart.objects.create(user=request.user)
+    else:
+        if not request.session.session_key:
+            request.session.create()
+        cart = Cart.objects.create(session_key=request.session.session_key)
+    remember_cart(request, cart)
+    return cart
+
+
+def remember_cart(request, cart):
+    """Сохранить идентификатор корзины в сессии; None запоминает, что корзины нет"""
+    cart_id = cart.pk if cart is not None else None
+    if request.session.get(SESSION_KEY, 0) != cart_id:
+        request.session[SESSION_KEY] = cart_id
+    request._store_cart = cart
+
+
+class DatabaseCart:
+    """Корзина в таблицах Cart и CartItem с резервированием остатка при добавлении"""
+
+    def __init__(self, request):
+        self.request = request
+
+    @property
+    def cart(self):
+        return get_cart(self.request)
+
+    @property
+    def total_items(self):
+        return self.cart.total_items if self.cart else 0
+
+    @property
+    def total_price(self):
+        return self.cart.total_price if self.cart else Decimal(0)
+
+    def items(self, images=True):
+        if self.cart is None:
+            return CartItem.objects.none()
+        if not images:
+            return self.cart.items.select_related('product').order_by('pk')
+        return self.cart.items.select_related('product__category').prefetch_related('product__renditions')
+
+    def add(self, product, quantity=1):
+        get_cart(self.request, create=True).add_product(product, quantity)
+
+    def _item(self, item_id):
+        if self.cart is None:
+            raise Http404
+        item = CartItem.objects.select_related('product').filter(id=item_id, cart=self.cart).first()
+        if item is None:
+            raise Http404
+        item.cart = self.cart
+        return item
+
+    def update(self, item_id, quantity):
+        """Изменить количество позиции (0 — удалить); стоимость позиции"""
+        item = self._item(item_id)
+        if quantity > 0:
+            item.quantity = quantity
+            item.save()
+            return item.total_price
+        item.delete()
+        return Decimal(0)
+
+    def remove(self, item_id):
+        """Удалить позицию; название товара"""
+        item = self._item(item_id)
+        item.delete()
+        return item.product.name
+
+    def apply(self, operations):
+        """Выполнить пакет операций одной транзакцией; при нехватке остатка не меняется ничего"""
+        products = _products_for(operations)
+        cart = self.cart or get_cart(self.request, create=any(quantity for _, _, quantity in operations))
+        if cart is None:
+            return
+        with transaction.atomic():
+            # Первый оператор транзакции — запись, чтобы SQLite сразу взял блокировку на запись
+            Cart.objects.filter(pk=cart.pk).update(updated_at=timezone.now())
+            items = {item.product_id: item for item in cart.items.filter(product_id__in=products)}
+            targets = resolve_quantities(operations, {pk: item.quantity for pk, item in items.items()})
+
+            new, changed, removed, deltas = [], [], [], {}
+            quantity_delta, amount_delta = 0, Decimal(0)
+            for product_id, quantity in targets.items():
+                product, item = products[product_id], items.get(product_id)
+                delta = quantity - (item.quantity if item else 0)
+                if not delta:
+                    continue
+                deltas[product_id] = delta
+                quantity_delta += delta
+                amount_delta += product.price * delta
+                if item is None:
+                    new.append(CartItem(cart=cart, product=product, quantity=quantity))
+                elif quantity:
+                    item.quantity = quantity
+                    changed.append(item)
+                else:
+                    removed.append(item.pk)
+            # Резервы всех товаров пакета — постоянным числом запросов
+            cart.reserve_stock_many(deltas, products)
+            CartItem.objects.bulk_create(new)
+            CartItem.objects.bulk_update(changed, ['quantity'])
+            CartItem.objects.filter(pk__in=removed).delete()
+            if quantity_delta or amount_delta:
+                cart.apply_delta(quantity_delta, amount_delta)
+
+    def checkout(self, user=None, **customer):
+        if self.cart is None:
+            raise CheckoutError('Ваша корзина пуста')
+        return self.cart.checkout(user=user, **customer)
+
+
+# Корзина в подписанной cookie
+
+class CookieCartItem:
+    """Позиция корзины из cookie; id совпадает с id товара"""
+
+    def __init__(self, product, quantity):
+        self.id = product.pk
+        self.product = product
+        self.quantity = quantity
+
+    @property
+    def total_price(self):
+        return self.product.price * self.quantity
+
+
+class SignedCookieCart:
+    """
+    Анонимная корзина в подписанной cookie: «id:количество» через запятую.
+
+    Чтение корзины — один запрос цен товаров, запись — только Set-Cookie в
+    ответе (CartCookieMiddleware). Подпись не даёт подменить содержимое, а цены
+    всегда берутся из базы.
+    """
+
+    def __init__(self, lines=None):
+        self.lines = dict(lines or {})
+        self.modified = False
+        self._products, self._full = None, False
+
+    @classmethod
+    def load(cls, request):
+        value = request.COOKIES.get(cookie_name())
+        if not value:
+            return cls()
+        try:
+            value = request.get_signed_cookie(cookie_name(), salt=COOKIE_SALT, max_age=cookie_age())
+            lines = {}
+            for pair in value.split(','):
+                product_id, quantity = pair.split(':')
+                if int(quantity) > 0:
+                    lines[int(product_id)] = int(quantity)
+        except (BadSignature, ValueError):
+            cart = cls()
+            cart.modified = True  # испорченная cookie будет удалена
+            return cart
+        return cls(lines)
+
+    def dumps(self):
+        return ','.join(f'{product_id}:{quantity}' for product_id, quantity in self.lines.items())
+
+    def save(self, response):
+        if self.lines:
+            response.set_signed_cookie(
+                cookie_name(), self.dumps(), salt=COOKIE_SALT, max_age=cookie_age(),
+                httponly=True, samesite='Lax', secure=settings.SESSION_COOKIE_SECURE,
+            )
+        else:
+            response.delete_cookie(cookie_name(), samesite='Lax')
+        self.modified = False
+
+    def _changed(self):
+        self.modified = True
+        self._products = None
+
+    def products(self, full=False):
+        """
+        Товары корзины одним запросом; удалённые из каталога товары пропадают из корзины.
+
+        Для итогов хватает цены и названия, full=True загружает всё для страницы корзины.
+        """
+        if self._products is None or (full and not self._full):
+            if full:
+                queryset = Product.objects.select_related('category').prefetch_related('renditions')
+            else:
+                queryset = Product.objects.only('id', 'name', 'price')
+            products = queryset.in_bulk(self.lines)
+            if len(products) != len(self.lines):
+                self.lines = {pk: quantity for pk, quantity in self.lines.items() if pk in products}
+                self.modified = True
+            self._products, self._full = products, full
+        return self._products
+
+    @property
+    def total_items(self):
+        return sum(self.lines.values())
+
+    @property
+    def total_price(self):
+        products = self.products()
+        return sum((products[pk].price * quantity for pk, quantity in self.lines.items()), Decimal(0))
+
+    def items(self, images=True):
+        products = self.products(full=images)
+        return [CookieCartItem(products[pk], quantity) for pk, quantity in self.lines.items()]
+
+    def _check_stock(self, product, quantity):
+        """Свободный остаток только проверяется: резерв берётся при оформлении"""
+        if getattr(product, 'stock_tracked', None) is False:
+            return
+        stock = Stock.objects.filter(product_id=product.pk).only('on_hand', 'reserved').first()
+        if stock is not None and stock.available < quantity:
+            raise InsufficientStock([product.name])
+
+    def add(self, product, quantity=1):
+        if product.pk not in self.lines and len(self.lines) >= getattr(settings, 'STORE_CART_COOKIE_MAX_LINES', 50):
+            raise CheckoutError('В корзине слишком много разных товаров')
+        quantity += self.lines.get(product.pk, 0)
+        self._check_stock(product, quantity)
+        self.lines[product.pk] = quantity
+        self._changed()
+
+    def update(self, item_id, quantity):
+        item_id = int(item_id)
+        if item_id not in self.lines:
+            raise Http404
+        if quantity <= 0:
+            self.remove(item_id)
+            return Decimal(0)
+        product = self.products()[item_id]
+        if quantity > self.lines[item_id]:
+            self._check_stock(product, quantity)
+        self.lines[item_id] = quantity
+        self._changed()
+        return product.price * quantity
+
+    def remove(self, item_id):
+        item_id = int(item_id)
+        if item_id not in self.lines:
+            raise Http404
+        name = self.products()[item_id].name
+        del self.lines[item_id]
+        self._changed()
+        return name
+
+    def apply(self, operations):
+        """Выполнить пакет операций; при нехватке остатка корзина не меняется"""
+        products = _products_for(operations)
+        targets = resolve_quantities(operations, self.lines)
+        added = [pk for pk, quantity in targets.items() if quantity and pk not in self.lines]
+        if added and len(self.lines) + len(added) > getattr(settings, 'STORE_CART_COOKIE_MAX_LINES', 50):
+            raise CheckoutError('В корзине слишком много разных товаров')
+        for product_id, quantity in targets.items():
+            if quantity > self.lines.get(product_id, 0):
+                self._check_stock(products[product_id], quantity)
+        for product_id, quantity in targets.items():
+            if quantity:
+                self.lines[product_id] = quantity
+            else:
+                self.lines.pop(product_id, None)
+        self._changed()
+
+    def clear(self):
+        if self.lines:
+            self.lines = {}
+            self._changed()
+
+    def materialize(self, cart):
+        """Перенести товары в корзину в базе; товары, которых не хватает на складе, пропускаются"""
+        products = Product.objects.only('id', 'name', 'price').in_bulk(self.lines)
+        with transaction.atomic():
+            for product_id, quantity in self.lines.items():
+                if product_id not in products:
+                    continue
+                try:
+                    with transaction.atomic():
+                        cart.add_product(products[product_id], quantity)
+                except InsufficientStock:
+                    continue
+        self.clear()
+
+    def checkout(self, user=None, **customer):
+        """Записать корзину в базу и оформить заказ одной транзакцией"""
+        products = Product.objects.only('id', 'price').in_bulk(self.lines)
+        lines = [(products[pk], quantity) for pk, quantity in self.lines.items() if pk in products]
+        if not lines:
+            raise CheckoutError('Ваша корзина пуста')
+        with transaction.atomic():
+            # Первый оператор транзакции — запись, как и в Cart.checkout
+            cart = Cart.objects.create(
+                items_count=sum(quantity for _, quantity in lines),
+                subtotal=sum((product.price * quantity for product, quantity in lines), Decimal(0)),
+            )
+            CartItem.objects.bulk_create([
+                CartItem(cart=cart, product=product, quantity=quantity) for product, quantity in lines
+            ])
+            order = cart.checkout(user=user, **customer)
+            Cart.objects.filter(pk=cart.pk).delete()
+        self.clear()
+        return order
+
+
+# Пакетные операции
+
+def parse_operations(operations):
+    """
+    Проверить операции пакетного изменения корзины и вернуть [(op, product_id, quantity)].
+
+    {"op": "add", "product_id": 1, "quantity": 2} прибавляет количество,
+    {"op": "set", ...} задаёт его (0 — удалить), {"op": "remove", "product_id": 1} удаляет товар.
+    """
+    if not isinstance(operations, list) or not 0 < len(operations) <= MAX_BATCH_OPERATIONS:
+        raise ValueError(f'Ожидается список из 1–{MAX_BATCH_OPERATIONS} операций')
+    parsed = []
+    for operation in operations:
+        op = operation.get('op') if isinstance(operation, dict) else None
+        if op not in BATCH_OPERATIONS:
+            raise ValueError(f'Неизвестная операция: {op}')
+        try:
+            product_id = int(operation['product_id'])
+            quantity = 0 if op == 'remove' else int(operation.get('quantity', 1))
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f'Неверные параметры операции {op}')
+        if quantity < 0 or (op == 'add' and not quantity):
+            raise ValueError(f'Неверное количество в операции {op}')
+        parsed.append((op, product_id, quantity))
+    return parsed
+
+
+def resolve_quantities(operations, current):
+    """Итоговое количество каждого затронутого товара по текущим количествам {product_id: quantity}"""
+    targets = {}
+    for op, product_id, quantity in operations:
+        if op == 'add':
+            quantity += targets.get(product_id, current.get(product_id, 0))
+        targets[product_id] = quantity
+    return targets
+
+
+def _products_for(operations):
+    product_ids = {product_id for _, product_id, _ in operations}
+    products = Product.objects.only('id', 'name', 'price').in_bulk(product_ids)
+    missing = product_ids - products.keys()
+    if missing:
+        raise ValueError('Товары не найдены: ' + ', '.join(str(pk) for pk in sorted(missing)))
+    return products
+
+
+def cart_json(cart):
+    """Корзина целиком для ответа JSON API"""
+    return {
+        'total_items': cart.total_items,
+        'total_price': float(cart.total_price),
+        'items': [
+            {
+                'id': item.id,
+                'product_id': item.product.pk,
+                'name': item.product.name,
+                'price': float(item.product.price),
+                'quantity': item.quantity,
+                'total': float(item.total_price),
+            }
+            for item in cart.items(images=False)
+        ],
+    }
+
+
+def cookie_name():
+    return getattr(settings, 'STORE_CART_COOKIE_NAME', 'store_cart')
+
+
+def cookie_age():
+    return getattr(settings, 'STORE_CART_COOKIE_AGE', 60 * 60 * 24 * 30)
+
+
+def cookie_cart(request):
+    """Корзина из cookie запроса; изменения запишет CartCookieMiddleware"""
+    cart = getattr(request, '_store_cart_cookie', None)
+    if cart is None:
+        cart = request._store_cart_cookie = SignedCookieCart.load(request)
+    return cart
+
+
+class CartCookieMiddleware:
+    """Записывает изменённую корзину из cookie в ответ"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        cart = getattr(request, '_store_cart_cookie', None)
+        if cart is not None and cart.modified:
+            cart.save(response)
+        return response
+
+
+# Вход
+
+def attach_cart_on_login(request, user):
+    """Передать анонимную корзину вошедшему пользователю или слить её с его корзиной"""
+    cart_id = request.session.get(SESSION_KEY)
+    anonymous = Cart.objects.filter(pk=cart_id, user=None).first() if cart_id else None
+    cart = Cart.objects.filter(user=user).order_by('pk').first()
+    if anonymous is not None and cart is None:
+        Cart.objects.filter(pk=anonymous.pk).update(user=user, session_key=None)
+        anonymous.user, anonymous.session_key = user, None
+        cart = anonymous
+    elif anonymous is not None:
+        cart.merge(anonymous)
+        cart.refresh_from_db(fields=['items_count', 'subtotal'])
+
+    if request.COOKIES.get(cookie_name()):
+        cookie = cookie_cart(request)
+        if cookie.lines:
+            if cart is None:
+                cart = Cart.objects.create(user=user)
+            cookie.materialize(cart)
+        else:
+            cookie.modified = True
+    remember_cart(request, cart)
+    # Дальше в этом запросе посетитель уже пользователь и работает с корзиной в базе
+    request.__dict__.pop('_store_cart_backend', None)
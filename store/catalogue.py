@@ -0,0 +1,46 @@
+"""
+Фильтры, поиск и сортировка списка товаров по GET-параметрам.
+
+Общие для HTML-каталога (views.product_list) и JSON API (store.api), чтобы
+оба отвечали на одни и те же параметры одинаково.
+"""
+from django.http import Http404
+
+from .facets import FacetSelection
+from .pagination import SORT_KEYS
+from .search import get_search_backend
+
+
+class CatalogueQuery:
+    """Параметры списка товаров: category, availability, price, spec, search и sort"""
+
+    def __init__(self, request, categories, default_sort='name'):
+        self.selection = FacetSelection.from_request(request)
+        self.category_ids = []
+        if self.selection.categories:
+            self.category_ids = [category.id for category in categories if category.slug in self.selection.categories]
+            if not self.category_ids:
+                raise Http404('Категория не найдена')
+
+        self.search_query = request.GET.get('search')
+        sort_by = request.GET.get('sort', 'relevance' if self.search_query else default_sort)
+        if not (sort_by == 'relevance' and self.search_query) and sort_by not in SORT_KEYS:
+            sort_by = default_sort
+        self.sort_by = sort_by
+
+    def search(self, products):
+        """Только поиск — по этой выборке считаются фасеты"""
+        if not self.search_query:
+            return products
+        return get_search_backend().filter(products, self.search_query)
+
+    def filter(self, products):
+        return self.selection.filter(products, self.category_ids)
+
+    def order(self, products):
+        if self.sort_by == 'relevance':
+            return products.order_by('search_rank', 'name')
+        return products.order_by(*SORT_KEYS[self.sort_by])
+
+    def apply(self, products):
+        return self.order(self.filter(self.search(products)))
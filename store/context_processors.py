@@ -0,0 +1,12 @@
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+from .caching import get_version
+
+
+def catalogue_cache(request):
+    """TTL фрагментов и версия каталога для тега {% cache %}"""
+    return {
+        'fragment_timeout': getattr(settings, 'STORE_FRAGMENT_CACHE_TIMEOUT', 600),
+        'catalogue_version': SimpleLazyObject(lambda: get_version('catalogue')),
+    }
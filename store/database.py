@@ -0,0 +1,82 @@
+"""
+Настройка соединений SQLite и маршрутизация чтения каталога.
+
+При открытии каждого соединения SQLite выполняются PRAGMA из
+STORE_SQLITE_PRAGMAS, которые действуют только на это соединение:
+synchronous=NORMAL (в режиме WAL не теряет целостность, fsync только на
+контрольных точках), кеш страниц, mmap и busy_timeout — писатель ждёт
+освобождения блокировки, а не получает сразу «database is locked».
+Соединения живут CONN_MAX_AGE секунд, поэтому PRAGMA выполняются один раз на
+соединение, а не на запрос.
+
+Режим журнала (WAL: читатели не ждут писателя и наоборот) сохраняется в самом
+файле базы, поэтому он включается один раз командой set_journal_mode, а не при
+каждом соединении: иначе любой manage.py переписывал бы файл базы.
+
+ReadWriteRouter отправляет чтение моделей каталога в отдельное соединение
+STORE_DATABASE_READ_ALIAS (тот же файл, только чтение), а запись и всё
+остальное — в default. Внутри транзакции default чтение тоже идёт в default,
+чтобы видеть собственные незакоммиченные изменения.
+"""
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+
+
+# Модели, которые только читаются посетителями: корзины, заказы, остатки и сессии пишутся в default
+READ_MODELS = {
+    'category', 'product', 'facetcount', 'imagerendition', 'recommendation', 'copurchase',
+    'dailysales', 'dailyproductsales', 'dailycarts',
+}
+# PRAGMA, которые записываются в файл базы: при открытии соединения не выполняются
+PERSISTENT_PRAGMAS = {'journal_mode', 'page_size', 'auto_vacuum', 'user_version', 'application_id'}
+
+
+def read_alias():
+    alias = getattr(settings, 'STORE_DATABASE_READ_ALIAS', None)
+    return alias if alias in connections else None
+
+
+def apply_pragmas(sender, connection, **kwargs):
+    """Выполнить STORE_SQLITE_PRAGMAS на новом соединении SQLite"""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = {
+        name: value for name, value in getattr(settings, 'STORE_SQLITE_PRAGMAS', {}).items()
+        if name not in PERSISTENT_PRAGMAS
+    }
+    if connection.alias == read_alias():
+        pragmas['query_only'] = 'on'
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+connection_created.connect(apply_pragmas, dispatch_uid='store.database.apply_pragmas')
+
+
+class ReadWriteRouter:
+    """Чтение моделей каталога — из STORE_DATABASE_READ_ALIAS, запись — в default"""
+
+    def db_for_read(self, model, **hints):
+        alias = read_alias()
+        if alias is None or model._meta.app_label != 'store' or model._meta.model_name not in READ_MODELS:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Обе базы — один и тот же файл
+        databases = {DEFAULT_DB_ALIAS, read_alias()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == read_alias():
+            return False
+        return None
@@ -0,0 +1,116 @@
+"""
+Потоковая выгрузка заказов с позициями в CSV и JSON Lines.
+
+Заказы читаются одним запросом с LEFT JOIN позиций и товаров через
+.iterator(): строки приходят из курсора пачками по chunk_size и сразу
+превращаются в текст, поэтому память не зависит от размера истории. Заказ без
+позиций даёт одну строку с пустыми полями позиции. Строки упорядочены по
+заказу, и для JSON Lines заказ собирается из соседних строк — в памяти
+держится только один заказ.
+"""
+import csv
+from datetime import datetime, time, timedelta
+from itertools import groupby
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Order
+
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+ORDER_COLUMNS = (
+    ('order_id', 'id'),
+    ('created_at', 'created_at'),
+    ('status', 'status'),
+    ('first_name', 'first_name'),
+    ('last_name', 'last_name'),
+    ('email', 'email'),
+    ('phone', 'phone'),
+    ('address', 'address'),
+    ('total_amount', 'total_amount'),
+)
+ITEM_COLUMNS = (
+    ('item_id', 'items__id'),
+    ('product_id', 'items__product_id'),
+    ('product_name', 'items__product__name'),
+    ('price', 'items__price'),
+    ('quantity', 'items__quantity'),
+)
+ORDER_SIZE = len(ORDER_COLUMNS)
+STATUSES = [status for status, _ in Order.STATUS_CHOICES]
+
+
+def parse_day(value):
+    """Дата YYYY-MM-DD или None; ValueError для неверной даты"""
+    if not value:
+        return None
+    day = parse_date(value)
+    if day is None:
+        raise ValueError(f'Неверная дата: {value}')
+    return day
+
+
+def order_items(start=None, end=None, statuses=None, chunk_size=2000):
+    """
+    Кортежи ORDER_COLUMNS + ITEM_COLUMNS по позициям заказов, упорядоченные по заказу.
+
+    start и end — даты включительно в текущем часовом поясе. У заказа без
+    позиций одна строка, где ITEM_COLUMNS равны None.
+    """
+    orders = Order.objects.all()
+    if start:
+        orders = orders.filter(created_at__gte=timezone.make_aware(datetime.combine(start, time.min)))
+    if end:
+        orders = orders.filter(created_at__lt=timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min)))
+    if statuses:
+        orders = orders.filter(status__in=statuses)
+    fields = [field for _, field in ORDER_COLUMNS + ITEM_COLUMNS]
+    return orders.order_by('id', 'items__id').values_list(*fields).iterator(chunk_size=chunk_size)
+
+
+class _Echo:
+    """Файлоподобный объект для csv.writer: write() возвращает строку, а не пишет её"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    """Строка CSV на каждую позицию с данными заказа; у заказа без позиций поля позиции пусты"""
+    writer = csv.writer(_Echo())
+    yield writer.writerow([name for name, _ in ORDER_COLUMNS + ITEM_COLUMNS])
+    for row in rows:
+        yield writer.writerow(
+            value.isoformat() if isinstance(value, datetime) else value for value in row
+        )
+
+
+def jsonl_lines(rows):
+    """Строка JSON на каждый заказ с вложенным списком позиций"""
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for _, order_rows in groupby(rows, key=lambda row: row[0]):
+        first = next(order_rows)
+        order = {name: value for (name, _), value in zip(ORDER_COLUMNS, first)}
+        order['id'] = order.pop('order_id')
+        order['items'] = [
+            {name: value for (name, _), value in zip(ITEM_COLUMNS, row[ORDER_SIZE:])}
+            for row in (first, *order_rows) if row[ORDER_SIZE] is not None
+        ]
+        yield encoder.encode(order) + '\n'
+
+
+def export_lines(export_format, **filters):
+    """Генератор строк выгрузки в формате export_format ('csv' или 'jsonl')"""
+    rows = order_items(**filters)
+    return csv_lines(rows) if export_format == 'csv' else jsonl_lines(rows)
+
+
+def export_filename(export_format, start=None, end=None):
+    period = '-'.join(day.isoformat() for day in (start, end) if day) or 'all'
+    return f'orders-{period}.{export_format}'
@@ -0,0 +1,312 @@
+"""
+Фасетная навигация по каталогу.
+
+Количество товаров по фасетам берётся из таблицы FacetCount — предрасчитанного
+«куба» комбинаций (категория, наличие, ценовой диапазон, выбранные
+характеристики). Таблица обновляется сигналами при сохранении и удалении
+товаров, а при поиске тот же куб строится одним GROUP BY по найденным товарам.
+"""
+import hashlib
+import json
+from bisect import bisect_right
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, CharField, Count, F, IntegerField, Q, Value, When
+from django.db.models.fields.json import KeyTextTransform
+from django.db.models.functions import Cast
+
+
+CUBE_CACHE_KEY = 'store:facets:cube'
+
+
+def specification_keys():
+    return list(getattr(settings, 'STORE_FACET_SPECIFICATIONS', []))
+
+
+def price_bounds():
+    return list(getattr(settings, 'STORE_PRICE_BUCKETS', [0]))
+
+
+def price_bucket(price):
+    """Номер ценового диапазона для цены"""
+    return max(bisect_right(price_bounds(), price) - 1, 0)
+
+
+def price_bucket_label(bucket):
+    bounds = price_bounds()
+    low = bounds[bucket]
+    if bucket + 1 >= len(bounds):
+        return f'от {low:,} ₽'.replace(',', ' ')
+    high = bounds[bucket + 1]
+    if not low:
+        return f'до {high:,} ₽'.replace(',', ' ')
+    return f'{low:,} – {high:,} ₽'.replace(',', ' ')
+
+
+def facet_key(category_id, availability, price, specifications):
+    """Кортеж значений фасетов для одного товара"""
+    specifications = specifications if isinstance(specifications, dict) else {}
+    return (
+        category_id,
+        availability,
+        price_bucket(price),
+        tuple(_spec_value(specifications.get(key)) for key in specification_keys()),
+    )
+
+
+def _spec_expression(key):
+    # Cast убирает JSON-семантику у lookup'ов: сравниваем значения как обычные строки
+    return Cast(KeyTextTransform(key, 'specifications'), CharField())
+
+
+def _spec_value(value):
+    return '' if value is None else str(value)
+
+
+def signature(key):
+    return hashlib.sha1(json.dumps(key, ensure_ascii=False).encode()).hexdigest()
+
+
+# Обслуживание таблицы FacetCount
+
+def adjust_facet_count(facet_model, key, delta):
+    """Прибавить delta к счётчику комбинации, создав строку при необходимости"""
+    sig = signature(key)
+    cache.delete(CUBE_CACHE_KEY)
+    if delta < 0:
+        facet_model.objects.filter(signature=sig).update(count=F('count') + delta)
+        return
+    category_id, availability, bucket, spec_values = key
+    # INSERT ... ON CONFLICT: одновременные сигналы для новой комбинации не сталкиваются на signature
+    facet_model.objects.add({(sig,): {
+        'category': category_id,
+        'availability': availability,
+        'price_bucket': bucket,
+        'specifications': dict(zip(specification_keys(), spec_values)),
+        'count': delta,
+    }})
+
+
+def rebuild_facet_counts(product_queryset, facet_model, chunk_size=5000):
+    """Пересчитать таблицу фасетов с нуля за один проход по товарам"""
+    counts = defaultdict(int)
+    rows = product_queryset.values_list(
+        'category_id', 'availability', 'price', 'specifications'
+    ).order_by().iterator(chunk_size=chunk_size)
+    for row in rows:
+        counts[facet_key(*row)] += 1
+
+    facet_model.objects.all().delete()
+    facet_model.objects.bulk_create([
+        facet_model(
+            signature=signature(key),
+            category_id=key[0],
+            availability=key[1],
+            price_bucket=key[2],
+            specifications=dict(zip(specification_keys(), key[3])),
+            count=count,
+        )
+        for key, count in counts.items()
+    ], batch_size=1000)
+    cache.delete(CUBE_CACHE_KEY)
+    return len(counts)
+
+
+# Выбор пользователя и фильтрация
+
+class FacetSelection:
+    """Выбранные значения фасетов из GET-параметров"""
+
+    def __init__(self, categories=(), availability=(), price=(), specifications=None):
+        self.categories = set(categories)
+        self.availability = set(availability)
+        self.price = set(price)
+        self.specifications = specifications or {}
+
+    @classmethod
+    def from_request(cls, request):
+        price = {int(value) for value in request.GET.getlist('price') if value.isdigit()}
+        specifications = defaultdict(set)
+        keys = specification_keys()
+        # Характеристики передаются как spec=<ключ>:<значение>
+        for raw in request.GET.getlist('spec'):
+            key, _, value = raw.partition(':')
+            if key in keys and value:
+                specifications[key].add(value)
+        return cls(
+            categories=[slug for slug in request.GET.getlist('category') if slug],
+            availability=[value for value in request.GET.getlist('availability') if value],
+            price=price,
+            specifications=dict(specifications),
+        )
+
+    def filter(self, queryset, category_ids=None):
+        """Применить выбор к queryset товаров"""
+        if category_ids is not None and self.categories:
+            queryset = queryset.filter(category_id__in=category_ids)
+        if self.availability:
+            queryset = queryset.filter(availability__in=self.availability)
+        if self.price:
+            bounds = price_bounds()
+            condition = Q()
+            for bucket in self.price:
+                if bucket >= len(bounds):
+                    continue
+                bucket_q = Q(price__gte=bounds[bucket])
+                if bucket + 1 < len(bounds):
+                    bucket_q &= Q(price__lt=bounds[bucket + 1])
+                condition |= bucket_q
+            queryset = queryset.filter(condition) if condition else queryset.none()
+        for key, values in self.specifications.items():
+            alias = f'facet_spec_{specification_keys().index(key)}'
+            queryset = queryset.alias(
+                **{alias: _spec_expression(key)}
+            ).filter(**{f'{alias}__in': values})
+        return queryset
+
+
+# Подсчёт
+
+def cube_from_table(facet_model):
+    """
+    Строки куба из предрасчитанной таблицы.
+
+    Разобранный куб кешируется на STORE_FACET_CACHE_TIMEOUT секунд; локальные
+    изменения счётчиков сбрасывают кеш сразу, другие процессы увидят их по таймауту.
+    """
+    timeout = getattr(settings, 'STORE_FACET_CACHE_TIMEOUT', 5)
+    return cache.get_or_set(CUBE_CACHE_KEY, lambda: _load_cube(facet_model), timeout)
+
+
+def _load_cube(facet_model):
+    keys = specification_keys()
+    rows = facet_model.objects.filter(count__gt=0).values_list(
+        'category_id', 'availability', 'price_bucket', 'specifications', 'count'
+    )
+    return [
+        (category_id, availability, bucket, tuple(_spec_value(specs.get(key)) for key in keys), count)
+        for category_id, availability, bucket, specs, count in rows
+    ]
+
+
+def cube_from_queryset(queryset):
+    """Строки куба одним агрегирующим запросом по произвольной выборке товаров"""
+    keys = specification_keys()
+    bounds = price_bounds()
+    bucket_expression = Case(
+        *[When(price__lt=bounds[i + 1], then=Value(i)) for i in range(len(bounds) - 1)],
+        default=Value(len(bounds) - 1),
+        output_field=IntegerField(),
+    )
+    spec_aliases = {f'facet_spec_{i}': _spec_expression(key) for i, key in enumerate(keys)}
+    rows = queryset.order_by().annotate(
+        facet_bucket=bucket_expression, **spec_aliases
+    ).values(
+        'category_id', 'availability', 'facet_bucket', *spec_aliases
+    ).annotate(facet_count=Count('id'))
+    return [
+        (
+            row['category_id'],
+            row['availability'],
+            row['facet_bucket'],
+            tuple(_spec_value(row[alias]) for alias in spec_aliases),
+            row['facet_count'],
+        )
+        for row in rows
+    ]
+
+
+def compute_facets(cube, selection, categories, availability_choices):
+    """
+    Посчитать значения всех фасетов по строкам куба.
+
+    Для каждого фасета учитываются ограничения всех остальных фасетов, но не его
+    собственные, чтобы можно было выбрать несколько значений внутри одного фасета.
+    """
+    keys = specification_keys()
+    category_slugs = {category.id: category.slug for category in categories}
+    selected_category_ids = {pk for pk, slug in category_slugs.items() if slug in selection.categories}
+
+    checks = {
+        'category': lambda row: not selection.categories or row[0] in selected_category_ids,
+        'availability': lambda row: not selection.availability or row[1] in selection.availability,
+        'price': lambda row: not selection.price or row[2] in selection.price,
+    }
+    for index, key in enumerate(keys):
+        checks[key] = _specification_check(index, selection.specifications.get(key))
+
+    counts = {name: defaultdict(int) for name in checks}
+    for row in cube:
+        passed = {name for name, check in checks.items() if check(row)}
+        for name in checks:
+            # Строка учитывается в фасете, если она проходит все остальные фасеты
+            if len(passed) == len(checks) or (len(passed) == len(checks) - 1 and name not in passed):
+                value = _row_value(row, name, keys)
+                if value != '':
+                    counts[name][value] += row[4]
+
+    facets = [
+        {
+            'name': 'category',
+            'label': 'Категория',
+            'param': 'category',
+            'values': [
+                _facet_value(category.slug, category.name, counts['category'].get(category.id, 0),
+                             category.slug in selection.categories)
+                for category in categories
+            ],
+        },
+        {
+            'name': 'availability',
+            'label': 'Наличие',
+            'param': 'availability',
+            'values': [
+                _facet_value(value, label, counts['availability'].get(value, 0),
+                             value in selection.availability)
+                for value, label in availability_choices
+            ],
+        },
+        {
+            'name': 'price',
+            'label': 'Цена',
+            'param': 'price',
+            'values': [
+                _facet_value(bucket, price_bucket_label(bucket), counts['price'].get(bucket, 0),
+                             bucket in selection.price)
+                for bucket in range(len(price_bounds()))
+            ],
+        },
+    ]
+    for key in keys:
+        selected = selection.specifications.get(key, set())
+        values = sorted(set(counts[key]) | selected)
+        facets.append({
+            'name': key,
+            'label': key,
+            'param': 'spec',
+            'values': [
+                _facet_value(f'{key}:{value}', value, counts[key].get(value, 0), value in selected)
+                for value in values
+            ],
+        })
+    return facets
+
+
+def _specification_check(index, values):
+    return lambda row: not values or row[3][index] in values
+
+
+def _row_value(row, name, keys):
+    if name == 'category':
+        return row[0]
+    if name == 'availability':
+        return row[1]
+    if name == 'price':
+        return row[2]
+    return row[3][keys.index(name)]
+
+
+def _facet_value(value, label, count, selected):
+    return {'value': value, 'label': label, 'count': count, 'selected': selected}
@@ -0,0 +1,33 @@
+"""
+Запасные изображения для товаров без загруженной фотографии.
+
+Правила проверяются по порядку, первое совпадение подстроки в названии товара
+побеждает. Результат сохраняется в Product.fallback_image_url при сохранении
+товара, поэтому шаблоны больше не сравнивают строки при каждом рендеринге.
+"""
+
+_CDN = 'https://store.storeimages.cdn-apple.com/4982/as-images.apple.com/is/'
+_PARAMS = '?wid=800&hei=800&fmt=jpeg&qlt=90&.v='
+
+FALLBACK_IMAGES = [
+    ('iPhone 15 Pro', _CDN + 'iphone-15-pro-finish-select-202309-6-7inch-naturaltitanium' + _PARAMS + '1692845702834'),
+    ('iPhone 15', _CDN + 'iphone-15-finish-select-202309-6-1inch-black' + _PARAMS + '1692923780378'),
+    ('iPhone 14', _CDN + 'iphone-14-finish-select-202209-6-1inch-blue' + _PARAMS + '1661027473988'),
+    ('iPad Pro', _CDN + 'ipad-pro-13-select-wifi-spacegray-202210' + _PARAMS + '1664411207213'),
+    ('iPad Air', _CDN + 'ipad-air-select-wifi-blue-202203' + _PARAMS + '1645065732688'),
+    ('MacBook Pro', _CDN + 'mbp14-spacegray-select-202310' + _PARAMS + '1697230830200'),
+    ('MacBook Air', _CDN + 'macbook-air-starlight-select-202206' + _PARAMS + '1653084303665'),
+    ('Apple Watch Series', _CDN + 'watch-s9-45-pink-sport-band-pink' + _PARAMS + '1694158925978'),
+    ('Apple Watch SE', _CDN + 'watch-se-40-alum-midnight-sport-band-midnight' + _PARAMS + '1661959945806'),
+    ('AirPods Pro', _CDN + 'airpods-pro-2nd-gen' + _PARAMS + '1660927355000'),
+    ('AirPods', _CDN + 'airpods-3rd-gen' + _PARAMS + '1635176534000'),
+    ('Magic Keyboard', _CDN + 'MJQJ3' + _PARAMS + '1617653617000'),
+    ('Apple Pencil', _CDN + 'apple-pencil-2nd-gen' + _PARAMS + '1539195312000'),
+]
+
+
+def fallback_image_for(name):
+    for fragment, url in FALLBACK_IMAGES:
+        if fragment in name:
+            return url
+    return ''
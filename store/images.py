@@ -0,0 +1,245 @@
+"""
+Фоновая обработка изображений товаров и категорий.
+
+Product.save() только ставит ImageJob в очередь в базе данных. Задания
+забирает пул потоков внутри веб-процесса (STORE_IMAGE_WORKER = 'thread') или
+отдельный воркер `manage.py process_image_jobs` (STORE_IMAGE_WORKER = 'external').
+Задание забирается условным UPDATE status='pending' -> 'running', поэтому
+несколько воркеров не обработают одно задание дважды.
+
+Из исходника строятся варианты STORE_IMAGE_RENDITIONS в форматах
+STORE_IMAGE_FORMATS; размеры каждого сохраняются в ImageRendition. Имя файла
+варианта содержит хеш содержимого, поэтому его можно отдавать с
+Cache-Control: immutable — новое изображение получит новые адреса.
+"""
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .caching import bump_version
+from .models import Category, ImageJob, ImageRendition, Product
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RENDITIONS = {
+    'thumbnail': (160, 160),
+    'small': (320, 320),
+    'card': (560, 560),
+    'detail': (800, 800),
+    'large': (1200, 1200),
+}
+EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp', 'PNG': 'png'}
+SAVE_OPTIONS = {
+    'JPEG': {'quality': 85, 'optimize': True, 'progressive': True},
+    'WEBP': {'quality': 80, 'method': 4},
+    'PNG': {'optimize': True},
+}
+MAX_ATTEMPTS = 3
+
+
+def rendition_sizes():
+    return dict(getattr(settings, 'STORE_IMAGE_RENDITIONS', DEFAULT_RENDITIONS))
+
+
+def rendition_formats():
+    return list(getattr(settings, 'STORE_IMAGE_FORMATS', ['JPEG', 'WEBP']))
+
+
+# Построение вариантов
+
+def rendition_path(owner, name, image_format, content):
+    """Путь варианта с хешем содержимого: products/renditions/<id>/card.<хеш>.webp"""
+    digest = hashlib.sha1(content).hexdigest()[:12]
+    folder = 'categories' if isinstance(owner, Category) else 'products'
+    return f'{folder}/renditions/{owner.pk}/{name}.{digest}.{EXTENSIONS[image_format]}'
+
+
+def render_image(owner):
+    """Построить все варианты изображения товара или категории и заменить ими прежние"""
+    sizes = sorted(rendition_sizes().items(), key=lambda item: item[1][0] * item[1][1], reverse=True)
+    storage = owner.image.storage
+
+    with owner.image.open('rb') as source:
+        image = Image.open(source)
+        # JPEG декодируется сразу в уменьшенном масштабе, если исходник намного больше
+        image.draft('RGB', sizes[0][1])
+        image = ImageOps.exif_transpose(image)
+        image.load()
+
+    flattened = None
+    renditions = []
+    # От большего варианта к меньшему: каждый следующий уменьшается из предыдущего
+    for name, bounds in sizes:
+        image = image.copy()
+        image.thumbnail(bounds, Image.LANCZOS)
+        for image_format in rendition_formats():
+            output = image
+            if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+                if flattened is None or flattened.size != image.size:
+                    flattened = _flatten(image)
+                output = flattened
+            buffer = io.BytesIO()
+            output.save(buffer, image_format, **SAVE_OPTIONS.get(image_format, {}))
+            content = buffer.getvalue()
+            path = rendition_path(owner, name, image_format, content)
+            if not storage.exists(path):
+                path = storage.save(path, ContentFile(content))
+            renditions.append(ImageRendition(
+                name=name, format=image_format, file=path,
+                width=image.width, height=image.height, size=len(content),
+                source_name=owner.image.name, **{owner._meta.model_name: owner},
+            ))
+
+    previous = ImageRendition.objects.filter(**{owner._meta.model_name: owner})
+    with transaction.atomic():
+        stale = set(previous.values_list('file', flat=True))
+        previous.delete()
+        ImageRendition.objects.bulk_create(renditions)
+    for path in stale - {rendition.file.name for rendition in renditions}:
+        storage.delete(path)
+    return renditions
+
+
+def _flatten(image):
+    """Прозрачность на белом фоне для форматов без альфа-канала"""
+    image = image.convert('RGBA')
+    background = Image.new('RGB', image.size, (255, 255, 255))
+    background.paste(image, mask=image.getchannel('A'))
+    return background
+
+
+# Очередь заданий
+
+def claim_job():
+    """Забрать самое старое задание из очереди; None, если очередь пуста"""
+    candidates = ImageJob.objects.filter(status=ImageJob.PENDING).order_by('created_at', 'id')
+    for job_id in candidates.values_list('id', flat=True)[:20]:
+        claimed = ImageJob.objects.filter(id=job_id, status=ImageJob.PENDING).update(
+            status=ImageJob.RUNNING, started_at=timezone.now(), attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return job_id
+    return None
+
+
+def process_job(job_id):
+    """Выполнить забранное задание и записать результат"""
+    job = ImageJob.objects.select_related('product', 'category').get(id=job_id)
+    owner = job.owner
+    if owner is None or owner.image.name != job.image_name:
+        # Изображение заменили, пока задание стояло в очереди — его обработает новое задание
+        _finish(job, ImageJob.SUPERSEDED)
+        return job.status
+    try:
+        render_image(owner)
+    except Exception as error:
+        logger.exception('Image job %s failed', job_id)
+        status = ImageJob.FAILED if job.attempts >= MAX_ATTEMPTS else ImageJob.PENDING
+        _finish(job, status, error=f'{type(error).__name__}: {error}')
+    else:
+        _finish(job, ImageJob.DONE)
+        _invalidate_pages(owner)
+    return job.status
+
+
+def _invalidate_pages(owner):
+    """Кешированные карточки должны получить адреса новых вариантов"""
+    if isinstance(owner, Product):
+        Product.objects.filter(pk=owner.pk).update(updated_at=timezone.now())
+    else:
+        bump_version('category', owner.pk)
+    bump_version('catalogue')
+
+
+def _finish(job, status, error=''):
+    job.status = status
+    job.error = error
+    job.finished_at = timezone.now() if status != ImageJob.PENDING else None
+    job.save(update_fields=['status', 'error', 'finished_at'])
+
+
+def requeue_stale_jobs(older_than=timedelta(minutes=10)):
+    """Вернуть в очередь задания, «зависшие» в running после падения воркера"""
+    return ImageJob.objects.filter(
+        status=ImageJob.RUNNING, started_at__lt=timezone.now() - older_than,
+    ).update(status=ImageJob.PENDING)
+
+
+def drain_queue():
+    """Обрабатывать задания, пока очередь не опустеет; число выполненных заданий"""
+    processed = 0
+    while True:
+        job_id = claim_job()
+        if job_id is None:
+            break
+        process_job(job_id)
+        processed += 1
+    return processed
+
+
+def process_pending_jobs(workers=1, processes=False):
+    """
+    Разобрать очередь несколькими воркерами.
+
+    processes=True запускает отдельные процессы — декодирование больших JPEG
+    упирается в CPU; соединения с БД закрываются до fork.
+    """
+    if workers <= 1:
+        return drain_queue()
+    if processes:
+        connections.close_all()
+        pool = ProcessPoolExecutor(max_workers=workers)
+    else:
+        pool = ThreadPoolExecutor(max_workers=workers)
+    with pool:
+        return sum(pool.map(_drain_in_worker, range(workers)))
+
+
+def _drain_in_worker(_=None):
+    """Разобрать очередь в потоке или процессе пула и закрыть его соединения с БД"""
+    try:
+        return drain_queue()
+    finally:
+        connections.close_all()
+
+
+# Обработка внутри веб-процесса
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def schedule_processing():
+    """Разбудить пул потоков веб-процесса после коммита нового задания"""
+    if getattr(settings, 'STORE_IMAGE_WORKER', 'thread') != 'thread':
+        return
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'STORE_IMAGE_WORKERS', 2),
+                thread_name_prefix='store-images',
+            )
+    _executor.submit(_drain_in_worker)
+
+
+def images_needing_renditions():
+    """Товары и категории с изображением, у которых варианты отсутствуют или построены по другому файлу"""
+    expected = len(rendition_sizes()) * len(rendition_formats())
+    for model in (Category, Product):
+        owners = model.objects.exclude(image='').only('id', 'image').prefetch_related('renditions')
+        for owner in owners.iterator(chunk_size=500):
+            renditions = list(owner.renditions.all())
+            if len(renditions) != expected or any(r.source_name != owner.image.name for r in renditions):
+                yield owner
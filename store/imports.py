@@ -0,0 +1,209 @@
+"""
+Массовый импорт товаров из CSV и JSON Lines (прайс-листы поставщиков).
+
+Строка файла — товар с обязательным slug и любым набором остальных полей:
+файл только с колонками slug и price меняет одни цены. Значения проверяются
+полями модели, категория ищется по slug в словаре, загруженном один раз.
+
+Строки обрабатываются пачками: одна выборка текущих значений по slug, сравнение
+(неизменённые товары не пишутся), затем один bulk_create(update_conflicts=True)
+на пачку. Product.save и сигналы не вызываются — поисковый индекс
+и счётчики фасетов обновляются для изменённых товаров пачкой, версия каталога
+сбрасывается один раз в конце. С dry_run ничего не пишется, а результат
+содержит список изменений.
+"""
+import csv
+import json
+from collections import Counter
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .caching import bump_version
+from .facets import adjust_facet_count, facet_key
+from .fallback_images import fallback_image_for
+from .models import Category, FacetCount, Product
+from .search import get_search_backend
+
+
+FORMATS = ('csv', 'jsonl')
+
+# Колонки файла; category — slug категории, остальные совпадают с полями Product
+IMPORT_FIELDS = (
+    'name', 'category', 'description', 'price', 'availability', 'featured', 'specifications', 'fallback_image_url',
+)
+REQUIRED_FIELDS = ('name', 'category', 'price')
+ATTNAMES = [Product._meta.get_field(name).attname for name in IMPORT_FIELDS]
+FACET_ATTNAMES = ('category_id', 'availability', 'price', 'specifications')
+SEARCH_ATTNAMES = {'name', 'category_id', 'description', 'specifications'}
+
+
+def _new_product_defaults():
+    """Значения полей нового товара, не указанные в файле"""
+    return {attname: Product._meta.get_field(attname).get_default() for attname in ATTNAMES}
+
+
+class RowError(ValueError):
+    pass
+
+
+def guess_format(filename):
+    return 'jsonl' if str(filename).lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def read_rows(stream, import_format):
+    """Пары (номер строки, словарь полей) из текстового потока"""
+    if import_format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError:
+            yield number, None
+
+
+def clean_row(raw, categories):
+    """slug и проверенные значения полей строки (по attname); RowError для неверной строки"""
+    if not isinstance(raw, dict):
+        raise RowError('Ожидался объект с полями товара')
+    slug = str(raw.get('slug') or '').strip()
+    if not slug:
+        raise RowError('Не указан slug')
+    values = {}
+    for name in ('slug', *IMPORT_FIELDS):
+        value = raw.get(name) if name != 'slug' else slug
+        # Пустая ячейка — поле не меняется
+        if value is None or value == '':
+            continue
+        field = Product._meta.get_field(name)
+        if name == 'category':
+            if value not in categories:
+                raise RowError(f'Неизвестная категория: {value}')
+            values[field.attname] = categories[value]
+            continue
+        if name == 'specifications' and isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                raise RowError('specifications: неверный JSON')
+        if name == 'specifications' and not isinstance(value, dict):
+            raise RowError('specifications: ожидался объект')
+        try:
+            values[field.attname] = field.clean(value, None)
+        except ValidationError as error:
+            raise RowError(f'{name}: {"; ".join(error.messages)}')
+    del values['slug']
+    return slug, values
+
+
+class ImportResult:
+    """Счётчики импорта, ошибки строк и первые diff_limit изменений"""
+
+    def __init__(self, diff_limit=20):
+        self.diff_limit = diff_limit
+        self.rows = self.created = self.updated = self.unchanged = 0
+        self.errors = []
+        self.changes = []
+
+    def record(self, slug, changes, created):
+        if created:
+            self.created += 1
+        else:
+            self.updated += 1
+        if len(self.changes) < self.diff_limit:
+            self.changes.append((slug, changes, created))
+
+    def summary(self):
+        return (
+            f'{self.rows} rows: {self.created} created, {self.updated} updated, '
+            f'{self.unchanged} unchanged, {len(self.errors)} invalid'
+        )
+
+
+def format_change(slug, changes, created):
+    if created:
+        return f'+ {slug}: ' + ', '.join(f'{name}={new!r}' for name, (_, new) in changes.items())
+    return f'~ {slug}: ' + ', '.join(f'{name} {old!r} → {new!r}' for name, (old, new) in changes.items())
+
+
+def import_products(rows, batch_size=1000, dry_run=False, progress=None, diff_limit=20):
+    """
+    Создать и обновить товары по slug из пар (номер строки, словарь полей).
+
+    progress(result) вызывается после каждой пачки.
+    """
+    categories = dict(Category.objects.values_list('slug', 'id'))
+    result = ImportResult(diff_limit)
+    batch = {}
+    for number, raw in rows:
+        result.rows += 1
+        try:
+            slug, values = clean_row(raw, categories)
+        except RowError as error:
+            result.errors.append((number, str(error)))
+            continue
+        # Повтор slug в пачке дописывает поля к предыдущей строке
+        previous = batch.pop(slug, (number, {}))[1]
+        batch[slug] = (number, {**previous, **values})
+        if len(batch) >= batch_size:
+            _upsert(batch, result, dry_run)
+            batch = {}
+            if progress:
+                progress(result)
+    if batch:
+        _upsert(batch, result, dry_run)
+        if progress:
+            progress(result)
+    if not dry_run and (result.created or result.updated):
+        bump_version('catalogue')
+    return result
+
+
+def _upsert(batch, result, dry_run):
+    existing = {
+        row['slug']: row for row in Product.objects.filter(slug__in=batch).values('slug', *ATTNAMES)
+    }
+    products, write_fields, reindex = [], set(), []
+    facet_deltas = Counter()
+    for slug, (number, values) in batch.items():
+        current = existing.get(slug)
+        if current is None:
+            missing = [name for name, attname in zip(IMPORT_FIELDS, ATTNAMES)
+                       if name in REQUIRED_FIELDS and attname not in values]
+            if missing:
+                result.errors.append((number, f'Новый товар {slug}: не указаны {", ".join(missing)}'))
+                continue
+            values = {**_new_product_defaults(), 'fallback_image_url': fallback_image_for(values['name']), **values}
+            changes = {name: (None, value) for name, value in values.items()}
+        else:
+            changes = {name: (current[name], value) for name, value in values.items() if current[name] != value}
+            if not changes:
+                result.unchanged += 1
+                continue
+            values = {**current, **values}
+            facet_deltas[facet_key(*(current[name] for name in FACET_ATTNAMES))] -= 1
+
+        result.record(slug, changes, created=current is None)
+        facet_deltas[facet_key(*(values[name] for name in FACET_ATTNAMES))] += 1
+        write_fields.update(changes)
+        if current is None or SEARCH_ATTNAMES & changes.keys():
+            reindex.append(slug)
+        products.append(Product(**{**values, 'slug': slug}))
+
+    if dry_run or not products:
+        return
+    with transaction.atomic():
+        Product.objects.bulk_create(
+            products, update_conflicts=True, unique_fields=['slug'],
+            update_fields=[*write_fields, 'updated_at'],
+        )
+        if reindex:
+            get_search_backend().update_queryset(Product.objects.filter(slug__in=reindex))
+        for key, delta in facet_deltas.items():
+            if delta:
+                adjust_facet_count(FacetCount, key, delta)
@@ -0,0 +1,182 @@
+"""
+Инструментирование представлений: число SQL-запросов, время SQL, время
+рендеринга шаблонов и размер ответа для каждого имени URL.
+
+Метрики собирает InstrumentationMiddleware и хранит в памяти процесса в
+скользящем окне последних STORE_INSTRUMENTATION_WINDOW запросов. При
+STORE_INSTRUMENTATION = False middleware отключается целиком и не добавляет
+накладных расходов.
+"""
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+
+# Границы корзин гистограммы длительности, мс
+DURATION_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000)
+
+# Операторы управления транзакциями не считаются запросами бюджета
+TRANSACTION_STATEMENTS = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE')
+
+_local = threading.local()
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Представление выполнило больше запросов, чем разрешено бюджетом"""
+
+
+class RequestRecord:
+    __slots__ = ('queries', 'sql_time', 'template_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Обёртка для connection.execute_wrapper
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            if not sql.lstrip().upper().startswith(TRANSACTION_STATEMENTS):
+                self.queries += 1
+
+
+class MetricsRegistry:
+    """Скользящее окно выборок по каждому имени URL"""
+
+    METRICS = ('duration_ms', 'queries', 'sql_ms', 'template_ms', 'response_bytes')
+
+    def __init__(self, window=500):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=self.window))
+
+    def record(self, view_name, sample):
+        with self._lock:
+            self._samples[view_name].append(sample)
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+
+    def snapshot(self):
+        with self._lock:
+            samples = {name: list(values) for name, values in self._samples.items()}
+        return {name: self._summarize(values) for name, values in sorted(samples.items())}
+
+    def _summarize(self, samples):
+        summary = {'requests': len(samples)}
+        for index, metric in enumerate(self.METRICS):
+            values = sorted(sample[index] for sample in samples if sample[index] is not None)
+            if not values:
+                continue
+            summary[metric] = {
+                'mean': round(sum(values) / len(values), 3),
+                'p50': round(_percentile(values, 50), 3),
+                'p95': round(_percentile(values, 95), 3),
+                'p99': round(_percentile(values, 99), 3),
+                'max': round(values[-1], 3),
+            }
+        histogram = dict.fromkeys([f'<={bound}' for bound in DURATION_BUCKETS] + ['inf'], 0)
+        for sample in samples:
+            for bound in DURATION_BUCKETS:
+                if sample[0] <= bound:
+                    histogram[f'<={bound}'] += 1
+                    break
+            else:
+                histogram['inf'] += 1
+        summary['duration_histogram'] = histogram
+        return summary
+
+
+def _percentile(sorted_values, percent):
+    index = (len(sorted_values) - 1) * percent / 100
+    lower = int(index)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (index - lower)
+
+
+registry = MetricsRegistry(window=getattr(settings, 'STORE_INSTRUMENTATION_WINDOW', 500))
+
+_template_patch_lock = threading.Lock()
+_template_patched = False
+
+
+def _patch_template_rendering():
+    """Учитывать время рендеринга шаблонов Django в записи текущего запроса"""
+    global _template_patched
+    with _template_patch_lock:
+        if _template_patched:
+            return
+        from django.template.backends.django import Template
+
+        original_render = Template.render
+
+        def render(self, context=None, request=None):
+            record = getattr(_local, 'record', None)
+            if record is None:
+                return original_render(self, context, request)
+            started = time.perf_counter()
+            try:
+                return original_render(self, context, request)
+            finally:
+                record.template_time += time.perf_counter() - started
+
+        Template.render = render
+        _template_patched = True
+
+
+def query_budget(view_name):
+    budgets = getattr(settings, 'STORE_QUERY_BUDGETS', {})
+    return budgets.get(view_name)
+
+
+class InstrumentationMiddleware:
+    """Собирает метрики запроса и при необходимости проверяет бюджет запросов"""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'STORE_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.enforce_budgets = getattr(settings, 'STORE_ENFORCE_QUERY_BUDGETS', False)
+        _patch_template_rendering()
+
+    def __call__(self, request):
+        record = RequestRecord()
+        _local.record = record
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(record))
+                response = self.get_response(request)
+        finally:
+            _local.record = None
+        duration = time.perf_counter() - started
+
+        match = request.resolver_match
+        view_name = match.view_name if match else 'unresolved'
+        size = None if getattr(response, 'streaming', False) else len(response.content)
+        registry.record(view_name, (
+            duration * 1000,
+            record.queries,
+            record.sql_time * 1000,
+            record.template_time * 1000,
+            size,
+        ))
+
+        budget = query_budget(view_name)
+        if self.enforce_budgets and budget is not None and record.queries > budget:
+            raise QueryBudgetExceeded(
+                f'{view_name} выполнило {record.queries} SQL-запросов при бюджете {budget}'
+            )
+        return response
+
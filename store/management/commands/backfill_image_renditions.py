@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from store.images import images_needing_renditions, process_pending_jobs
+from store.models import ImageJob
+
+
+class Command(BaseCommand):
+    help = 'Queue and build image renditions for products and categories that have none or outdated ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--threads', action='store_true',
+                            help='Use threads instead of worker processes')
+        parser.add_argument('--enqueue-only', action='store_true',
+                            help='Only queue jobs for a running process_image_jobs worker')
+
+    def handle(self, *args, **options):
+        owners = list(images_needing_renditions())
+        jobs = [ImageJob(image_name=owner.image.name, **{owner._meta.model_name: owner}) for owner in owners]
+        ImageJob.objects.filter(status=ImageJob.PENDING).filter(
+            Q(product__in=[job.product for job in jobs if job.product])
+            | Q(category__in=[job.category for job in jobs if job.category])
+        ).delete()
+        ImageJob.objects.bulk_create(jobs, batch_size=500)
+        self.stdout.write(f'Queued {len(owners)} images')
+        if options['enqueue_only'] or not owners:
+            return
+
+        started = time.perf_counter()
+        processed = process_pending_jobs(options['workers'], processes=not options['threads'])
+        failed = ImageJob.objects.filter(status=ImageJob.FAILED).count()
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {processed} jobs in {time.perf_counter() - started:.1f}s, {failed} failed in total'
+        ))
@@ -0,0 +1,132 @@
+import json
+import random
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from store.instrumentation import _percentile
+from store.models import Cart, Category, Product, Stock
+
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+class StatementCounter:
+    """Считает запросы и пишущие операторы соединения одного потока"""
+
+    def __init__(self):
+        self.queries = 0
+        self.writes = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        if sql.lstrip()[:7].upper().startswith(WRITE_STATEMENTS):
+            self.writes += 1
+        return execute(sql, params, many, context)
+
+
+def visit(products, adds, stats):
+    """Один посетитель: adds добавлений в корзину (последнее — повтор товара) и просмотр корзины"""
+    client = Client()
+    counter = StatementCounter()
+    timings, errors = [], 0
+    chosen = random.sample(products, adds - 1) if adds > 1 else []
+    chosen.append(chosen[0] if chosen else products[0])
+    try:
+        with ExitStack() as stack:
+            # Чтение каталога идёт через отдельное соединение (store.database.ReadWriteRouter)
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            for product_id in chosen:
+                started = time.perf_counter()
+                response = client.post(
+                    reverse('store:add_to_cart'), json.dumps({'product_id': product_id}),
+                    content_type='application/json',
+                )
+                timings.append((time.perf_counter() - started) * 1000)
+                errors += not response.json()['success']
+            started = time.perf_counter()
+            errors += client.get(reverse('store:cart')).status_code != 200
+            timings.append((time.perf_counter() - started) * 1000)
+    finally:
+        connections.close_all()
+    with stats['lock']:
+        stats['timings'].extend(timings)
+        stats['errors'] += errors
+        stats['queries'] += counter.queries
+        stats['writes'] += counter.writes
+        session = client.cookies.get(settings.SESSION_COOKIE_NAME)
+        if session:
+            stats['sessions'].append(session.value)
+
+
+def run_cart_load(backend, products, visitors, threads, adds):
+    """Прогнать visitors посетителей из threads потоков с бэкендом корзины backend"""
+    stats = {'timings': [], 'errors': 0, 'queries': 0, 'writes': 0, 'sessions': [], 'lock': threading.Lock()}
+    with override_settings(STORE_CART_BACKEND=backend, ALLOWED_HOSTS=['testserver']):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(lambda _: visit(products, adds, stats), range(visitors)))
+        stats['elapsed'] = time.perf_counter() - started
+    del stats['lock']
+    return stats
+
+
+class Command(BaseCommand):
+    help = 'Compare add-to-cart throughput and database writes of the database and signed-cookie cart backends'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--visitors', type=int, default=200)
+        parser.add_argument('--adds', type=int, default=5, help='Add-to-cart requests per visitor')
+        parser.add_argument('--products', type=int, default=50)
+        parser.add_argument('--backend', action='append', dest='backends', choices=['database', 'cookie'],
+                            help='Backend to run (default: both)')
+
+    def handle(self, *args, **options):
+        # Потокам нужны закоммиченные данные, поэтому товары создаются и удаляются явно
+        suffix = uuid.uuid4().hex[:8]
+        category = Category.objects.create(name=f'Cart bench {suffix}', slug=f'cart-bench-{suffix}')
+        products = [
+            Product.objects.create(
+                name=f'Cart bench {suffix} {i}', slug=f'cart-bench-{suffix}-{i}', category=category,
+                description='Нагрузочный тест', price=Decimal(1000 + i),
+            )
+            for i in range(options['products'])
+        ]
+        # Половина товаров с учётом остатка: бэкенд в базе резервирует их при добавлении
+        Stock.objects.bulk_create([Stock(product=product, on_hand=10 ** 6) for product in products[::2]])
+        product_ids = [product.pk for product in products]
+        adds = min(options['adds'], len(product_ids))
+
+        sessions = []
+        self.stdout.write(
+            f'{"backend":<10} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} '
+            f'{"writes/req":>11} {"queries/req":>12} {"errors":>7}'
+        )
+        try:
+            for backend in options['backends'] or ['database', 'cookie']:
+                stats = run_cart_load(backend, product_ids, options['visitors'], options['threads'], adds)
+                sessions.extend(stats['sessions'])
+                timings = sorted(stats['timings'])
+                requests = len(timings)
+                self.stdout.write(
+                    f'{backend:<10} {requests / stats["elapsed"]:>8.0f} {statistics.median(timings):>8.2f} '
+                    f'{_percentile(timings, 95):>8.2f} {stats["writes"] / requests:>11.2f} '
+                    f'{stats["queries"] / requests:>12.2f} {stats["errors"]:>7}'
+                )
+        finally:
+            Cart.objects.filter(session_key__in=sessions).delete()
+            Session.objects.filter(session_key__in=sessions).delete()
+            category.delete()
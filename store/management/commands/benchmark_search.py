@@ -0,0 +1,90 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from store.models import Category, Product
+from store.search import get_search_backend
+
+
+FAMILIES = [
+    'iPhone', 'iPad', 'MacBook', 'Watch', 'AirPods', 'iMac', 'Pencil', 'HomePod', 'Vision', 'Keyboard',
+]
+VARIANTS = ['Pro', 'Max', 'Air', 'Mini', 'Ultra', 'SE', 'Plus', 'Studio']
+WORDS = [
+    'смартфон', 'планшет', 'ноутбук', 'часы', 'наушники', 'чехол', 'клавиатура', 'дисплей',
+    'беспроводные', 'титановый', 'шумоподавлением', 'камерой', 'аккумулятором', 'быстрый',
+    'корпус', 'алюминиевый', 'яркий', 'тонкий', 'лёгкий', 'мощный', 'зарядка', 'динамики',
+    'микрофоны', 'датчики', 'пульсометр', 'водонепроницаемый', 'стекло', 'керамика', 'ремешок',
+]
+# Редкие слова делают выборку запросов реалистичнее: большинство слов встречается нечасто
+WORDS += [f'модель{i}' for i in range(500)]
+CHIPS = ['A15 Bionic', 'A16 Bionic', 'A17 Pro', 'Apple M1', 'Apple M2', 'Apple M3 Pro', 'H2', 'S9 SiP']
+MEMORY = ['64 ГБ', '128 ГБ', '256 ГБ', '512 ГБ', '1 ТБ']
+
+
+class Command(BaseCommand):
+    help = 'Compare full-text index search latency with the icontains scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--query', action='append', dest='queries',
+                            help='Search query to benchmark (may be repeated)')
+
+    def handle(self, *args, **options):
+        queries = options['queries'] or ['iphone 15 pro', 'iph', 'наушники', 'M2', 'модель42', 'титановый ultra']
+        backend = get_search_backend()
+
+        # Все данные создаются внутри транзакции и откатываются в конце
+        with transaction.atomic():
+            self.generate_catalogue(options['products'], options['seed'])
+            started = time.perf_counter()
+            backend.index_queryset(Product.objects.all())
+            self.stdout.write(f'Index built in {time.perf_counter() - started:.2f}s')
+
+            self.stdout.write(f'{"query":<20} {"icontains ms":>14} {"index ms":>10} {"hits":>8}')
+            for query in queries:
+                scan = Product.objects.filter(
+                    Q(name__icontains=query) | Q(description__icontains=query)
+                ).order_by('name')
+                indexed = backend.filter(Product.objects.all(), query).order_by('search_rank', 'name')
+                scan_ms = self.measure(scan, options['repeat'])
+                index_ms = self.measure(indexed, options['repeat'])
+                self.stdout.write(
+                    f'{query:<20} {scan_ms:>14.2f} {index_ms:>10.2f} {indexed.count():>8}'
+                )
+
+            transaction.set_rollback(True)
+
+    def measure(self, queryset, repeat):
+        """Медиана времени страницы из 12 товаров вместе с COUNT, как в Paginator"""
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            queryset.count()
+            list(queryset[:12])
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
+
+    def generate_catalogue(self, count, seed):
+        rng = random.Random(seed)
+        categories = Category.objects.bulk_create([
+            Category(name=f'Категория {i}', slug=f'bench-category-{i}') for i in range(20)
+        ])
+        products = []
+        for i in range(count):
+            name = f'{rng.choice(FAMILIES)} {rng.randrange(1, 20)} {rng.choice(VARIANTS)}'
+            products.append(Product(
+                name=f'{name} #{i}',
+                slug=f'bench-product-{i}',
+                category=rng.choice(categories),
+                description=' '.join(rng.choices(WORDS, k=12)),
+                price=rng.randrange(1000, 300000),
+                specifications={'Чип': rng.choice(CHIPS), 'Объем памяти': rng.choice(MEMORY)},
+            ))
+        Product.objects.bulk_create(products, batch_size=2000)
+        self.stdout.write(f'Generated {count} products')
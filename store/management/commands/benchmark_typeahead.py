@@ -0,0 +1,77 @@
+import gc
+import statistics
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from store.models import Product
+from store.typeahead import build_index, load_suggestions, TypeaheadIndex
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure build time, memory footprint and lookup latency of the typeahead index '
+        'for the current catalogue (use generate_load_data for a 100k-product catalogue)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=1000)
+        parser.add_argument('--limit', type=int, default=8)
+        parser.add_argument('--query', action='append', dest='queries',
+                            help='Prefix to benchmark (may be repeated)')
+
+    def handle(self, *args, **options):
+        queries = options['queries'] or ['i', 'iph', 'iphone 15', 'черн', 'm2', 'ipad pro 1 т', 'iphone 15 128 черн']
+        if not Product.objects.exists():
+            raise CommandError('The catalogue is empty')
+
+        started = time.perf_counter()
+        suggestions = load_suggestions()
+        loaded = time.perf_counter() - started
+        started = time.perf_counter()
+        index = TypeaheadIndex(suggestions)
+        built = time.perf_counter() - started
+        del suggestions
+        self.stdout.write(
+            f'{len(index)} suggestions, {len(index.words)} words: '
+            f'loaded in {loaded:.2f}s, indexed in {built:.2f}s'
+        )
+        self.report_memory(index)
+
+        self.stdout.write(f'{"query":<22} {"index µs":>9} {"p99 µs":>8} {"icontains ms":>13} {"top suggestion"}')
+        for query in queries:
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                results = index.suggest(query, options['limit'])
+                timings.append((time.perf_counter() - started) * 1e6)
+            timings.sort()
+            scan = Product.objects.filter(name__icontains=query).order_by('name').values_list('name', flat=True)
+            scan_ms = min(self.measure(scan, options['limit']) for _ in range(3))
+            self.stdout.write(
+                f'{query:<22} {statistics.median(timings):>9.1f} {timings[int(len(timings) * 0.99)]:>8.1f} '
+                f'{scan_ms:>13.2f} {results[0]["label"] if results else "—"}'
+            )
+
+    def report_memory(self, index):
+        """Размер частей индекса по sys.getsizeof и прирост памяти процесса при сборке по tracemalloc"""
+        parts = index.memory_usage()
+        for name, size in parts.items():
+            self.stdout.write(f'  {name:<18} {size / 2 ** 20:>8.1f} MiB')
+        self.stdout.write(f'  {"total":<18} {sum(parts.values()) / 2 ** 20:>8.1f} MiB')
+
+        # Повторная сборка под tracemalloc: медленнее, поэтому время выше меряется без него
+        gc.collect()
+        tracemalloc.start()
+        rebuilt = build_index()
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del rebuilt
+        self.stdout.write(
+            f'  traced: {retained / 2 ** 20:.1f} MiB retained, {peak / 2 ** 20:.1f} MiB peak while building'
+        )
+
+    def measure(self, queryset, limit):
+        started = time.perf_counter()
+        list(queryset[:limit])
+        return (time.perf_counter() - started) * 1000
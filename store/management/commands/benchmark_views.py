@@ -0,0 +1,114 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import override_settings
+from store.benchmark import build_scenarios, compare, environment, run_benchmark, seed_dataset
+from store.database import read_alias
+from store.snapshot import get_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Benchmark every store view against a seeded throwaway database and compare with a baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=5000)
+        parser.add_argument('--orders', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--rounds', type=int, default=5,
+                            help='Interleave scenarios over this many rounds of measurements')
+        parser.add_argument('--alloc-iterations', type=int, default=5,
+                            help='Extra requests measured under tracemalloc (0 disables)')
+        parser.add_argument('--cold', action='store_true',
+                            help='Clear the catalogue cache before every request')
+        parser.add_argument('--catalogue-source', choices=['database', 'snapshot'], default='database',
+                            help='Serve listings from the database or from the in-memory catalogue snapshot')
+        parser.add_argument('--scenario', action='append', dest='scenarios',
+                            help='Run only this scenario (may be repeated)')
+        parser.add_argument('--output', help='Write results as JSON to this path')
+        parser.add_argument('--baseline', help='Compare with results saved by an earlier --output')
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help='Allowed relative p50/p95 slowdown against the baseline')
+        parser.add_argument('--min-delta-ms', type=float, default=2.0,
+                            help='Ignore slowdowns smaller than this many milliseconds')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as stream:
+                baseline = json.load(stream)
+
+        # Бенчмарк работает на отдельной тестовой базе, рабочая база не меняется
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        # Соединение чтения каталога смотрит на ту же тестовую базу, как TEST['MIRROR'] в тестах
+        mirror = connections[read_alias()] if read_alias() else None
+        if mirror is not None:
+            mirror.close()
+            mirror_name = mirror.settings_dict['NAME']
+            mirror.creation.set_as_test_mirror(connection.settings_dict)
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver'], STORE_CATALOGUE_SOURCE=options['catalogue_source']):
+                started = time.perf_counter()
+                fixtures = seed_dataset(options['products'], options['orders'], options['seed'])
+                self.stdout.write(f"Seeded {options['products']} products in {time.perf_counter() - started:.2f}s")
+                if options['catalogue_source'] == 'snapshot':
+                    self.report_snapshot()
+                results = self.run(fixtures, options)
+        finally:
+            if mirror is not None:
+                mirror.close()
+                mirror.settings_dict['NAME'] = mirror_name
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as stream:
+                json.dump(results, stream, ensure_ascii=False, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if baseline is not None:
+            regressions = compare(results, baseline, options['threshold'], options['min_delta_ms'])
+            if regressions:
+                for line in regressions:
+                    self.stdout.write(self.style.ERROR(line))
+                raise CommandError(f'{len(regressions)} regressions against {options["baseline"]}')
+            self.stdout.write(self.style.SUCCESS(f'No regressions against {options["baseline"]}'))
+
+    def report_snapshot(self):
+        # Снимок собирается до замеров, иначе его сборка попадёт в первый запрос
+        started = time.perf_counter()
+        snapshot = get_snapshot()
+        self.stdout.write(f'Catalogue snapshot of {len(snapshot)} products built in {time.perf_counter() - started:.2f}s')
+        for name, size in snapshot.memory_usage().items():
+            self.stdout.write(f'  {name:<8} {size / 2 ** 20:>8.2f} MiB')
+
+    def run(self, fixtures, options):
+        scenarios = build_scenarios(fixtures)
+        if options['scenarios']:
+            unknown = set(options['scenarios']) - {scenario.name for scenario in scenarios}
+            if unknown:
+                raise CommandError(f'Unknown scenarios: {", ".join(sorted(unknown))}')
+            scenarios = [scenario for scenario in scenarios if scenario.name in options['scenarios']]
+
+        results = run_benchmark(
+            scenarios, options['iterations'], options['warmup'], options['alloc_iterations'],
+            options['cold'], options['rounds'],
+        )
+        self.stdout.write(
+            f'{"scenario":<22} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"queries":>8} {"peak KiB":>9}'
+        )
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<22} {result["p50_ms"]:>8.2f} {result["p95_ms"]:>8.2f} '
+                f'{result["p99_ms"]:>8.2f} {result["queries"]:>8} {result.get("alloc_peak_kib", "-"):>9}'
+            )
+        return {
+            'environment': environment(
+                products=options['products'], orders=options['orders'], seed=options['seed'],
+                iterations=options['iterations'], rounds=options['rounds'], cold=options['cold'],
+                catalogue_source=options['catalogue_source'],
+            ),
+            'scenarios': results,
+        }
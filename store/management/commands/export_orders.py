@@ -0,0 +1,35 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from store.exports import FORMATS, STATUSES, export_lines, parse_day
+
+
+class Command(BaseCommand):
+    help = 'Stream orders with their line items as CSV (one row per item) or JSON Lines (one order per line)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--output', help='Write to this file instead of stdout')
+        parser.add_argument('--start', help='First order date, YYYY-MM-DD (inclusive)')
+        parser.add_argument('--end', help='Last order date, YYYY-MM-DD (inclusive)')
+        parser.add_argument('--status', action='append', dest='statuses', choices=STATUSES,
+                            help='Only orders in this status (may be repeated)')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched from the cursor at a time')
+
+    def handle(self, *args, **options):
+        try:
+            start, end = parse_day(options['start']), parse_day(options['end'])
+        except ValueError as error:
+            raise CommandError(error)
+
+        lines = export_lines(
+            options['format'], start=start, end=end, statuses=options['statuses'], chunk_size=options['chunk_size'],
+        )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as stream:
+                stream.writelines(lines)
+        else:
+            # self.stdout добавляет перевод строки к каждой записи — пишем в поток напрямую
+            stream = getattr(self.stdout, '_out', sys.stdout)
+            stream.writelines(lines)
+            stream.flush()
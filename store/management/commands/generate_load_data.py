@@ -0,0 +1,62 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from store.synthetic import build_trace, clear_dataset, generate_dataset, write_trace
+
+
+class Command(BaseCommand):
+    help = 'Generate a large synthetic catalogue, carts and order history, and a replayable request trace'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=12)
+        parser.add_argument('--products', type=int, default=100000)
+        parser.add_argument('--carts', type=int, default=1000)
+        parser.add_argument('--orders', type=int, default=20000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--stock-share', type=float, default=0.5,
+                            help='Share of products with tracked stock')
+        parser.add_argument('--history-days', type=int, default=365,
+                            help='Spread order dates over this many days')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--clear', action='store_true',
+                            help='Delete previously generated data first')
+        parser.add_argument('--trace', help='Write a request trace (JSON Lines) to this path')
+        parser.add_argument('--trace-requests', type=int, default=10000)
+        parser.add_argument('--sessions', type=int, default=200,
+                            help='Number of visitor sessions in the trace')
+        parser.add_argument('--trace-only', action='store_true',
+                            help='Only build the trace for already generated data')
+
+    def handle(self, *args, **options):
+        if options['trace_only'] and not options['trace']:
+            raise CommandError('--trace-only requires --trace')
+
+        if not options['trace_only']:
+            if options['clear']:
+                started = time.perf_counter()
+                deleted = clear_dataset()
+                self.stdout.write(f'Deleted {deleted} generated products in {time.perf_counter() - started:.2f}s')
+
+            started = time.perf_counter()
+            counts = generate_dataset(
+                categories=options['categories'],
+                products=options['products'],
+                carts=options['carts'],
+                orders=options['orders'],
+                seed=options['seed'],
+                stock_share=options['stock_share'],
+                history_days=options['history_days'],
+                batch_size=options['batch_size'],
+            )
+            summary = ', '.join(f'{count} {name}' for name, count in counts.items())
+            self.stdout.write(self.style.SUCCESS(
+                f'Generated {summary} in {time.perf_counter() - started:.2f}s'
+            ))
+
+        if options['trace']:
+            trace = build_trace(options['trace_requests'], seed=options['seed'], sessions=options['sessions'])
+            if not trace:
+                raise CommandError('No generated products found; run without --trace-only first')
+            with open(options['trace'], 'w', encoding='utf-8') as stream:
+                write_trace(trace, stream)
+            self.stdout.write(self.style.SUCCESS(f'Wrote {len(trace)} requests to {options["trace"]}'))
@@ -0,0 +1,47 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from store.imports import FORMATS, format_change, guess_format, import_products, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        'Create and update products by slug from a CSV (with a header row) or JSON Lines file; '
+        'empty cells leave fields unchanged, category is a category slug'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or '-' for stdin")
+        parser.add_argument('--format', choices=FORMATS, help='Default: by file extension (.jsonl/.ndjson), else csv')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Validate and show the changes without writing')
+        parser.add_argument('--show', type=int, default=20, help='Number of changes and errors to print')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        import_format = options['format'] or guess_format(path)
+        started = time.perf_counter()
+
+        def progress(result):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{result.summary()} ({time.perf_counter() - started:.1f}s)')
+
+        try:
+            # utf-8-sig: таблицы, сохранённые из Excel, начинаются с BOM
+            stream = sys.stdin if path == '-' else open(path, encoding='utf-8-sig', newline='')
+        except OSError as error:
+            raise CommandError(error)
+        with stream:
+            result = import_products(
+                read_rows(stream, import_format), batch_size=options['batch_size'],
+                dry_run=options['dry_run'], progress=progress, diff_limit=options['show'],
+            )
+
+        for change in result.changes:
+            self.stdout.write(format_change(*change))
+        for number, error in result.errors[:options['show']]:
+            self.stderr.write(f'line {number}: {error}')
+        prefix = 'Dry run, nothing written: ' if options['dry_run'] else ''
+        style = self.style.WARNING if result.errors else self.style.SUCCESS
+        self.stdout.write(style(f'{prefix}{result.summary()} in {time.perf_counter() - started:.2f}s'))
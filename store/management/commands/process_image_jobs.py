@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+from store.images import process_pending_jobs, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    help = 'Process queued product image jobs (use with STORE_IMAGE_WORKER = "external")'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--processes', action='store_true',
+                            help='Use worker processes instead of threads')
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit')
+        parser.add_argument('--poll', type=float, default=2.0, help='Seconds between queue polls')
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale_jobs()
+        if requeued:
+            self.stdout.write(f'Requeued {requeued} stale jobs')
+
+        while True:
+            processed = process_pending_jobs(options['workers'], options['processes'])
+            if processed:
+                self.stdout.write(f'Processed {processed} jobs')
+            if options['once']:
+                break
+            time.sleep(options['poll'])
@@ -0,0 +1,30 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from store.models import Cart
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete stale carts in batches: empty carts and abandoned anonymous carts '
+        '(run from cron daily, together with clearsessions)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empty-days', type=float, default=1,
+                            help='Delete empty carts not changed for this many days')
+        parser.add_argument('--abandoned-days', type=float, default=30,
+                            help='Delete anonymous carts not changed for this many days')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Only count the carts to delete')
+
+    def handle(self, *args, **options):
+        carts = Cart.objects.stale(
+            empty_for=timedelta(days=options['empty_days']),
+            abandoned_for=timedelta(days=options['abandoned_days']),
+        )
+        if options['dry_run']:
+            self.stdout.write(f'{carts.count()} carts would be deleted')
+            return
+        deleted = carts.purge(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} carts'))
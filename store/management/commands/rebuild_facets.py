@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from store.facets import rebuild_facet_counts
+from store.models import FacetCount, Product
+
+
+class Command(BaseCommand):
+    help = 'Recompute the precomputed facet count table from products'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            combinations = rebuild_facet_counts(Product.objects.all(), FacetCount)
+        self.stdout.write(self.style.SUCCESS(f'Stored {combinations} facet combinations'))
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+from store.recommendations import rebuild_co_purchases
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the co-purchase matrix and top-K "bought together" recommendations from all order lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--max-pairs', type=int, default=200000,
+                            help='Product pairs kept in memory before they are flushed to the database')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        counts = rebuild_co_purchases(batch_size=options['batch_size'], max_pairs=options['max_pairs'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored {counts["pairs"]} product pairs and {counts["recommendations"]} recommendations '
+            f'in {time.perf_counter() - started:.2f}s'
+        ))
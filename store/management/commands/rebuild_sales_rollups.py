@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+from store.analytics import rebuild_sales_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalculate the daily sales rollup tables from all orders and fill in cart counters '
+        'for days that have none'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        counts = rebuild_sales_rollups(batch_size=options['batch_size'])
+        summary = ', '.join(f'{count} {name} rows' for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {summary} in {time.perf_counter() - started:.2f}s'))
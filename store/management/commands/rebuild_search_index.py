@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from store.models import Product
+from store.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text product search index'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        started = time.perf_counter()
+
+        with transaction.atomic(using=backend.using):
+            count = backend.index_queryset(Product.objects.using(backend.using))
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {count} products with {type(backend).__name__} in {elapsed:.2f}s'
+        ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from store.models import Cart
+
+
+class Command(BaseCommand):
+    help = 'Recalculate stored cart totals (items_count, subtotal) in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Number of carts updated per transaction')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = Cart.objects.aggregate(last=Max('id'))['last'] or 0
+        updated = 0
+
+        # Идём по диапазонам id, чтобы не держать блокировку на всю таблицу
+        for start in range(0, last_id + 1, batch_size):
+            with transaction.atomic():
+                updated += Cart.objects.filter(
+                    id__gte=start, id__lt=start + batch_size
+                ).recalculate_totals()
+
+        self.stdout.write(self.style.SUCCESS(f'Recalculated totals for {updated} carts'))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from store.models import StockReservation
+
+
+class Command(BaseCommand):
+    help = 'Return expired cart reservations to available stock (run from cron every few minutes)'
+
+    def handle(self, *args, **options):
+        released = StockReservation.objects.release_expired()
+        self.stdout.write(self.style.SUCCESS(f'Released {released} reserved units'))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+JOURNAL_MODES = ('wal', 'delete', 'truncate', 'persist')
+
+
+class Command(BaseCommand):
+    help = (
+        'Switch the journal mode of the SQLite database file. The mode is stored in the file, '
+        'so this runs once per database instead of on every connection'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('mode', nargs='?', default='wal', choices=JOURNAL_MODES)
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'sqlite' or connection.is_in_memory_db():
+            raise CommandError('A file-based SQLite database is required')
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA journal_mode = {options["mode"]}')
+            mode = cursor.fetchone()[0]
+        self.stdout.write(self.style.SUCCESS(f'Journal mode: {mode}'))
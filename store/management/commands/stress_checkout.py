@@ -0,0 +1,104 @@
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+from django.db.models import Sum
+from store.models import Cart, Category, InsufficientStock, Order, OrderItem, Product, Stock
+
+
+CUSTOMER = {
+    'first_name': 'Нагрузочный',
+    'last_name': 'Тест',
+    'email': 'stress@example.com',
+    'phone': '+70000000000',
+    'address': '—',
+}
+
+
+def with_retry(func, stats, attempts=200):
+    """Повторить операцию при блокировке SQLite; число повторов — мера конкуренции"""
+    for attempt in range(attempts):
+        try:
+            return func()
+        except OperationalError as error:
+            if 'locked' not in str(error) or attempt == attempts - 1:
+                raise
+            with stats['lock']:
+                stats['retries'] += 1
+            time.sleep(random.uniform(0, 0.002 * (attempt + 1)))
+
+
+def checkout_attempt(product, quantity, stats, prefix):
+    """Один покупатель: корзина, резерв при добавлении и оформление заказа"""
+    try:
+        session_key = prefix + uuid.uuid4().hex[:24]
+        cart = with_retry(lambda: Cart.objects.create(session_key=session_key), stats)
+        try:
+            with_retry(lambda: cart.add_product(product, quantity), stats)
+            with_retry(lambda: cart.checkout(**CUSTOMER), stats)
+            outcome = 'orders'
+        except InsufficientStock:
+            outcome = 'sold_out'
+        with stats['lock']:
+            stats[outcome] += 1
+    finally:
+        connection.close()
+
+
+def run_checkout_stress(product, customers, threads, quantity=1, prefix='stress-'):
+    """Оформить customers заказов на один товар из threads потоков; корзины получают сессию prefix..."""
+    stats = {'orders': 0, 'sold_out': 0, 'retries': 0, 'lock': threading.Lock()}
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda _: checkout_attempt(product, quantity, stats, prefix), range(customers)))
+    stats['elapsed'] = time.perf_counter() - started
+    del stats['lock']
+    return stats
+
+
+class Command(BaseCommand):
+    help = 'Check out one hot SKU from many threads and verify that stock is never oversold'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--customers', type=int, default=400)
+        parser.add_argument('--stock', type=int, default=100)
+        parser.add_argument('--quantity', type=int, default=1, help='Units per order')
+
+    def handle(self, *args, **options):
+        # Потокам нужны закоммиченные данные, поэтому товар создаётся и удаляется явно
+        suffix = uuid.uuid4().hex[:8]
+        category = Category.objects.create(name=f'Stress {suffix}', slug=f'stress-{suffix}')
+        product = Product.objects.create(
+            name=f'Hot SKU {suffix}', slug=f'hot-sku-{suffix}', category=category,
+            description='Нагрузочный тест', price=Decimal('99990'),
+        )
+        Stock.objects.create(product=product, on_hand=options['stock'])
+
+        try:
+            stats = run_checkout_stress(
+                product, options['customers'], options['threads'], options['quantity'], prefix=f'stress-{suffix}-',
+            )
+            stock = Stock.objects.get(product=product)
+            sold = OrderItem.objects.filter(product=product).aggregate(total=Sum('quantity'))['total'] or 0
+            oversold = max(sold - options['stock'], 0)
+
+            self.stdout.write(
+                f"{stats['orders']} orders, {stats['sold_out']} sold out, {stats['retries']} lock retries "
+                f"in {stats['elapsed']:.2f}s ({stats['orders'] / stats['elapsed']:.0f} orders/s, "
+                f"{options['customers'] / stats['elapsed']:.0f} attempts/s)"
+            )
+            self.stdout.write(f'Stock: on_hand={stock.on_hand} reserved={stock.reserved} sold={sold}')
+            if oversold or stock.on_hand != options['stock'] - sold or stock.reserved:
+                self.stdout.write(self.style.ERROR(f'Inconsistent stock, oversold by {oversold}'))
+            else:
+                self.stdout.write(self.style.SUCCESS('No oversell'))
+        finally:
+            Order.objects.filter(items__product=product).delete()
+            Cart.objects.filter(session_key__startswith=f'stress-{suffix}-').delete()
+            category.delete()
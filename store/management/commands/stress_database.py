@@ -0,0 +1,176 @@
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, OperationalError, close_old_connections, connections
+from django.test.utils import override_settings
+from store.instrumentation import _percentile
+from store.models import Cart, InsufficientStock, Product
+
+
+MODES = ('baseline', 'tuned')
+
+
+def copy_database(source, target, journal_mode):
+    """Копия базы через backup API; режим журнала хранится в самом файле"""
+    origin, copy = sqlite3.connect(source), sqlite3.connect(target)
+    try:
+        origin.backup(copy)
+        copy.execute(f'PRAGMA journal_mode = {journal_mode}')
+    finally:
+        origin.close()
+        copy.close()
+
+
+@contextmanager
+def database_setup(path, mode):
+    """
+    Направить default и соединение чтения на path.
+
+    baseline — настройки до настройки SQLite: соединение на запрос, журнал отката,
+    таймаут по умолчанию, без PRAGMA и без отдельного соединения чтения.
+    """
+    aliases = [alias for alias in (DEFAULT_DB_ALIAS, getattr(settings, 'STORE_DATABASE_READ_ALIAS', None))
+               if alias in connections]
+    saved = {alias: dict(connections.settings[alias]) for alias in aliases}
+    overrides = {}
+    if mode == 'baseline':
+        overrides = {'STORE_SQLITE_PRAGMAS': {}, 'STORE_DATABASE_READ_ALIAS': None}
+    connections.close_all()
+    for alias in aliases:
+        connections.settings[alias]['NAME'] = str(path)
+        if mode == 'baseline':
+            connections.settings[alias].update(CONN_MAX_AGE=0, OPTIONS={})
+    try:
+        with override_settings(**overrides):
+            yield
+    finally:
+        connections.close_all()
+        for alias, settings_dict in saved.items():
+            connections.settings[alias].clear()
+            connections.settings[alias].update(settings_dict)
+
+
+def record(stats, kind, started, failed):
+    elapsed = (time.perf_counter() - started) * 1000
+    with stats['lock']:
+        stats[kind].append(elapsed)
+        stats['errors'] += failed
+
+
+def read_catalogue(products, deadline, stats):
+    """Читатель: страницы каталога с числом товаров и карточки товаров"""
+    try:
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            failed = False
+            try:
+                if random.random() < 0.5:
+                    listing = Product.objects.filter(availability='available').order_by('-created_at', '-id')
+                    offset = random.randrange(50) * 12
+                    listing.count()
+                    list(listing.prefetch_related('renditions')[offset:offset + 12])
+                else:
+                    Product.objects.select_related('category').get(slug=random.choice(products)[1])
+            except OperationalError:
+                failed = True
+            record(stats, 'reads', started, failed)
+            # Как в конце запроса: при CONN_MAX_AGE = 0 соединение закрывается
+            close_old_connections()
+    finally:
+        connections.close_all()
+
+
+def write_carts(products, deadline, stats, prefix, adds=3):
+    """Писатель: корзина и добавление в неё товаров, как в add_to_cart, без повторов при блокировке"""
+    try:
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            failed = False
+            try:
+                cart = Cart.objects.create(session_key=prefix + uuid.uuid4().hex[:24])
+                for product_id, _ in random.sample(products, adds):
+                    cart.add_product(Product.objects.get(pk=product_id), 1)
+            except InsufficientStock:
+                pass
+            except OperationalError:
+                failed = True
+            record(stats, 'writes', started, failed)
+            close_old_connections()
+    finally:
+        connections.close_all()
+
+
+def run_database_stress(products, readers, writers, seconds, prefix='stress-db-'):
+    """readers потоков читают каталог, writers потоков пишут корзины в течение seconds секунд"""
+    stats = {'reads': [], 'writes': [], 'errors': 0, 'lock': threading.Lock()}
+    deadline = time.perf_counter() + seconds
+    threads = [
+        threading.Thread(target=read_catalogue, args=(products, deadline, stats)) for _ in range(readers)
+    ] + [
+        threading.Thread(target=write_carts, args=(products, deadline, stats, prefix)) for _ in range(writers)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats['elapsed'] = time.perf_counter() - started
+    del stats['lock']
+    return stats
+
+
+class Command(BaseCommand):
+    help = (
+        'Run concurrent catalogue reads and cart writes against throwaway copies of the database, '
+        'with the untuned SQLite setup (baseline) and with WAL, PRAGMAs, persistent connections '
+        'and the read connection (tuned)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--mode', action='append', dest='modes', choices=MODES,
+                            help='Setup to run (default: both)')
+
+    def handle(self, *args, **options):
+        connection = connections[DEFAULT_DB_ALIAS]
+        source = str(connection.settings_dict['NAME'])
+        if connection.vendor != 'sqlite' or connection.is_in_memory_db():
+            raise CommandError('A file-based SQLite database is required')
+        products = list(Product.objects.using(DEFAULT_DB_ALIAS).order_by('?').values_list('id', 'slug')[:1000])
+        if len(products) < 3:
+            raise CommandError('The catalogue needs at least 3 products (see generate_load_data)')
+
+        self.stdout.write(
+            f'{options["readers"]} readers, {options["writers"]} writers, {options["seconds"]:g}s per setup'
+        )
+        self.stdout.write(
+            f'{"setup":<10} {"reads/s":>8} {"read p50":>9} {"read p95":>9} '
+            f'{"writes/s":>9} {"write p50":>10} {"write p95":>10} {"errors":>7}'
+        )
+        # Копии базы во временном каталоге: рабочая база не меняется
+        with tempfile.TemporaryDirectory() as directory:
+            for mode in options['modes'] or MODES:
+                path = Path(directory) / f'{mode}.sqlite3'
+                copy_database(source, path, 'delete' if mode == 'baseline' else 'wal')
+                with database_setup(path, mode):
+                    stats = run_database_stress(
+                        products, options['readers'], options['writers'], options['seconds'],
+                    )
+                reads, writes = sorted(stats['reads']), sorted(stats['writes'])
+                self.stdout.write(
+                    f'{mode:<10} {len(reads) / stats["elapsed"]:>8.0f} {statistics.median(reads or [0]):>9.2f} '
+                    f'{_percentile(reads, 95) if reads else 0:>9.2f} {len(writes) / stats["elapsed"]:>9.0f} '
+                    f'{statistics.median(writes or [0]):>10.2f} {_percentile(writes, 95) if writes else 0:>10.2f} '
+                    f'{stats["errors"]:>7}'
+                )
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:41
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    from store.search import SQLiteFTSBackend
+
+    backend = SQLiteFTSBackend(using=schema_editor.connection.alias)
+    backend.create_table()
+    backend.index_queryset(apps.get_model('store', 'Product').objects.all())
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    from store.search import SQLiteFTSBackend
+
+    SQLiteFTSBackend(using=schema_editor.connection.alias).drop_table()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0002_cart_items_count_cart_subtotal'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_facet_counts(apps, schema_editor):
+    from store.facets import rebuild_facet_counts
+
+    rebuild_facet_counts(apps.get_model('store', 'Product').objects.all(), apps.get_model('store', 'FacetCount'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0003_product_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('signature', models.CharField(max_length=40, unique=True, verbose_name='Комбинация')),
+                ('availability', models.CharField(max_length=20, verbose_name='Наличие')),
+                ('price_bucket', models.PositiveSmallIntegerField(verbose_name='Ценовой диапазон')),
+                ('specifications', models.JSONField(blank=True, default=dict, verbose_name='Характеристики')),
+                ('count', models.IntegerField(default=0, verbose_name='Количество товаров')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.category', verbose_name='Категория')),
+            ],
+            options={
+                'verbose_name': 'Счётчик фасетов',
+                'verbose_name_plural': 'Счётчики фасетов',
+            },
+        ),
+        migrations.RunPython(fill_facet_counts, migrations.RunPython.noop),
+    ]
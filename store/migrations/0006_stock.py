@@ -0,0 +1,52 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0005_catalogue_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Stock',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stock', serialize=False, to='store.product', verbose_name='Товар')),
+                ('on_hand', models.PositiveIntegerField(default=0, verbose_name='На складе')),
+                ('reserved', models.PositiveIntegerField(default=0, verbose_name='В резерве')),
+            ],
+            options={
+                'verbose_name': 'Остаток',
+                'verbose_name_plural': 'Остатки',
+            },
+        ),
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('expires_at', models.DateTimeField(verbose_name='Действует до')),
+                ('cart', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='store.cart', verbose_name='Корзина')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Резерв',
+                'verbose_name_plural': 'Резервы',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='stock',
+            constraint=models.CheckConstraint(check=models.Q(('reserved__lte', models.F('on_hand'))), name='store_stock_reserved_lte_on_hand'),
+        ),
+        migrations.AddIndex(
+            model_name='stockreservation',
+            index=models.Index(fields=['expires_at'], name='store_reservation_expires_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='stockreservation',
+            unique_together={('cart', 'product')},
+        ),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 4.2.7 on 2026-10-18 08:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Копия store.fallback_images на момент миграции
+CDN = 'https://store.storeimages.cdn-apple.com/4982/as-images.apple.com/is/'
+PARAMS = '?wid=800&hei=800&fmt=jpeg&qlt=90&.v='
+FALLBACK_IMAGES = [
+    ('iPhone 15 Pro', CDN + 'iphone-15-pro-finish-select-202309-6-7inch-naturaltitanium' + PARAMS + '1692845702834'),
+    ('iPhone 15', CDN + 'iphone-15-finish-select-202309-6-1inch-black' + PARAMS + '1692923780378'),
+    ('iPhone 14', CDN + 'iphone-14-finish-select-202209-6-1inch-blue' + PARAMS + '1661027473988'),
+    ('iPad Pro', CDN + 'ipad-pro-13-select-wifi-spacegray-202210' + PARAMS + '1664411207213'),
+    ('iPad Air', CDN + 'ipad-air-select-wifi-blue-202203' + PARAMS + '1645065732688'),
+    ('MacBook Pro', CDN + 'mbp14-spacegray-select-202310' + PARAMS + '1697230830200'),
+    ('MacBook Air', CDN + 'macbook-air-starlight-select-202206' + PARAMS + '1653084303665'),
+    ('Apple Watch Series', CDN + 'watch-s9-45-pink-sport-band-pink' + PARAMS + '1694158925978'),
+    ('Apple Watch SE', CDN + 'watch-se-40-alum-midnight-sport-band-midnight' + PARAMS + '1661959945806'),
+    ('AirPods Pro', CDN + 'airpods-pro-2nd-gen' + PARAMS + '1660927355000'),
+    ('AirPods', CDN + 'airpods-3rd-gen' + PARAMS + '1635176534000'),
+    ('Magic Keyboard', CDN + 'MJQJ3' + PARAMS + '1617653617000'),
+    ('Apple Pencil', CDN + 'apple-pencil-2nd-gen' + PARAMS + '1539195312000'),
+]
+
+
+def fill_fallback_images(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    # Правила применяются от последнего к первому, чтобы более точные совпадения побеждали
+    for fragment, url in reversed(FALLBACK_IMAGES):
+        Product.objects.filter(name__contains=fragment).update(fallback_image_url=url)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0007_image_jobs'),
+    ]
+
+    operations = [
+        migrations.RenameModel('ProductImageRendition', 'ImageRendition'),
+        migrations.AlterUniqueTogether(
+            name='imagerendition',
+            unique_together=set(),
+        ),
+        migrations.AlterModelOptions(
+            name='imagerendition',
+            options={
+                'verbose_name': 'Вариант изображения',
+                'verbose_name_plural': 'Варианты изображений',
+                'ordering': ['width'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='imagerendition',
+            name='product',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='renditions', to='store.product', verbose_name='Товар'),
+        ),
+        migrations.AddField(
+            model_name='imagerendition',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='renditions', to='store.category', verbose_name='Категория'),
+        ),
+        migrations.AddConstraint(
+            model_name='imagerendition',
+            constraint=models.UniqueConstraint(condition=models.Q(('product__isnull', False)), fields=('product', 'name', 'format'), name='store_rendition_product_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='imagerendition',
+            constraint=models.UniqueConstraint(condition=models.Q(('category__isnull', False)), fields=('category', 'name', 'format'), name='store_rendition_category_uniq'),
+        ),
+        migrations.AddField(
+            model_name='imagejob',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='image_jobs', to='store.category', verbose_name='Категория'),
+        ),
+        migrations.AlterField(
+            model_name='imagejob',
+            name='product',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='image_jobs', to='store.product', verbose_name='Товар'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='fallback_image_url',
+            field=models.URLField(blank=True, help_text='Показывается, пока у товара нет своей фотографии', max_length=500, verbose_name='Запасное изображение'),
+        ),
+        migrations.RunPython(fill_fallback_images, migrations.RunPython.noop),
+    ]
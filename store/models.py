@@ -1,10 +1,56 @@
-from django.db import models
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connections, models, transaction
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
 from django.contrib.auth.models import User
 from django.urls import reverse
-from PIL import Image
 
+from .facets import facet_key
+from .fallback_images import fallback_image_for
 
-class Category(models.Model):
+
+class CheckoutError(Exception):
+    """Корзину нельзя оформить: она пуста, товары закончились или изменились цены"""
+
+
+class InsufficientStock(CheckoutError):
+    """Свободного остатка не хватает"""
+
+    def __init__(self, names):
+        self.names = list(names)
+        super().__init__('Недостаточно товара на складе: ' + ', '.join(self.names))
+
+
+class QueuedImageMixin:
+    """Ставит ImageJob в очередь, когда меняется файл в поле image"""
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Имя файла изображения из БД: обработка нужна, только если оно изменилось
+        if 'image' in instance.__dict__:
+            instance._loaded_image = instance.__dict__['image'] or ''
+        return instance
+
+    def save(self, *args, **kwargs):
+        image_changed = (self.image.name or '') != getattr(self, '_loaded_image', '')
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if image_changed and self.image:
+                # Изображение обрабатывает фоновый воркер (store.images), а не запрос
+                owner = {self._meta.model_name: self}
+                ImageJob.objects.filter(status=ImageJob.PENDING, **owner).delete()
+                ImageJob.objects.create(image_name=self.image.name, **owner)
+        self._loaded_image = self.image.name or ''
+
+
+class Category(QueuedImageMixin, models.Model):
     name = models.CharField(max_length=100, verbose_name="Название категории")
     slug = models.SlugField(max_length=100, unique=True, verbose_name="URL")
     description = models.TextField(blank=True, verbose_name="Описание")
@@ -23,19 +69,28 @@ class Category(models.Model):
         return reverse('store:category_detail', kwargs={'slug': self.slug})
 
 
-class Product(models.Model):
+class Product(QueuedImageMixin, models.Model):
     AVAILABILITY_CHOICES = [
         ('available', 'В наличии'),
         ('out_of_stock', 'Нет в наличии'),
         ('pre_order', 'Предзаказ'),
     ]
 
+    FACET_FIELDS = ('category_id', 'availability', 'price', 'specifications')
+    # Поля, которые выводятся в списках товаров и снимке каталога
+    LISTING_FIELDS = (
+        'name', 'slug', 'category_id', 'price', 'image', 'fallback_image_url', 'availability', 'featured',
+        'specifications',
+    )
+
     name = models.CharField(max_length=200, verbose_name="Название товара")
     slug = models.SlugField(max_length=200, unique=True, verbose_name="URL")
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products', verbose_name="Категория")
     description = models.TextField(verbose_name="Описание")
     price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Цена (₽)")
     image = models.ImageField(upload_to='products/', verbose_name="Изображение")
+    fallback_image_url = models.URLField(max_length=500, blank=True, verbose_name="Запасное изображение",
+                                         help_text="Показывается, пока у товара нет своей фотографии")
     availability = models.CharField(max_length=20, choices=AVAILABILITY_CHOICES, default='available', verbose_name="Наличие")
     featured = models.BooleanField(default=False, verbose_name="Рекомендуемый")
     specifications = models.JSONField(default=dict, blank=True, verbose_name="Характеристики")
@@ -46,6 +101,17 @@ class Product(models.Model):
         verbose_name = "Товар"
         verbose_name_plural = "Товары"
         ordering = ['-created_at']
+        # Индексы под фильтры и сортировки каталога (store/views.py, ProductAdmin)
+        indexes = [
+            models.Index(fields=['name'], name='store_product_name_idx'),
+            models.Index(fields=['price'], name='store_product_price_idx'),
+            models.Index(fields=['-created_at', '-id'], name='store_product_created_idx'),
+            models.Index(fields=['featured', '-created_at'], name='store_product_featured_idx'),
+            models.Index(fields=['category', 'availability'], name='store_product_cat_avail_idx'),
+            models.Index(fields=['category', 'name'], name='store_product_cat_name_idx'),
+            models.Index(fields=['category', 'price'], name='store_product_cat_price_idx'),
+            models.Index(fields=['category', '-created_at', '-id'], name='store_product_cat_created_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -53,28 +119,399 @@ class Product(models.Model):
     def get_absolute_url(self):
         return reverse('store:product_detail', kwargs={'slug': self.slug})
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Значения фасетов из БД, чтобы при сохранении поправить счётчики FacetCount
+        if all(name in instance.__dict__ for name in cls.FACET_FIELDS):
+            instance._loaded_facet_key = facet_key(*(instance.__dict__[name] for name in cls.FACET_FIELDS))
+        # Поля списков из БД, чтобы не сбрасывать кеш списков при правке остальных полей
+        if all(name in instance.__dict__ for name in cls.LISTING_FIELDS):
+            instance._loaded_listing = instance.listing_values()
+        return instance
+
+    def listing_values(self):
+        return {
+            name: getattr(value, 'name', value) if name == 'image' else value
+            for name, value in ((name, self.__dict__[name]) for name in self.LISTING_FIELDS)
+        }
+
+    def listing_changes(self, update_fields=None):
+        """
+        Поля LISTING_FIELDS, изменённые с загрузки из БД.
+
+        Если товар загружен не со всеми полями списков, изменёнными считаются
+        сохраняемые update_fields, а без них — все поля списков.
+        """
+        loaded = getattr(self, '_loaded_listing', None)
+        if loaded is None:
+            if update_fields is None:
+                return set(self.LISTING_FIELDS)
+            return {self._meta.get_field(name).attname for name in update_fields} & set(self.LISTING_FIELDS)
+        return {name for name, value in self.listing_values().items() if loaded[name] != value}
+
     def save(self, *args, **kwargs):
+        if not self.fallback_image_url:
+            self.fallback_image_url = fallback_image_for(self.name)
         super().save(*args, **kwargs)
-        if self.image:
-            img = Image.open(self.image.path)
-            if img.height > 800 or img.width > 800:
-                output_size = (800, 800)
-                img.thumbnail(output_size)
-                img.save(self.image.path)
 
     @property
     def formatted_price(self):
         return f"{self.price:,.0f}".replace(',', ' ')
 
 
+class RollupQuerySet(models.QuerySet):
+    """
+    Таблица итогов: строки с ключом model.ROLLUP_KEY и счётчиками model.ROLLUP_VALUES.
+
+    Поля model.ROLLUP_ATTRIBUTES записываются только при создании строки.
+    """
+
+    def add(self, increments):
+        """
+        Прибавить приращения {ключ: {счётчик: приращение}}, создав недостающие строки.
+
+        Один INSERT ... ON CONFLICT DO UPDATE на все строки: без чтения перед
+        записью и без гонки между проверкой и вставкой строки.
+        """
+        if not increments:
+            return
+        # Как у QuerySet.update: база для записи, а не для чтения
+        self._for_write = True
+        connection = connections[self.db]
+        quote = connection.ops.quote_name
+        keys = [self.model._meta.get_field(name) for name in self.model.ROLLUP_KEY]
+        # Поля, которые задаются только при создании строки (описание ключа)
+        attributes = [self.model._meta.get_field(name) for name in getattr(self.model, 'ROLLUP_ATTRIBUTES', ())]
+        counters = [self.model._meta.get_field(name) for name in self.model.ROLLUP_VALUES]
+        fields = keys + attributes + counters
+        rows = [
+            [
+                field.get_db_prep_save(value, connection)
+                for field, value in zip(fields, (
+                    *key,
+                    *(values[field.name] for field in attributes),
+                    *(values.get(field.name, 0) for field in counters),
+                ))
+            ]
+            for key, values in increments.items()
+        ]
+
+        table = quote(self.model._meta.db_table)
+        row_sql = '(' + ', '.join(['%s'] * len(fields)) + ')'
+        update_sql = (
+            f' ON CONFLICT ({", ".join(quote(field.column) for field in keys)}) DO UPDATE SET '
+            + ', '.join(f'{quote(f.column)} = {table}.{quote(f.column)} + excluded.{quote(f.column)}' for f in counters)
+        )
+        # Пачки по числу параметров, которое принимает один запрос
+        batch_size = max(connection.ops.bulk_batch_size(fields, rows), 1)
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                cursor.execute(
+                    f'INSERT INTO {table} ({", ".join(quote(field.column) for field in fields)}) '
+                    f'VALUES {", ".join([row_sql] * len(batch))}' + update_sql,
+                    [param for row in batch for param in row],
+                )
+
+
+class FacetCount(models.Model):
+    """Количество товаров для комбинации значений фасетов"""
+    signature = models.CharField(max_length=40, unique=True, verbose_name="Комбинация")
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='+', verbose_name="Категория")
+    availability = models.CharField(max_length=20, verbose_name="Наличие")
+    price_bucket = models.PositiveSmallIntegerField(verbose_name="Ценовой диапазон")
+    specifications = models.JSONField(default=dict, blank=True, verbose_name="Характеристики")
+    count = models.IntegerField(default=0, verbose_name="Количество товаров")
+
+    ROLLUP_KEY = ('signature',)
+    ROLLUP_ATTRIBUTES = ('category', 'availability', 'price_bucket', 'specifications')
+    ROLLUP_VALUES = ('count',)
+    objects = RollupQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Счётчик фасетов"
+        verbose_name_plural = "Счётчики фасетов"
+
+    def __str__(self):
+        return f"{self.signature}: {self.count}"
+
+
+class ProductSearchEntry(models.Model):
+    """Строка поискового индекса FTS5: таблицу создаёт и наполняет store.search"""
+    product = models.OneToOneField(
+        Product, primary_key=True, db_column='rowid', db_constraint=False,
+        on_delete=models.DO_NOTHING, related_name='search_entry', verbose_name="Товар",
+    )
+
+    class Meta:
+        managed = False
+        db_table = 'store_product_fts'
+        verbose_name = "Запись поискового индекса"
+        verbose_name_plural = "Поисковый индекс"
+
+
+class ImageJob(models.Model):
+    """Задание фоновой обработки изображения товара или категории"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    SUPERSEDED = 'superseded'
+    STATUS_CHOICES = [
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+        (SUPERSEDED, 'Заменено новым изображением'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, null=True, blank=True, related_name='image_jobs', verbose_name="Товар")
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True, related_name='image_jobs', verbose_name="Категория")
+    image_name = models.CharField(max_length=255, verbose_name="Файл")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING, verbose_name="Статус")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Попытки")
+    error = models.TextField(blank=True, verbose_name="Ошибка")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Начало обработки")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Окончание обработки")
+
+    class Meta:
+        verbose_name = "Обработка изображения"
+        verbose_name_plural = "Обработка изображений"
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='store_imagejob_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.image_name} ({self.get_status_display()})"
+
+    @property
+    def owner(self):
+        return self.product or self.category
+
+
+class ImageRendition(models.Model):
+    """Уменьшенная копия изображения товара или категории заданной ширины и формата"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, null=True, blank=True, related_name='renditions', verbose_name="Товар")
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True, related_name='renditions', verbose_name="Категория")
+    name = models.CharField(max_length=20, verbose_name="Вариант")
+    format = models.CharField(max_length=10, verbose_name="Формат")
+    file = models.FileField(max_length=255, verbose_name="Файл")
+    width = models.PositiveIntegerField(verbose_name="Ширина")
+    height = models.PositiveIntegerField(verbose_name="Высота")
+    size = models.PositiveIntegerField(verbose_name="Размер, байт")
+    source_name = models.CharField(max_length=255, verbose_name="Исходный файл")
+
+    class Meta:
+        verbose_name = "Вариант изображения"
+        verbose_name_plural = "Варианты изображений"
+        ordering = ['width']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'name', 'format'], condition=Q(product__isnull=False),
+                                    name='store_rendition_product_uniq'),
+            models.UniqueConstraint(fields=['category', 'name', 'format'], condition=Q(category__isnull=False),
+                                    name='store_rendition_category_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.file.name} {self.width}×{self.height}"
+
+
+class StockQuerySet(models.QuerySet):
+    """Условные атомарные изменения остатков: каждая операция — один UPDATE"""
+
+    def reserve(self, product_id, quantity):
+        """Зарезервировать quantity единиц, если столько свободно"""
+        return bool(self.filter(
+            product_id=product_id, on_hand__gte=F('reserved') + quantity,
+        ).update(reserved=F('reserved') + quantity))
+
+    def reserve_many(self, quantities):
+        """Зарезервировать по словарю {product_id: количество}; число строк, где хватило остатка"""
+        if not quantities:
+            return 0
+        amount = _per_product(quantities)
+        return self.filter(
+            product_id__in=quantities, on_hand__gte=F('reserved') + amount,
+        ).update(reserved=F('reserved') + amount)
+
+    def release(self, quantities):
+        """Снять резерв по словарю {product_id: количество}"""
+        if not quantities:
+            return 0
+        amount = _per_product(quantities)
+        return self.filter(product_id__in=quantities).update(reserved=Greatest(F('reserved') - amount, 0))
+
+    def take(self, quantities):
+        """
+        Списать остатки по словарю {product_id: количество}.
+
+        Строка обновляется, только если свободного остатка хватает; по числу
+        обновлённых строк вызывающий код понимает, удалось ли списать всё.
+        """
+        if not quantities:
+            return 0
+        amount = _per_product(quantities)
+        return self.filter(
+            product_id__in=quantities, on_hand__gte=F('reserved') + amount,
+        ).update(on_hand=F('on_hand') - amount)
+
+    def sync_availability(self, product_ids):
+        """Вывести Product.availability из свободного остатка (товары под предзаказ не трогаем)"""
+        for stock in self.filter(product_id__in=product_ids).select_related('product'):
+            product = stock.product
+            derived = 'available' if stock.available > 0 else 'out_of_stock'
+            if product.availability in (derived, 'pre_order'):
+                continue
+            product.availability = derived
+            product.save(update_fields=['availability', 'updated_at'])
+
+
+def _per_product(quantities):
+    return Case(
+        *[When(product_id=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+        default=Value(0),
+        output_field=models.IntegerField(),
+    )
+
+
+class Stock(models.Model):
+    """Складской остаток товара; товары без строки остатка не учитываются"""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='stock', verbose_name="Товар")
+    on_hand = models.PositiveIntegerField(default=0, verbose_name="На складе")
+    reserved = models.PositiveIntegerField(default=0, verbose_name="В резерве")
+
+    objects = StockQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Остаток"
+        verbose_name_plural = "Остатки"
+        constraints = [
+            models.CheckConstraint(check=Q(reserved__lte=F('on_hand')), name='store_stock_reserved_lte_on_hand'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}: {self.available} из {self.on_hand}"
+
+    def clean(self):
+        if self.reserved > self.on_hand:
+            raise ValidationError({'on_hand': f'Под корзины зарезервировано {self.reserved} шт.'})
+
+    @property
+    def available(self):
+        return self.on_hand - self.reserved
+
+
+def _stock_tracked(product):
+    """Учитывается ли остаток товара: по аннотации stock_tracked или select_related('stock'), иначе None"""
+    tracked = getattr(product, 'stock_tracked', None)
+    if tracked is None and Product.stock.is_cached(product):
+        tracked = Product.stock.related.get_cached_value(product) is not None
+    return tracked
+
+
+class StockReservationQuerySet(models.QuerySet):
+    def release_expired(self, now=None):
+        """Удалить истёкшие резервы и вернуть их количество в свободный остаток"""
+        return self.filter(expires_at__lte=now or timezone.now()).release()
+
+    def release(self):
+        """Удалить резервы выборки и вернуть их количество в свободный остаток"""
+        with transaction.atomic():
+            rows = list(self.select_for_update().values_list('id', 'product_id', 'quantity'))
+            if not rows:
+                return 0
+            quantities = defaultdict(int)
+            for _, product_id, quantity in rows:
+                quantities[product_id] += quantity
+            Stock.objects.release(quantities)
+            self.filter(id__in=[row[0] for row in rows]).delete()
+            Stock.objects.sync_availability(quantities)
+        return sum(quantities.values())
+
+
+class StockReservation(models.Model):
+    """Временный резерв товара под корзину; Stock.reserved — сумма всех резервов товара"""
+    cart = models.ForeignKey('Cart', on_delete=models.CASCADE, related_name='reservations', verbose_name="Корзина")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+', verbose_name="Товар")
+    quantity = models.PositiveIntegerField(verbose_name="Количество")
+    expires_at = models.DateTimeField(verbose_name="Действует до")
+
+    objects = StockReservationQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Резерв"
+        verbose_name_plural = "Резервы"
+        unique_together = ['cart', 'product']
+        indexes = [
+            models.Index(fields=['expires_at'], name='store_reservation_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} x {self.quantity} до {self.expires_at:%H:%M}"
+
+
+class CartQuerySet(models.QuerySet):
+    def stale(self, empty_for=timedelta(days=1), abandoned_for=timedelta(days=30), now=None):
+        """Пустые корзины, не менявшиеся empty_for, и анонимные корзины, брошенные на abandoned_for"""
+        now = now or timezone.now()
+        return self.filter(
+            Q(items_count=0, updated_at__lt=now - empty_for)
+            | Q(user__isnull=True, updated_at__lt=now - abandoned_for)
+        )
+
+    def purge(self, batch_size=1000):
+        """
+        Удалить корзины выборки пачками по batch_size; число удалённых корзин.
+
+        Резервы удаляемых корзин возвращаются в остаток, каждая пачка — отдельная
+        транзакция, чтобы не держать блокировку записи на всё время чистки.
+        """
+        deleted = 0
+        while True:
+            ids = list(self.order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                return deleted
+            with transaction.atomic():
+                StockReservation.objects.filter(cart_id__in=ids).release()
+                CartItem.objects.filter(cart_id__in=ids).delete()
+                Cart.objects.filter(pk__in=ids).delete()
+            deleted += len(ids)
+
+    def recalculate_totals(self):
+        """Пересчитать сохранённые итоги корзин одним UPDATE с подзапросами"""
+        items = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+        line_total = ExpressionWrapper(
+            F('quantity') * F('product__price'),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        )
+        return self.update(
+            items_count=Coalesce(Subquery(items.annotate(total=Sum('quantity')).values('total')), 0),
+            subtotal=Coalesce(
+                Subquery(items.annotate(total=Sum(line_total)).values('total')),
+                Value(0, output_field=DecimalField(max_digits=12, decimal_places=2)),
+            ),
+        )
+
+
 class Cart(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, verbose_name="Пользователь")
     session_key = models.CharField(max_length=40, null=True, blank=True, verbose_name="Сессия")
+    items_count = models.PositiveIntegerField(default=0, verbose_name="Количество товаров")
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Сумма (₽)")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Последнее изменение")
+
+    objects = CartQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Корзина"
         verbose_name_plural = "Корзины"
+        indexes = [
+            models.Index(fields=['session_key'], name='store_cart_session_idx'),
+            models.Index(fields=['updated_at'], name='store_cart_updated_idx'),
+        ]
 
     def __str__(self):
         if self.user:
@@ -83,11 +520,243 @@ class Cart(models.Model):
 
     @property
     def total_price(self):
-        return sum(item.total_price for item in self.items.all())
+        return self.subtotal
 
     @property
     def total_items(self):
-        return sum(item.quantity for item in self.items.all())
+        return self.items_count
+
+    def apply_delta(self, quantity, amount):
+        """Инкрементально обновить сохранённые итоги корзины"""
+        Cart.objects.filter(pk=self.pk).update(
+            items_count=F('items_count') + quantity,
+            subtotal=F('subtotal') + amount,
+            updated_at=timezone.now(),
+        )
+        self.items_count += quantity
+        self.subtotal += amount
+
+    def add_product(self, product, quantity=1):
+        """Добавить товар в корзину одним INSERT ... ON CONFLICT DO UPDATE"""
+        with transaction.atomic():
+            CartItem.objects.add_quantity(self.pk, product.pk, quantity)
+            self.reserve_stock(product, quantity)
+            self.apply_delta(quantity, product.price * quantity)
+
+    def reserve_stock(self, product, quantity):
+        """
+        Изменить резерв корзины на товар на quantity единиц (отрицательное — снять).
+
+        Товары без строки Stock не учитываются; при нехватке остатка — InsufficientStock.
+        """
+        if not quantity or not getattr(settings, 'STORE_RESERVE_ON_ADD_TO_CART', True):
+            return
+        reservations = StockReservation.objects.filter(cart=self, product_id=product.pk)
+        if quantity > 0:
+            tracked = _stock_tracked(product)
+            if tracked is False:
+                return
+            if not Stock.objects.reserve(product.pk, quantity):
+                # Признак учёта неизвестен — отличаем нехватку от товара без Stock отдельным запросом
+                if tracked or Stock.objects.filter(product_id=product.pk).exists():
+                    raise InsufficientStock([product.name])
+                return
+            expires_at = timezone.now() + timedelta(seconds=getattr(settings, 'STORE_RESERVATION_TTL', 900))
+            if not reservations.update(quantity=F('quantity') + quantity, expires_at=expires_at):
+                StockReservation.objects.create(
+                    cart=self, product_id=product.pk, quantity=quantity, expires_at=expires_at,
+                )
+        else:
+            reservation = reservations.first()
+            if reservation is None:
+                return
+            # Резерв мог частично истечь и вернуться в остаток — снимаем не больше, чем держим
+            released = min(reservation.quantity, -quantity)
+            Stock.objects.release({product.pk: released})
+            if released == reservation.quantity:
+                reservations.delete()
+            else:
+                reservations.update(quantity=F('quantity') - released)
+        Stock.objects.sync_availability([product.pk])
+
+    def reserve_stock_many(self, deltas, products):
+        """
+        Изменить резервы корзины по словарю {product_id: изменение}; products — товары по id.
+
+        Число запросов не зависит от числа товаров: остатки и резервы читаются
+        одним запросом каждые, резерв и снятие — по одному UPDATE, строки резервов
+        пишутся пачками, наличие выводится заново один раз. Вызывается внутри
+        транзакции, которая уже держит блокировку на запись; при нехватке —
+        InsufficientStock со всеми товарами, которым не хватило.
+        """
+        if not getattr(settings, 'STORE_RESERVE_ON_ADD_TO_CART', True):
+            return
+        stock = {
+            product_id: on_hand - reserved
+            for product_id, on_hand, reserved in Stock.objects.filter(
+                product_id__in=[product_id for product_id, delta in deltas.items() if delta],
+            ).values_list('product_id', 'on_hand', 'reserved')
+        }
+        if not stock:
+            return
+        reserve = {product_id: deltas[product_id] for product_id in stock if deltas[product_id] > 0}
+        short = [products[product_id].name for product_id, delta in reserve.items() if stock[product_id] < delta]
+        if short or Stock.objects.reserve_many(reserve) < len(reserve):
+            raise InsufficientStock(short or [products[product_id].name for product_id in reserve])
+
+        reservations = {
+            reservation.product_id: reservation
+            for reservation in StockReservation.objects.filter(cart=self, product_id__in=stock)
+        }
+        expires_at = timezone.now() + timedelta(seconds=getattr(settings, 'STORE_RESERVATION_TTL', 900))
+        new, changed, removed, released = [], [], [], {}
+        for product_id in stock:
+            delta, reservation = deltas[product_id], reservations.get(product_id)
+            if delta > 0 and reservation is None:
+                new.append(StockReservation(cart=self, product_id=product_id, quantity=delta, expires_at=expires_at))
+            elif delta > 0:
+                reservation.quantity += delta
+                reservation.expires_at = expires_at
+                changed.append(reservation)
+            elif reservation is not None:
+                # Резерв мог частично истечь и вернуться в остаток — снимаем не больше, чем держим
+                released[product_id] = min(reservation.quantity, -delta)
+                reservation.quantity -= released[product_id]
+                (changed if reservation.quantity else removed).append(reservation)
+        Stock.objects.release(released)
+        StockReservation.objects.bulk_create(new)
+        StockReservation.objects.bulk_update(changed, ['quantity', 'expires_at'])
+        StockReservation.objects.filter(pk__in=[reservation.pk for reservation in removed]).delete()
+        Stock.objects.sync_availability(list(stock))
+
+    def release_reservations(self, sync=True):
+        """
+        Вернуть все резервы корзины в свободный остаток.
+
+        С sync наличие освобождённых товаров выводится заново, как при резерве;
+        оформление заказа сверяет его само после списания.
+        """
+        reservations = StockReservation.objects.filter(cart=self)
+        quantity = reservations.filter(product=OuterRef('product')).values('quantity')[:1]
+        Stock.objects.filter(product__in=reservations.values('product')).update(
+            reserved=F('reserved') - Subquery(quantity),
+        )
+        product_ids = list(reservations.values_list('product_id', flat=True)) if sync else []
+        reservations.delete()
+        Stock.objects.sync_availability(product_ids)
+
+    def checkout(self, user=None, **customer):
+        """
+        Оформить заказ по содержимому корзины одной транзакцией.
+
+        Позиции читаются вместе с товарами одним запросом с блокировкой строк,
+        позиции заказа создаются одним bulk_create, число запросов не зависит от
+        размера корзины.
+        """
+        prices_changed = False
+        with transaction.atomic():
+            # Первый оператор транзакции — запись: SQLite сразу берёт блокировку на запись,
+            # и конкурирующие оформления ждут её, а не получают SQLITE_BUSY при повышении
+            self.release_reservations(sync=False)
+            items = list(
+                self.items.select_related('product__stock')
+                .select_for_update(of=('self', 'product'))
+                .order_by('pk')
+            )
+            if not items:
+                raise CheckoutError('Ваша корзина пуста')
+
+            tracked = {item.product_id: item.quantity for item in items if hasattr(item.product, 'stock')}
+            unavailable = [
+                item.product.name for item in items
+                if item.product_id not in tracked and item.product.availability == 'out_of_stock'
+            ]
+            if unavailable:
+                raise CheckoutError('Нет в наличии: ' + ', '.join(unavailable))
+
+            total = sum((item.product.price * item.quantity for item in items), Decimal(0))
+            items_count = sum(item.quantity for item in items)
+            if total != self.subtotal or items_count != self.items_count:
+                # Итоги корзины посчитаны по старым ценам — заказ не оформляем, а откат
+                # транзакции возвращает корзине снятые резервы
+                prices_changed = True
+                transaction.set_rollback(True)
+            else:
+                if Stock.objects.take(tracked) != len(tracked):
+                    # Откат транзакции вернёт и снятые резервы корзины
+                    raise InsufficientStock([
+                        item.product.name for item in items
+                        if item.product_id in tracked and item.product.stock.available < item.quantity
+                    ] or [item.product.name for item in items if item.product_id in tracked])
+                order = Order.objects.create(user=user, total_amount=total, **customer)
+                OrderItem.objects.bulk_create([
+                    OrderItem(order=order, product=item.product, price=item.product.price, quantity=item.quantity)
+                    for item in items
+                ])
+                order.add_to_sales([
+                    (item.product_id, item.product.category_id, item.product.price, item.quantity) for item in items
+                ])
+                self._delete_items()
+                Stock.objects.sync_availability(tracked)
+
+        if prices_changed:
+            Cart.objects.filter(pk=self.pk).recalculate_totals()
+            self.refresh_from_db(fields=['items_count', 'subtotal'])
+            raise CheckoutError('Цены товаров в корзине изменились, проверьте сумму заказа')
+        return order
+
+    def merge(self, other):
+        """
+        Перенести товары другой корзины в эту и удалить её (вход анонимного посетителя).
+
+        Резервы другой корзины снимаются до переноса, чтобы не держать товар дважды;
+        товары, которых уже не хватает на складе, не переносятся.
+        """
+        with transaction.atomic():
+            other.release_reservations()
+            for item in other.items.select_related('product').order_by('pk'):
+                try:
+                    with transaction.atomic():
+                        self.add_product(item.product, item.quantity)
+                except InsufficientStock:
+                    continue
+            Cart.objects.filter(pk=other.pk).purge()
+
+    def clear(self):
+        """Удалить все товары и обнулить итоги"""
+        with transaction.atomic():
+            self.release_reservations()
+            self._delete_items()
+
+    def _delete_items(self):
+        CartItem.objects.filter(cart=self).delete()
+        Cart.objects.filter(pk=self.pk).update(items_count=0, subtotal=0, updated_at=timezone.now())
+        self.items_count = 0
+        self.subtotal = 0
+
+
+class CartItemQuerySet(models.QuerySet):
+    def add_quantity(self, cart_id, product_id, quantity):
+        """
+        Прибавить quantity к строке корзины, создав её, если товара в корзине нет.
+
+        Один INSERT ... ON CONFLICT DO UPDATE, как в RollupQuerySet.add: два
+        одновременных первых добавления товара не сталкиваются на (cart, product).
+        """
+        # Как у QuerySet.update: база для записи, а не для чтения
+        self._for_write = True
+        connection = connections[self.db]
+        quote = connection.ops.quote_name
+        fields = [self.model._meta.get_field(name) for name in ('cart', 'product', 'quantity', 'created_at')]
+        table = quote(self.model._meta.db_table)
+        column = quote(fields[2].column)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ({", ".join(quote(field.column) for field in fields)}) '
+                f'VALUES (%s, %s, %s, %s) ON CONFLICT ({quote(fields[0].column)}, {quote(fields[1].column)}) '
+                f'DO UPDATE SET {column} = {table}.{column} + excluded.{column}',
+                [cart_id, product_id, quantity, fields[3].get_db_prep_save(timezone.now(), connection)],
+            )
 
 
 class CartItem(models.Model):
@@ -96,6 +765,8 @@ class CartItem(models.Model):
     quantity = models.PositiveIntegerField(default=1, verbose_name="Количество")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата добавления")
 
+    objects = CartItemQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Товар в корзине"
         verbose_name_plural = "Товары в корзине"
@@ -104,6 +775,32 @@ class CartItem(models.Model):
     def __str__(self):
         return f"{self.product.name} x {self.quantity}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем количество из БД, чтобы при сохранении применить разницу
+        instance._loaded_quantity = instance.__dict__.get('quantity', 0)
+        return instance
+
+    def save(self, *args, **kwargs):
+        previous = getattr(self, '_loaded_quantity', 0) if not self._state.adding else 0
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            delta = self.quantity - previous
+            if delta:
+                self.cart.reserve_stock(self.product, delta)
+                self.cart.apply_delta(delta, self.product.price * delta)
+        self._loaded_quantity = self.quantity
+
+    def delete(self, *args, **kwargs):
+        quantity = getattr(self, '_loaded_quantity', self.quantity)
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            if quantity:
+                self.cart.reserve_stock(self.product, -quantity)
+                self.cart.apply_delta(-quantity, -self.product.price * quantity)
+        return result
+
     @property
     def total_price(self):
         return self.product.price * self.quantity
@@ -133,10 +830,43 @@ class Order(models.Model):
         verbose_name = "Заказ"
         verbose_name_plural = "Заказы"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at'], name='store_order_created_idx'),
+            models.Index(fields=['status', '-created_at'], name='store_order_status_idx'),
+        ]
 
     def __str__(self):
         return f"Заказ #{self.id} от {self.created_at.strftime('%d.%m.%Y')}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Статус из БД: при его смене заказ переносится в дневных итогах продаж
+        if 'status' in instance.__dict__:
+            instance._loaded_status = instance.status
+        return instance
+
+    def sales_lines(self):
+        """Позиции для итогов продаж: (product_id, category_id, цена, количество)"""
+        return list(self.items.values_list('product_id', 'product__category_id', 'price', 'quantity'))
+
+    def add_to_sales(self, lines, sign=1, status=None):
+        """Прибавить заказ к дневным итогам продаж статуса status (sign=-1 — вычесть)"""
+        day = timezone.localdate(self.created_at)
+        status = status or self.status
+        products = defaultdict(lambda: {'orders': sign, 'units': 0, 'revenue': Decimal(0)})
+        for product_id, category_id, price, quantity in lines:
+            row = products[day, status, product_id, category_id]
+            row['units'] += sign * quantity
+            row['revenue'] += sign * price * quantity
+        DailySales.objects.add({(day, status): {
+            'orders': sign,
+            'units': sum(row['units'] for row in products.values()),
+            'revenue': sign * self.total_amount,
+        }})
+        DailyProductSales.objects.add(products)
+        self._loaded_status = self.status
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items', verbose_name="Заказ")
@@ -154,3 +884,111 @@ class OrderItem(models.Model):
     @property
     def total_price(self):
         return self.price * self.quantity
+
+
+# Итоги продаж для отчётов
+
+class DailySales(models.Model):
+    """Заказы за день в одном статусе: число, единицы товара и выручка"""
+    day = models.DateField(verbose_name="День")
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES, verbose_name="Статус")
+    orders = models.IntegerField(default=0, verbose_name="Заказов")
+    units = models.IntegerField(default=0, verbose_name="Единиц товара")
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Выручка (₽)")
+
+    ROLLUP_KEY = ('day', 'status')
+    ROLLUP_VALUES = ('orders', 'units', 'revenue')
+    objects = RollupQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Продажи за день"
+        verbose_name_plural = "Продажи"
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'status'], name='store_dailysales_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.day:%d.%m.%Y} {self.status}: {self.orders}"
+
+
+class DailyProductSales(models.Model):
+    """Продажи товара за день в одном статусе; категория — на момент продажи"""
+    day = models.DateField(verbose_name="День")
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES, verbose_name="Статус")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+', verbose_name="Товар")
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='+', verbose_name="Категория")
+    orders = models.IntegerField(default=0, verbose_name="Заказов")
+    units = models.IntegerField(default=0, verbose_name="Единиц товара")
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Выручка (₽)")
+
+    ROLLUP_KEY = ('day', 'status', 'product', 'category')
+    ROLLUP_VALUES = ('orders', 'units', 'revenue')
+    objects = RollupQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Продажи товара за день"
+        verbose_name_plural = "Продажи товаров"
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'status', 'product', 'category'], name='store_dailyproductsales_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.day:%d.%m.%Y} {self.product_id}: {self.units}"
+
+
+class DailyCarts(models.Model):
+    """Корзины, созданные за день, — знаменатель конверсии в заказы"""
+    day = models.DateField(unique=True, verbose_name="День")
+    carts = models.IntegerField(default=0, verbose_name="Корзин")
+
+    ROLLUP_KEY = ('day',)
+    ROLLUP_VALUES = ('carts',)
+    objects = RollupQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Корзины за день"
+        verbose_name_plural = "Корзины по дням"
+
+    def __str__(self):
+        return f"{self.day:%d.%m.%Y}: {self.carts}"
+
+
+# Рекомендации по совместным покупкам
+
+class CoPurchase(models.Model):
+    """Число заказов, в которых два товара куплены вместе; пара хранится в обе стороны"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+', verbose_name="Товар")
+    other = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+', verbose_name="Куплен вместе с")
+    orders = models.IntegerField(default=0, verbose_name="Заказов")
+
+    ROLLUP_KEY = ('product', 'other')
+    ROLLUP_VALUES = ('orders',)
+    objects = RollupQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Совместная покупка"
+        verbose_name_plural = "Совместные покупки"
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'other'], name='store_copurchase_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} + {self.other_id}: {self.orders}"
+
+
+class Recommendation(models.Model):
+    """Сосед товара из top-K по совместным покупкам; rank 1 — самый частый"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommendations', verbose_name="Товар")
+    recommended = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommended_for', verbose_name="Рекомендуемый товар")
+    rank = models.PositiveSmallIntegerField(verbose_name="Место")
+    score = models.IntegerField(verbose_name="Заказов вместе")
+
+    class Meta:
+        verbose_name = "Рекомендация"
+        verbose_name_plural = "Рекомендации"
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='store_recommendation_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} → {self.recommended_id} (#{self.rank})"
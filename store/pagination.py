@@ -0,0 +1,163 @@
+"""
+Курсорная (keyset) пагинация и кешированный подсчёт товаров.
+
+Курсор хранит значения ключа сортировки последнего или первого товара страницы,
+поэтому следующая страница выбирается условием WHERE (ключ) > (значения) без
+OFFSET и без COUNT(*) на каждый запрос.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+# Ключи сортировки: последний элемент — id как уникальный тай-брейкер
+SORT_KEYS = {
+    'name': ('name', 'id'),
+    'price_asc': ('price', 'id'),
+    'price_desc': ('-price', '-id'),
+    'newest': ('-created_at', '-id'),
+}
+
+CURSOR_SALT = 'store.pagination.cursor'
+
+
+def use_cursor_pagination(request):
+    """Курсорный режим включается явно: ?paginate=cursor, ?cursor=... или ?format=json"""
+    if request.GET.get('paginate') == 'offset':
+        return False
+    return (
+        getattr(settings, 'STORE_CURSOR_PAGINATION', False)
+        or request.GET.get('paginate') == 'cursor'
+        or 'cursor' in request.GET
+        or request.GET.get('format') == 'json'
+    )
+
+
+def cached_count(queryset, timeout=None):
+    """COUNT(*) по выборке, закешированный по тексту SQL-запроса"""
+    if timeout is None:
+        timeout = getattr(settings, 'STORE_COUNT_CACHE_TIMEOUT', 300)
+    sql, params = queryset.order_by().query.sql_with_params()
+    key = 'store:count:' + hashlib.md5(f'{sql}|{params}'.encode()).hexdigest()
+    return cache.get_or_set(key, queryset.count, timeout)
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator с COUNT(*) из cached_count: списки админки по большим таблицам
+    не считают строки заново при каждом переходе по страницам.
+    """
+
+    @cached_property
+    def count(self):
+        return cached_count(self.object_list)
+
+
+class CursorPage:
+    """Страница курсорной пагинации"""
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+class CursorPaginator:
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.ordering = ordering
+        self.per_page = per_page
+        self.fields = [name.lstrip('-') for name in ordering]
+
+    def encode_cursor(self, obj, direction):
+        # Строки .values() — словари, остальное — экземпляры модели
+        values = [obj[name] if isinstance(obj, dict) else getattr(obj, name) for name in self.fields]
+        encoder = DjangoJSONEncoder()
+        values = [value if isinstance(value, (str, int)) else encoder.default(value) for value in values]
+        return signing.dumps({'v': values, 'd': direction}, salt=CURSOR_SALT, compress=True)
+
+    def decode_cursor(self, cursor):
+        """Значения ключа и направление; None для первой страницы или битого курсора"""
+        if not cursor:
+            return None
+        try:
+            payload = signing.loads(cursor, salt=CURSOR_SALT)
+            model_fields = [self.queryset.model._meta.get_field(name) for name in self.fields]
+            values = [field.to_python(value) for field, value in zip(model_fields, payload['v'])]
+        except (signing.BadSignature, KeyError, TypeError, ValueError):
+            return None
+        if len(values) != len(self.fields) or payload.get('d') not in ('n', 'p'):
+            return None
+        return values, payload['d']
+
+    def _seek(self, values, reverse):
+        """Условие «строго после values» для составного ключа сортировки"""
+        condition = Q()
+        for index, name in enumerate(self.ordering):
+            descending = name.startswith('-') != reverse
+            lookup = 'lt' if descending else 'gt'
+            step = Q(**{f'{self.fields[index]}__{lookup}': values[index]})
+            for prev in range(index):
+                step &= Q(**{self.fields[prev]: values[prev]})
+            condition |= step
+        return condition
+
+    def page(self, cursor=None):
+        decoded = self.decode_cursor(cursor)
+        queryset = self.queryset
+        backwards = decoded is not None and decoded[1] == 'p'
+
+        if backwards:
+            reverse_ordering = [name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering]
+            queryset = queryset.filter(self._seek(decoded[0], reverse=True)).order_by(*reverse_ordering)
+        else:
+            if decoded is not None:
+                queryset = queryset.filter(self._seek(decoded[0], reverse=False))
+            queryset = queryset.order_by(*self.ordering)
+
+        # Берём на один элемент больше, чтобы узнать, есть ли ещё страница
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+
+        if not rows:
+            return CursorPage([], None, None)
+
+        if backwards:
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, decoded is not None
+
+        return CursorPage(
+            rows,
+            self.encode_cursor(rows[-1], 'n') if has_next else None,
+            self.encode_cursor(rows[0], 'p') if has_previous else None,
+        )
@@ -0,0 +1,141 @@
+"""
+Рекомендации «С этим товаром покупают» по истории заказов.
+
+CoPurchase — разреженная матрица совместных покупок: для каждой пары товаров
+из одного заказа хранится число таких заказов, в обе стороны. Новый заказ
+после коммита прибавляет свои пары одним upsert и пересобирает top-K соседей
+своих товаров в Recommendation — число запросов не зависит от размера заказа.
+rebuild_co_purchases строит матрицу заново одним проходом по позициям,
+упорядоченным по заказу: в памяти держатся только пары, накопленные до
+очередного сброса в базу (max_pairs).
+
+Страницы читают Recommendation одним запросом по индексу (product, rank)
+и добирают товары той же категории, если истории покупок мало.
+"""
+from collections import Counter
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum, Window
+from django.db.models.functions import RowNumber
+
+from .caching import bump_version, get_version
+from .models import CoPurchase, OrderItem, Product, Recommendation
+
+
+def top_k():
+    return getattr(settings, 'STORE_RECOMMENDATIONS_TOP_K', 8)
+
+
+def add_basket(product_ids, counts):
+    """Прибавить к counts пары товаров одного заказа"""
+    products = sorted(set(product_ids))
+    # Оптовые заказы дают квадратичное число пар и мало говорят о сочетаемости товаров
+    if len(products) > getattr(settings, 'STORE_RECOMMENDATIONS_MAX_BASKET', 50):
+        return
+    for product_id in products:
+        for other_id in products:
+            if product_id != other_id:
+                counts[product_id, other_id] += 1
+
+
+def _flush(counts):
+    CoPurchase.objects.add({pair: {'orders': orders} for pair, orders in counts.items()})
+    counts.clear()
+
+
+def refresh_recommendations(product_ids=None, batch_size=2000):
+    """Пересобрать top-K соседей товаров product_ids (всех товаров, если None) по CoPurchase"""
+    ranked = CoPurchase.objects.annotate(
+        rank=Window(RowNumber(), partition_by=[F('product_id')], order_by=[F('orders').desc(), F('other_id').asc()]),
+    )
+    recommendations = Recommendation.objects.all()
+    if product_ids is not None:
+        ranked = ranked.filter(product_id__in=product_ids)
+        recommendations = recommendations.filter(product_id__in=product_ids)
+    rows = (
+        ranked.filter(rank__lte=top_k())
+        .values_list('product_id', 'other_id', 'rank', 'orders').iterator(chunk_size=batch_size)
+    )
+    with transaction.atomic():
+        recommendations.delete()
+        batch, created = [], 0
+        for product_id, other_id, rank, orders in rows:
+            batch.append(Recommendation(product_id=product_id, recommended_id=other_id, rank=rank, score=orders))
+            if len(batch) >= batch_size:
+                created += len(Recommendation.objects.bulk_create(batch))
+                batch = []
+        created += len(Recommendation.objects.bulk_create(batch))
+    return created
+
+
+def record_order(order_id):
+    """Учесть новый заказ: пары его товаров и их соседей"""
+    product_ids = set(OrderItem.objects.filter(order_id=order_id).values_list('product_id', flat=True))
+    counts = Counter()
+    add_basket(product_ids, counts)
+    if not counts:
+        return
+    with transaction.atomic():
+        _flush(counts)
+        refresh_recommendations(product_ids)
+    for product_id in product_ids:
+        bump_version('recommendations', product_id)
+
+
+def rebuild_co_purchases(batch_size=5000, max_pairs=200000):
+    """Построить матрицу совместных покупок и рекомендации заново; число пар и рекомендаций"""
+    items = OrderItem.objects.order_by('order_id').values_list('order_id', 'product_id').iterator(chunk_size=batch_size)
+    counts = Counter()
+    with transaction.atomic():
+        CoPurchase.objects.all().delete()
+        for _, lines in groupby(items, key=itemgetter(0)):
+            add_basket([product_id for _, product_id in lines], counts)
+            if len(counts) >= max_pairs:
+                _flush(counts)
+        _flush(counts)
+        created = refresh_recommendations(batch_size=batch_size)
+    bump_version('recommendations')
+    return {'pairs': CoPurchase.objects.count(), 'recommendations': created}
+
+
+def recommendations_version(product_id):
+    """Часть ключа кеша: меняется при пересборке всех рекомендаций и соседей товара"""
+    return f"{get_version('recommendations')}.{get_version('recommendations', product_id)}"
+
+
+def recommended_products(product, limit=4):
+    """Соседи товара по совместным покупкам, дополненные товарами его категории"""
+    products = list(
+        Product.objects.filter(recommended_for__product=product)
+        .order_by('recommended_for__rank').prefetch_related('renditions')[:limit]
+    )
+    if len(products) < limit:
+        products += (
+            Product.objects.filter(category_id=product.category_id)
+            .exclude(id__in=[product.id, *(p.id for p in products)])
+            .prefetch_related('renditions')[:limit - len(products)]
+        )
+    return products
+
+
+def cart_recommendations(product_ids, limit=4):
+    """Товары, которые чаще всего покупают вместе с содержимым корзины"""
+    if not product_ids:
+        return []
+    products = list(
+        Product.objects.filter(recommended_for__product_id__in=product_ids)
+        .exclude(id__in=product_ids)
+        .annotate(together=Sum('recommended_for__score'))
+        .order_by('-together', 'id').prefetch_related('renditions')[:limit]
+    )
+    if len(products) < limit:
+        categories = Product.objects.filter(id__in=product_ids).values('category_id')
+        products += (
+            Product.objects.filter(category_id__in=categories, availability='available')
+            .exclude(id__in=[*product_ids, *(p.id for p in products)])
+            .prefetch_related('renditions')[:limit - len(products)]
+        )
+    return products
@@ -0,0 +1,307 @@
+"""
+Полнотекстовый поиск по каталогу.
+
+Бэкенд выбирается настройкой STORE_SEARCH_BACKEND. По умолчанию используется
+виртуальная таблица SQLite FTS5, в которую складываются уже стеммированные
+токены названия, категории, характеристик и описания товара.
+"""
+import re
+from functools import lru_cache
+from itertools import islice
+
+from django.conf import settings
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+
+# Стеммер Snowball для русского языка
+
+_VOWELS = 'аеиоуыэюя'
+_CYRILLIC = re.compile('[а-я]')
+_TOKEN = re.compile(r'\w+')
+
+_PERFECTIVE_GERUND_1 = ('в', 'вши', 'вшись')
+_PERFECTIVE_GERUND_2 = ('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись')
+_REFLEXIVE = ('ся', 'сь')
+_ADJECTIVE = (
+    'ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом',
+    'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею',
+)
+_PARTICIPLE_1 = ('ем', 'нн', 'вш', 'ющ', 'щ')
+_PARTICIPLE_2 = ('ивш', 'ывш', 'ующ')
+_VERB_1 = ('ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'ешь', 'нно')
+_VERB_2 = (
+    'ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым',
+    'ен', 'ило', 'ыло', 'ено', 'ят', 'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю',
+)
+_NOUN = (
+    'а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии', 'и', 'ией', 'ей', 'ой', 'ий',
+    'й', 'иям', 'ям', 'ием', 'ем', 'ам', 'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью',
+    'ю', 'ия', 'ья', 'я',
+)
+_SUPERLATIVE = ('ейше', 'ейш')
+_DERIVATIONAL = ('ость', 'ост')
+
+
+def _regions(word):
+    """Начало областей RV и R2 (индексы в слове)"""
+    rv = len(word)
+    for i, ch in enumerate(word):
+        if ch in _VOWELS:
+            rv = i + 1
+            break
+
+    def after_consonant(start):
+        for i in range(max(start, 1), len(word)):
+            if word[i] not in _VOWELS and word[i - 1] in _VOWELS and i - 1 >= start:
+                return i + 1
+        return len(word)
+
+    r1 = after_consonant(0)
+    return rv, after_consonant(r1)
+
+
+def _cut(rv, group1=(), group2=()):
+    """Отрезать самое длинное окончание; окончания group1 требуют 'а' или 'я' перед собой"""
+    best, conditional = '', False
+    for ending in group1:
+        if rv.endswith(ending) and len(ending) > len(best):
+            best, conditional = ending, True
+    for ending in group2:
+        if rv.endswith(ending) and len(ending) > len(best):
+            best, conditional = ending, False
+    if not best:
+        return rv, False
+    if conditional and (len(rv) == len(best) or rv[-len(best) - 1] not in 'ая'):
+        return rv, False
+    return rv[:-len(best)], True
+
+
+@lru_cache(maxsize=65536)
+def stem(word):
+    """Основа слова; латиница и числа возвращаются как есть в нижнем регистре"""
+    word = word.lower().replace('ё', 'е')
+    if not _CYRILLIC.search(word):
+        return word
+
+    rv_start, r2_start = _regions(word)
+    prefix, rv = word[:rv_start], word[rv_start:]
+
+    # Шаг 1: деепричастия, возвратные частицы, прилагательные, глаголы, существительные
+    rv, found = _cut(rv, _PERFECTIVE_GERUND_1, _PERFECTIVE_GERUND_2)
+    if not found:
+        rv, _ = _cut(rv, group2=_REFLEXIVE)
+        rv, found = _cut(rv, group2=_ADJECTIVE)
+        if found:
+            rv, _ = _cut(rv, _PARTICIPLE_1, _PARTICIPLE_2)
+        else:
+            rv, found = _cut(rv, _VERB_1, _VERB_2)
+            if not found:
+                rv, _ = _cut(rv, group2=_NOUN)
+
+    # Шаг 2
+    if rv.endswith('и'):
+        rv = rv[:-1]
+
+    # Шаг 3: словообразовательные суффиксы только в R2
+    for ending in _DERIVATIONAL:
+        if rv.endswith(ending) and len(prefix) + len(rv) - len(ending) >= r2_start:
+            rv = rv[:-len(ending)]
+            break
+
+    # Шаг 4
+    if rv.endswith('нн'):
+        rv = rv[:-1]
+    else:
+        rv, found = _cut(rv, group2=_SUPERLATIVE)
+        if found and rv.endswith('нн'):
+            rv = rv[:-1]
+        elif not found and rv.endswith('ь'):
+            rv = rv[:-1]
+
+    return prefix + rv
+
+
+def tokenize(text):
+    """Разбить текст на стеммированные токены"""
+    return [stem(token) for token in _TOKEN.findall(str(text))]
+
+
+def _specification_text(specifications):
+    if not isinstance(specifications, dict):
+        return ''
+    return ' '.join(str(value) for value in specifications.values())
+
+
+def build_document(name, category, specifications, description):
+    """Стеммированные поля документа в порядке колонок индекса"""
+    return (
+        ' '.join(tokenize(name)),
+        ' '.join(tokenize(category or '')),
+        ' '.join(tokenize(_specification_text(specifications))),
+        ' '.join(tokenize(description or '')),
+    )
+
+
+# Бэкенды
+
+class BaseSearchBackend:
+    """Интерфейс поискового бэкенда"""
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.using = using
+
+    def index_products(self, products):
+        raise NotImplementedError
+
+    def remove_products(self, product_ids):
+        raise NotImplementedError
+
+    def index_rows(self, rows):
+        """Добавить или заменить в индексе строки (id, name, category, specifications, description)"""
+        raise NotImplementedError
+
+    def rebuild(self, rows):
+        """Перестроить индекс по строкам (id, name, category, specifications, description)"""
+        raise NotImplementedError
+
+    def filter(self, queryset, query):
+        """Отфильтровать queryset товаров и аннотировать search_rank (меньше — релевантнее)"""
+        raise NotImplementedError
+
+    def _rows(self, queryset, chunk_size):
+        return queryset.values_list(
+            'id', 'name', 'category__name', 'specifications', 'description'
+        ).order_by().iterator(chunk_size=chunk_size)
+
+    def index_queryset(self, queryset, chunk_size=2000):
+        """Перестроить весь индекс по товарам queryset"""
+        return self.rebuild(self._rows(queryset, chunk_size))
+
+    def update_queryset(self, queryset, chunk_size=2000):
+        """Переиндексировать товары queryset, не трогая остальные"""
+        return self.index_rows(self._rows(queryset, chunk_size))
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """Поиск через icontains без индекса, для баз без FTS"""
+
+    def index_products(self, products):
+        pass
+
+    def remove_products(self, product_ids):
+        pass
+
+    def index_rows(self, rows):
+        return sum(1 for _ in rows)
+
+    def rebuild(self, rows):
+        return sum(1 for _ in rows)
+
+    def filter(self, queryset, query):
+        return queryset.filter(
+            Q(name__icontains=query) | Q(description__icontains=query)
+        ).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """Инвертированный индекс на виртуальной таблице SQLite FTS5"""
+
+    table = 'store_product_fts'
+    # Веса колонок для bm25: название, категория, характеристики, описание
+    weights = (10.0, 5.0, 3.0, 1.0)
+    batch_size = 1000
+
+    @property
+    def connection(self):
+        return connections[self.using]
+
+    def create_table(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} "
+                "USING fts5(name, category, specifications, description, tokenize='unicode61')"
+            )
+
+    def drop_table(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {self.table}")
+
+    def _insert(self, cursor, rows, replace=True):
+        documents = [
+            (product_id, *build_document(name, category, specifications, description))
+            for product_id, name, category, specifications, description in rows
+        ]
+        if replace:
+            cursor.executemany(
+                f"DELETE FROM {self.table} WHERE rowid = %s", [(doc[0],) for doc in documents]
+            )
+        cursor.executemany(
+            f"INSERT INTO {self.table} (rowid, name, category, specifications, description) "
+            "VALUES (%s, %s, %s, %s, %s)",
+            documents,
+        )
+
+    def index_products(self, products):
+        self.index_rows(
+            (p.id, p.name, p.category.name, p.specifications, p.description)
+            for p in products
+        )
+
+    def index_rows(self, rows):
+        count = 0
+        rows = iter(rows)
+        with self.connection.cursor() as cursor:
+            while batch := list(islice(rows, self.batch_size)):
+                self._insert(cursor, batch)
+                count += len(batch)
+        return count
+
+    def remove_products(self, product_ids):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f"DELETE FROM {self.table} WHERE rowid = %s", [(pk,) for pk in product_ids]
+            )
+
+    def rebuild(self, rows):
+        count = 0
+        batch = []
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= self.batch_size:
+                    self._insert(cursor, batch, replace=False)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                self._insert(cursor, batch, replace=False)
+                count += len(batch)
+            cursor.execute(f"INSERT INTO {self.table}({self.table}) VALUES ('optimize')")
+        return count
+
+    @staticmethod
+    def match_expression(query):
+        """Запрос FTS5: все основы через AND, каждая как префикс"""
+        stems = [token.replace('"', '') for token in tokenize(query)]
+        return ' '.join(f'"{token}"*' for token in stems if token)
+
+    def filter(self, queryset, query):
+        expression = self.match_expression(query)
+        if not expression:
+            return queryset.none()
+        weights = ', '.join(str(weight) for weight in self.weights)
+        # MATCH и bm25 работают только в запросе, где таблица индекса присоединена:
+        # коррелированный подзапрос повторял бы поиск по индексу для каждого товара
+        return queryset.filter(
+            RawSQL(f'{self.table} MATCH %s', [expression], output_field=BooleanField()),
+            search_entry__isnull=False,
+        ).annotate(search_rank=RawSQL(f'bm25({self.table}, {weights})', [], output_field=FloatField()))
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    backend_path = getattr(settings, 'STORE_SEARCH_BACKEND', 'store.search.SQLiteFTSBackend')
+    return import_string(backend_path)()
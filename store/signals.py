@@ -0,0 +1,162 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .caching import bump_version
+from .carts import attach_cart_on_login
+from .facets import adjust_facet_count, facet_key
+from .images import schedule_processing
+from .models import Cart, Category, DailyCarts, FacetCount, ImageJob, Order, Product, Stock
+from .recommendations import record_order
+from .search import get_search_backend
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, **kwargs):
+    """Обновить поисковый индекс при сохранении товара"""
+    if raw:
+        return
+    get_search_backend().index_products([instance])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    get_search_backend().remove_products([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_products(sender, instance, created=False, raw=False, **kwargs):
+    """Название категории входит в индекс, поэтому переиндексируем её товары"""
+    if raw or created:
+        return
+    products = instance.products.all()
+    for product in products:
+        product.category = instance
+    get_search_backend().index_products(products)
+
+
+@receiver(post_save, sender=Product)
+def update_facet_counts(sender, instance, created=False, raw=False, **kwargs):
+    """Перенести товар в новую комбинацию фасетов"""
+    if raw:
+        return
+    new_key = facet_key(instance.category_id, instance.availability, instance.price, instance.specifications)
+    old_key = None if created else getattr(instance, '_loaded_facet_key', None)
+    if old_key == new_key:
+        return
+    if old_key is not None:
+        adjust_facet_count(FacetCount, old_key, -1)
+    elif not created:
+        # Товар загружен без полей фасетов — пересчитать его вклад нельзя
+        return
+    adjust_facet_count(FacetCount, new_key, 1)
+    instance._loaded_facet_key = new_key
+
+
+@receiver(post_delete, sender=Product)
+def remove_from_facet_counts(sender, instance, **kwargs):
+    key = getattr(instance, '_loaded_facet_key', None)
+    if key is not None:
+        adjust_facet_count(FacetCount, key, -1)
+
+
+@receiver(post_save, sender=Product)
+def invalidate_product_pages(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    """
+    Сбросить кешированные списки товаров, если изменились поля, которые в них выводятся.
+
+    Фрагменты самого товара привязаны к updated_at и устаревают без явного сброса.
+    Смена одного наличия (сверка с остатком при каждой продаже) сбрасывает только
+    страницы категории товара; снимок каталога догоняет её по STORE_SNAPSHOT_MAX_AGE.
+    """
+    if raw:
+        return
+    loaded = getattr(instance, '_loaded_listing', None)
+    changed = set(Product.LISTING_FIELDS) if created else instance.listing_changes(update_fields)
+    if all(name in instance.__dict__ for name in Product.LISTING_FIELDS):
+        instance._loaded_listing = instance.listing_values()
+    if not changed:
+        return
+    bump_version('category', instance.category_id)
+    if loaded is not None and loaded['category_id'] != instance.category_id:
+        bump_version('category', loaded['category_id'])
+    if changed != {'availability'}:
+        bump_version('catalogue')
+
+
+@receiver(post_delete, sender=Product)
+def invalidate_deleted_product_pages(sender, instance, **kwargs):
+    bump_version('category', instance.category_id)
+    bump_version('catalogue')
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_pages(sender, instance, raw=False, **kwargs):
+    """Название категории выводится на страницах её товаров и в списках"""
+    if raw:
+        return
+    bump_version('category', instance.pk)
+    bump_version('catalogue')
+
+
+@receiver(post_save, sender=Stock)
+def derive_availability(sender, instance, raw=False, **kwargs):
+    """Наличие товара следует за остатком, изменённым вручную (например, в админке)"""
+    if raw:
+        return
+    Stock.objects.sync_availability([instance.product_id])
+
+
+@receiver(post_save, sender=ImageJob)
+def start_image_processing(sender, instance, created=False, raw=False, **kwargs):
+    """Запустить обработку после коммита, чтобы воркер увидел задание"""
+    if created and not raw:
+        transaction.on_commit(schedule_processing)
+
+
+@receiver(post_save, sender=Order)
+def move_order_sales(sender, instance, created=False, raw=False, **kwargs):
+    """
+    Перенести заказ в итоги продаж нового статуса.
+
+    В итоги попадают заказы, оформленные из корзины (Cart.checkout); заказы,
+    созданные иначе, учитывает manage.py rebuild_sales_rollups.
+    """
+    old_status = getattr(instance, '_loaded_status', None)
+    if raw or created or old_status in (None, instance.status):
+        return
+    lines = instance.sales_lines()
+    instance.add_to_sales(lines, -1, status=old_status)
+    instance.add_to_sales(lines)
+
+
+@receiver(post_save, sender=Order)
+def learn_co_purchases(sender, instance, created=False, raw=False, **kwargs):
+    """Пары товаров заказа — после коммита, когда позиции уже записаны и блокировка оформления снята"""
+    if created and not raw:
+        order_id = instance.pk
+        transaction.on_commit(lambda: record_order(order_id), robust=True)
+
+
+@receiver(pre_delete, sender=Order)
+def remove_order_sales(sender, instance, **kwargs):
+    """Вычесть заказ из итогов, пока его позиции ещё в базе"""
+    status = getattr(instance, '_loaded_status', None)
+    if status is not None:
+        instance.add_to_sales(instance.sales_lines(), -1, status=status)
+
+
+@receiver(post_save, sender=Cart)
+def count_new_cart(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        DailyCarts.objects.add({(timezone.localdate(instance.created_at),): {'carts': 1}})
+
+
+@receiver(user_logged_in)
+def merge_session_cart(sender, request, user, **kwargs):
+    """Анонимная корзина не теряется при входе"""
+    if request is not None and hasattr(request, 'session'):
+        attach_cart_on_login(request, user)
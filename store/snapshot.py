@@ -0,0 +1,305 @@
+"""
+Снимок каталога в памяти процесса для списков товаров без SQL.
+
+При STORE_CATALOGUE_SOURCE = 'snapshot' главная, каталог без поиска и страницы
+категорий берут выборку, сортировку, число товаров, фасеты и номера строк
+страницы из снимка, а не из базы.
+
+Снимок собирается из колонок товаров (массивы цены, категории, наличия,
+признака «Хит», даты создания, ценового диапазона и кодов значений фасетных
+характеристик — сами значения хранятся общими строками). Для каждой сортировки
+из SORT_KEYS строки заранее упорядочены, и для каждого значения фильтра
+строится битовая маска в этом порядке — целое число Python, бит p которого
+означает p-ю строку сортировки. Фильтр — OR масок значений внутри фасета и AND
+между фасетами, число строк — bit_count(): операции над целыми идут машинными
+словами, по 64 строки за раз. После сборки остаются только id, updated_at,
+порядки строк и маски. Страница — номера единичных битов маски с нужного места.
+
+Из базы читаются только товары страницы — одним запросом и только когда
+шаблону нужно что-то кроме id и updated_at: при попадании в кеш фрагментов
+карточек страница собирается без обращения к базе.
+
+Снимок неизменяем и общий для потоков процесса. Он пересобирается при смене
+версии каталога или через STORE_SNAPSHOT_MAX_AGE секунд (наличие, выведенное из
+остатков, версию каталога не меняет) и подменяется целиком
+(caching.VersionedObject).
+"""
+from array import array
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import CharField
+from django.db.models.functions import Cast
+
+from .caching import VersionedObject
+from .facets import facet_key, price_bounds, specification_keys
+from .models import Category, Product
+from .pagination import SORT_KEYS, use_cursor_pagination
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+NAIVE_EPOCH = EPOCH.replace(tzinfo=None)
+# Маска просматривается кусками: число единиц куска сразу говорит, нужен ли он странице
+CHUNK_BITS = 4096
+
+
+def enabled(request=None):
+    """Читать списки из снимка: включено настройкой, курсорный режим остаётся за базой"""
+    if getattr(settings, 'STORE_CATALOGUE_SOURCE', 'database') != 'snapshot':
+        return False
+    return request is None or not use_cursor_pagination(request)
+
+
+def _microseconds(text):
+    """Микросекунды от эпохи по тексту даты из базы (UTC без указания пояса)"""
+    return (datetime.fromisoformat(text) - NAIVE_EPOCH) // MICROSECOND
+
+
+def _value_masks(codes):
+    """Маски каждого значения списка кодов: бит p установлен, если codes[p] равен значению"""
+    values = set(codes)
+    if max(values, default=0) < 256:
+        # Текст из '0' и '1' по кодам строк переводит в число сам int() — без цикла по строкам
+        digits = bytes(codes)[::-1]
+        masks = {}
+        for value in values:
+            table = bytearray(b'0' * 256)
+            table[value] = ord('1')
+            masks[value] = int(digits.translate(table), 2)
+        return masks
+    masks = defaultdict(lambda: bytearray((len(codes) + 7) // 8))
+    for position, code in enumerate(codes):
+        masks[code][position >> 3] |= 1 << (position & 7)
+    return {value: int.from_bytes(bits, 'little') for value, bits in masks.items()}
+
+
+class CatalogueSnapshot:
+    """Неизменяемый снимок товаров и категорий"""
+
+    def __init__(self, categories, rows):
+        self.categories = list(categories)
+        self.category_by_slug = {category.slug: category for category in self.categories}
+        keys = specification_keys()
+        availability = [value for value, _ in Product.AVAILABILITY_CHOICES]
+
+        # Для выдачи страниц нужны только id и updated_at; колонки фильтров и сортировок
+        # после сборки остаются лишь в виде порядков строк и масок
+        self.ids = array('q')
+        self.updated_at = array('q')
+        price = array('q')
+        category = array('H')
+        created_at = array('q')
+        availabilities = bytearray()
+        featured = bytearray()
+        price_buckets = bytearray()
+        # Значения характеристики — общий список строк, в колонке — номер значения
+        self.spec_values = {key: [] for key in keys}
+        spec_codes = {key: array('H') for key in keys}
+        names = []
+        cube = Counter()
+
+        interned = {key: {} for key in keys}
+        category_codes = {category.id: code for code, category in enumerate(self.categories)}
+        for pk, name, category_id, product_price, product_availability, is_featured, created, updated, specs in rows:
+            key = facet_key(category_id, product_availability, product_price, specs)
+            cube[key] += 1
+            self.ids.append(pk)
+            self.updated_at.append(_microseconds(updated))
+            price.append(int(product_price * 100))
+            category.append(category_codes[category_id])
+            created_at.append(_microseconds(created))
+            availabilities.append(availability.index(product_availability))
+            featured.append(is_featured)
+            price_buckets.append(key[2])
+            names.append(name)
+            for spec_key, value in zip(keys, key[3]):
+                codes = interned[spec_key]
+                if value not in codes:
+                    codes[value] = len(self.spec_values[spec_key])
+                    self.spec_values[spec_key].append(value)
+                spec_codes[spec_key].append(codes[value])
+        self.cube = [(*key, count) for key, count in cube.items()]
+
+        size = len(self.ids)
+        # Порядок строк для каждой сортировки; последний ключ — id, как в базе
+        sort_columns = {'name': names, 'price': price, 'created_at': created_at, 'id': self.ids}
+        self.orders = {}
+        for sort_by, ordering in SORT_KEYS.items():
+            order = list(range(size))
+            # Устойчивая сортировка с последнего ключа к первому
+            for field in reversed(ordering):
+                column = sort_columns[field.lstrip('-')]
+                order.sort(key=column.__getitem__, reverse=field.startswith('-'))
+            self.orders[sort_by] = array('I', order)
+
+        self.category_codes = category_codes
+        columns = {
+            'category': category,
+            'availability': availabilities,
+            'featured': featured,
+            'price': price_buckets,
+            **{('spec', key): codes for key, codes in spec_codes.items()},
+        }
+        self.all = (1 << size) - 1
+        self.masks = {sort_by: self._masks(order, columns) for sort_by, order in self.orders.items()}
+
+    @staticmethod
+    def _masks(order, columns):
+        """Маски значений каждой колонки в порядке сортировки order"""
+        return {name: _value_masks([column[row] for row in order]) for name, column in columns.items()}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def mask(self, sort_by, category_ids=None, selection=None):
+        """Маска строк, прошедших фильтр, в порядке сортировки sort_by"""
+        masks = self.masks[sort_by]
+        result = self.all
+
+        def any_of(column, values):
+            combined = 0
+            for value in values:
+                combined |= masks[column].get(value, 0)
+            return combined
+
+        if category_ids is not None:
+            result &= any_of('category', [self.category_codes[pk] for pk in category_ids if pk in self.category_codes])
+        if selection is not None:
+            if selection.availability:
+                codes = [code for code, (value, _) in enumerate(Product.AVAILABILITY_CHOICES) if value in selection.availability]
+                result &= any_of('availability', codes)
+            if selection.price:
+                result &= any_of('price', [bucket for bucket in selection.price if bucket < len(price_bounds())])
+            for key, values in selection.specifications.items():
+                codes = {value: code for code, value in enumerate(self.spec_values.get(key, ()))}
+                result &= any_of(('spec', key), [codes[value] for value in values if value in codes])
+        return result
+
+    def select(self, sort_by, category_ids=None, selection=None):
+        """Товары выборки в порядке sort_by; список для Paginator"""
+        return SnapshotProducts(self, sort_by, self.mask(sort_by, category_ids, selection))
+
+    def featured_products(self, limit):
+        """Рекомендуемые товары, новые первыми"""
+        mask = self.masks['newest']['featured'].get(1, 0)
+        return SnapshotProducts(self, 'newest', mask)[:limit]
+
+    def rows(self, sort_by, positions):
+        order = self.orders[sort_by]
+        return [order[position] for position in positions]
+
+    def updated(self, row):
+        return EPOCH + self.updated_at[row] * MICROSECOND
+
+    def memory_usage(self):
+        """Байты колонок, порядков сортировки и масок (без категорий)"""
+        return {
+            'columns': self.ids.__sizeof__() + self.updated_at.__sizeof__(),
+            'orders': sum(order.__sizeof__() for order in self.orders.values()),
+            'masks': sum(
+                mask.__sizeof__() for masks in self.masks.values() for values in masks.values() for mask in values.values()
+            ),
+        }
+
+
+def _positions(mask, start, stop):
+    """Номера единичных битов маски с start-го по stop-й (не включая) по возрастанию"""
+    found, seen, base = [], 0, 0
+    chunk_mask = (1 << CHUNK_BITS) - 1
+    while mask and seen < stop:
+        chunk = mask & chunk_mask
+        count = chunk.bit_count()
+        if seen + count <= start:
+            seen += count
+        else:
+            while chunk and seen < stop:
+                low = chunk & -chunk
+                if seen >= start:
+                    found.append(base + low.bit_length() - 1)
+                seen += 1
+                chunk ^= low
+        mask >>= CHUNK_BITS
+        base += CHUNK_BITS
+    return found
+
+
+class SnapshotProducts:
+    """Выборка товаров из снимка: len() и срезы, как у QuerySet для Paginator"""
+
+    def __init__(self, snapshot, sort_by, mask):
+        self.snapshot = snapshot
+        self.sort_by = sort_by
+        self.mask = mask
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = self.mask.bit_count()
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            page = self[index:index + 1]
+            if not page:
+                raise IndexError(index)
+            return page[0]
+        start, stop, _ = index.indices(self.count())
+        rows = self.snapshot.rows(self.sort_by, _positions(self.mask, start, stop))
+        loader = PageLoader([self.snapshot.ids[row] for row in rows])
+        return [SnapshotProduct(loader, self.snapshot.ids[row], self.snapshot.updated(row)) for row in rows]
+
+
+class PageLoader:
+    """Товары страницы из базы одним запросом при первом обращении"""
+
+    def __init__(self, ids):
+        self.ids = ids
+        self.products = None
+
+    def get(self, pk):
+        if self.products is None:
+            self.products = Product.objects.prefetch_related('renditions').in_bulk(self.ids)
+        # Товар удалён после сборки снимка: пустая карточка вместо ошибки шаблона
+        return self.products.get(pk) or Product(pk=pk, name='', price=Decimal(0))
+
+
+class SnapshotProduct:
+    """Товар страницы: id и updated_at из снимка, остальные атрибуты — у товара из базы"""
+
+    def __init__(self, loader, pk, updated_at):
+        self.id = self.pk = pk
+        self.updated_at = updated_at
+        self._loader = loader
+
+    def __getattr__(self, name):
+        return getattr(self._loader.get(self.id), name)
+
+    def __eq__(self, other):
+        return isinstance(other, (SnapshotProduct, Product)) and other.pk == self.pk
+
+    def __hash__(self):
+        return hash(self.pk)
+
+
+def load_snapshot(batch_size=5000):
+    # Даты — текстом, без конвертеров Django; характеристики разбираются как в facet_key,
+    # чтобы куб снимка совпадал с таблицей FacetCount
+    rows = Product.objects.annotate(
+        created_text=Cast('created_at', CharField()), updated_text=Cast('updated_at', CharField()),
+    ).values_list(
+        'id', 'name', 'category_id', 'price', 'availability', 'featured', 'created_text', 'updated_text', 'specifications',
+    ).order_by().iterator(chunk_size=batch_size)
+    return CatalogueSnapshot(Category.objects.all(), rows)
+
+
+_snapshot = VersionedObject(load_snapshot, 'catalogue', max_age_setting='STORE_SNAPSHOT_MAX_AGE')
+
+
+def get_snapshot():
+    return _snapshot.get()
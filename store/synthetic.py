@@ -0,0 +1,400 @@
+"""
+Синтетические данные для нагрузочного тестирования.
+
+Каталог строится из образцов store.sample_data: каждый товар — вариант образца
+с другим поколением, объёмом памяти, цветом и ценой. Строки создаются
+пачками через bulk_create в одной транзакции в обход сигналов, поэтому
+поисковый индекс, таблица фасетов, сводки продаж и совместные покупки
+перестраиваются один раз в конце. Каждая часть данных
+получает свой генератор случайных чисел от общего seed: тот же seed даёт те же
+товары независимо от числа корзин и заказов.
+
+Трасса запросов — файл JSON Lines, по строке на запрос посетителя: главная,
+каталог, категория, поиск, карточка товара, добавление в корзину и оформление
+заказа. Трасса ссылается на id товаров, поэтому воспроизводится против той же
+базы, для которой построена.
+"""
+import json
+import random
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.db import transaction
+from django.db.models import Max, Q
+from django.urls import reverse
+from django.utils import timezone
+
+from .analytics import rebuild_sales_rollups
+from .caching import bump_version
+from .facets import price_bounds, rebuild_facet_counts
+from .fallback_images import fallback_image_for
+from .models import (
+    Cart, CartItem, Category, CoPurchase, DailyCarts, DailyProductSales, FacetCount, ImageJob, ImageRendition, Order,
+    OrderItem, Product, Recommendation, Stock, StockReservation,
+)
+from .recommendations import rebuild_co_purchases
+from .sample_data import CATEGORIES, PRODUCTS
+from .search import get_search_backend
+
+
+PREFIX = 'load-'
+EMAIL_DOMAIN = 'load.example.com'
+
+MEMORY = ['64 ГБ', '128 ГБ', '256 ГБ', '512 ГБ', '1 ТБ']
+MEMORY_MARKUP = [0.9, 1.0, 1.15, 1.35, 1.6]
+COLORS = ['Черный', 'Белый', 'Синий', 'Серебристый', 'Серый космос', 'Натуральный титан', 'Розовый', 'Зелёный']
+EXTRA_WORDS = [
+    'быстрый', 'тонкий', 'лёгкий', 'мощный', 'яркий', 'беспроводной', 'водонепроницаемый',
+    'алюминиевый', 'титановый', 'шумоподавление', 'аккумулятор', 'камера', 'дисплей', 'зарядка',
+]
+FIRST_NAMES = ['Анна', 'Иван', 'Мария', 'Пётр', 'Ольга', 'Алексей', 'Елена', 'Дмитрий', 'Наталья', 'Сергей']
+LAST_NAMES = ['Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Петров', 'Соколов', 'Михайлов']
+ORDER_STATUSES = ['pending', 'confirmed', 'shipped', 'delivered', 'cancelled']
+ORDER_STATUS_WEIGHTS = [5, 10, 10, 70, 5]
+
+# Доли запросов в трассе
+TRACE_MIX = {
+    'home': 5,
+    'browse': 25,
+    'category': 15,
+    'search': 15,
+    'product': 25,
+    'add_to_cart': 10,
+    'checkout': 5,
+}
+TRACE_SORTS = ['name', 'price_asc', 'price_desc', 'newest']
+
+
+def _rng(seed, part):
+    return random.Random(f'{seed}:{part}')
+
+
+def _popularity(count, skew=1.1):
+    """Накопленные веса закона Ципфа: первые товары покупают и смотрят чаще остальных"""
+    return list(accumulate(1 / (rank + 1) ** skew for rank in range(count)))
+
+
+def _pick(rng, items, cum_weights):
+    return items[bisect_left(cum_weights, rng.random() * cum_weights[-1])]
+
+
+# Данные
+
+def generate_dataset(categories=12, products=100000, carts=1000, orders=20000, seed=42,
+                     stock_share=0.5, history_days=365, batch_size=5000):
+    """Создать каталог, корзины и историю заказов; число созданных строк по таблицам"""
+    with transaction.atomic():
+        category_objects = generate_categories(categories, seed)
+        product_rows = generate_products(category_objects, products, seed, stock_share, batch_size)
+        counts = {
+            'categories': len(category_objects),
+            'products': len(product_rows),
+            'stock': sum(1 for row in product_rows if row[3] is not None),
+            'carts': generate_carts(product_rows, carts, seed, batch_size),
+            'orders': generate_orders(product_rows, orders, seed, history_days, batch_size),
+        }
+        rebuild_derived_data()
+    return counts
+
+
+def generate_categories(count, seed):
+    rng = _rng(seed, 'categories')
+    categories = []
+    for i in range(count):
+        template = CATEGORIES[i % len(CATEGORIES)]
+        series = i // len(CATEGORIES) + 1
+        categories.append(Category(
+            name=template['name'] if series == 1 else f"{template['name']} · серия {series}",
+            slug=f"{PREFIX}{template['slug']}-{i}",
+            description=template['description'],
+        ))
+    rng.shuffle(categories)
+    return Category.objects.bulk_create(categories)
+
+
+def generate_products(categories, count, seed, stock_share=0.5, batch_size=5000):
+    """
+    Варианты образцов из sample_data в созданных категориях.
+
+    Возвращает строки (id, category_id, price, on_hand) в порядке популярности;
+    on_hand равен None у товаров без учёта остатков.
+    """
+    rng = _rng(seed, 'products')
+    templates = defaultdict(list)
+    for template in PRODUCTS:
+        templates[template['category']].append(template)
+    fallbacks = {template['name']: fallback_image_for(template['name']) for template in PRODUCTS}
+    first_id = _next_id(Product)
+
+    products, rows = [], []
+    for i in range(count):
+        category = categories[i % len(categories)]
+        family = category.slug[len(PREFIX):].rsplit('-', 1)[0]
+        template = rng.choice(templates[family])
+        memory = rng.randrange(len(MEMORY))
+        color = rng.choice(COLORS)
+        generation = rng.randrange(1, 6)
+        # Цены вида 79 990 ₽, как у образцов
+        price = template['price'] * MEMORY_MARKUP[memory] * rng.uniform(0.8, 1.2)
+        price = max(round(price / 1000) * 1000 - 10, 990)
+
+        specifications = dict(template['specifications'])
+        specifications['Цвет'] = color
+        if 'Объем памяти' in specifications or family in ('iphone', 'ipad'):
+            specifications['Объем памяти'] = MEMORY[memory]
+
+        on_hand = rng.randrange(0, 200) if rng.random() < stock_share else None
+        if on_hand is not None:
+            availability = 'available' if on_hand else 'out_of_stock'
+        else:
+            availability = rng.choices(['available', 'out_of_stock', 'pre_order'], [85, 10, 5])[0]
+
+        product_id = first_id + i
+        products.append(Product(
+            id=product_id,
+            name=f"{template['name']} ({generation}) {MEMORY[memory]} {color}",
+            slug=f'{PREFIX}{i}',
+            category_id=category.id,
+            description=f"{template['description']} {' '.join(rng.sample(EXTRA_WORDS, 4))}.",
+            price=Decimal(price),
+            fallback_image_url=fallbacks[template['name']],
+            availability=availability,
+            featured=rng.random() < 0.002,
+            specifications=specifications,
+        ))
+        rows.append((product_id, category.id, Decimal(price), on_hand))
+
+    Product.objects.bulk_create(products, batch_size=batch_size)
+    Stock.objects.bulk_create([
+        Stock(product_id=product_id, on_hand=on_hand) for product_id, _, _, on_hand in rows if on_hand is not None
+    ], batch_size=batch_size)
+    rng.shuffle(rows)
+    return rows
+
+
+def generate_carts(product_rows, count, seed, batch_size=5000):
+    """Незавершённые корзины анонимных посетителей, без резервов остатка"""
+    rng = _rng(seed, 'carts')
+    weights = _popularity(len(product_rows))
+    carts, lines = [], []
+    for i in range(count):
+        chosen = {row[0]: row for row in (_pick(rng, product_rows, weights) for _ in range(rng.randint(1, 4)))}
+        quantities = [rng.choices([1, 2, 3], [80, 15, 5])[0] for _ in chosen]
+        carts.append(Cart(
+            session_key=f'{PREFIX}{i}',
+            items_count=sum(quantities),
+            subtotal=sum(row[2] * quantity for row, quantity in zip(chosen.values(), quantities)),
+        ))
+        lines.append(list(zip(chosen, quantities)))
+
+    Cart.objects.bulk_create(carts, batch_size=batch_size)
+    # bulk_create не шлёт post_save: счётчик корзин за день пополняется здесь, как в store.signals
+    DailyCarts.objects.add(_cart_days(carts, 1))
+    CartItem.objects.bulk_create([
+        CartItem(cart=cart, product_id=product_id, quantity=quantity)
+        for cart, cart_lines in zip(carts, lines)
+        for product_id, quantity in cart_lines
+    ], batch_size=batch_size)
+    return len(carts)
+
+
+def generate_orders(product_rows, count, seed, history_days=365, batch_size=5000):
+    """
+    История заказов за history_days дней.
+
+    Первый товар заказа выбирается по популярности, остальные чаще всего из
+    той же категории — так в истории появляются устойчивые пары покупок.
+    """
+    rng = _rng(seed, 'orders')
+    weights = _popularity(len(product_rows))
+    by_category = defaultdict(list)
+    for row in product_rows:
+        by_category[row[1]].append(row)
+    customers = max(count // 3, 1)
+    now = timezone.now()
+    first_id = _next_id(Order)
+
+    orders, dates, lines = [], [], []
+    for order_id in range(first_id, first_id + count):
+        first = _pick(rng, product_rows, weights)
+        chosen = {first[0]: first}
+        for _ in range(rng.choices([0, 1, 2], [55, 30, 15])[0]):
+            row = rng.choice(by_category[first[1]]) if rng.random() < 0.7 else _pick(rng, product_rows, weights)
+            chosen[row[0]] = row
+        quantities = [rng.choices([1, 2], [90, 10])[0] for _ in chosen]
+        customer = rng.randrange(customers)
+        created_at = now - timedelta(seconds=rng.randrange(history_days * 86400))
+        orders.append(Order(
+            id=order_id,
+            first_name=FIRST_NAMES[customer % len(FIRST_NAMES)],
+            last_name=LAST_NAMES[customer % len(LAST_NAMES)],
+            email=f'customer{customer}@{EMAIL_DOMAIN}',
+            phone=f'+7900{customer:07d}',
+            address=f'Москва, ул. Нагрузочная, д. {customer % 300 + 1}',
+            status=rng.choices(ORDER_STATUSES, ORDER_STATUS_WEIGHTS)[0],
+            total_amount=sum(row[2] * quantity for row, quantity in zip(chosen.values(), quantities)),
+        ))
+        dates.append(created_at)
+        lines.extend(
+            OrderItem(order_id=order_id, product_id=row[0], price=row[2], quantity=quantity)
+            for row, quantity in zip(chosen.values(), quantities)
+        )
+
+    Order.objects.bulk_create(orders, batch_size=batch_size)
+    # auto_now_add заменяет даты при вставке — история проставляется вторым проходом
+    for order, created_at in zip(orders, dates):
+        order.created_at = order.updated_at = created_at
+    Order.objects.bulk_update(orders, ['created_at', 'updated_at'], batch_size=batch_size)
+    OrderItem.objects.bulk_create(lines, batch_size=batch_size)
+    return len(orders)
+
+
+def _next_id(model):
+    """
+    Первый свободный id. Генератор пишет внутри транзакции, которая уже держит
+    блокировку записи, поэтому другие процессы не займут эти id.
+    """
+    return (model.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+
+
+def _cart_days(carts, sign):
+    """Приращения DailyCarts по дням создания корзин"""
+    days = Counter(timezone.localdate(cart.created_at) for cart in carts)
+    return {(day,): {'carts': sign * count} for day, count in days.items()}
+
+
+def rebuild_derived_data():
+    """
+    Поисковый индекс, таблица фасетов, итоги продаж, совместные покупки и версия
+    каталога после массовых изменений.
+    """
+    get_search_backend().index_queryset(Product.objects.all())
+    rebuild_facet_counts(Product.objects.all(), FacetCount)
+    rebuild_sales_rollups()
+    rebuild_co_purchases()
+    bump_version('catalogue')
+
+
+def clear_dataset():
+    """Удалить всё, что создал generate_dataset; число удалённых товаров"""
+    products = Product.objects.filter(slug__startswith=PREFIX)
+    carts = Cart.objects.filter(session_key__startswith=PREFIX)
+    orders = Order.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}')
+    with transaction.atomic():
+        StockReservation.objects.filter(cart__in=carts).delete()
+        StockReservation.objects.filter(product__in=products).delete()
+        CartItem.objects.filter(product__in=products).delete()
+        # Счётчик корзин не пересчитывается из таблицы корзин: вычитаем то, что прибавил generate_carts
+        DailyCarts.objects.add(_cart_days(carts.only('created_at'), -1))
+        carts.delete()
+        OrderItem.objects.filter(product__in=products).delete()
+        OrderItem.objects.filter(order__in=orders).delete()
+        # Заказы вставлены в обход моделей и не учтены в итогах продаж: удаление через ORM
+        # вычло бы их сигналом pre_delete
+        orders._raw_delete(orders.db)
+        Stock.objects.filter(product__in=products).delete()
+        ImageJob.objects.filter(product__in=products).delete()
+        ImageRendition.objects.filter(product__in=products).delete()
+        DailyProductSales.objects.filter(product__in=products).delete()
+        CoPurchase.objects.filter(Q(product__in=products) | Q(other__in=products)).delete()
+        Recommendation.objects.filter(Q(product__in=products) | Q(recommended__in=products)).delete()
+        # Сигналы удаления товаров обновляли бы индекс и фасеты по одному товару;
+        # вместо этого они перестраиваются целиком
+        deleted = products._raw_delete(products.db)
+        categories = Category.objects.filter(slug__startswith=PREFIX)
+        categories._raw_delete(categories.db)
+        rebuild_derived_data()
+    return deleted
+
+
+# Трасса запросов
+
+def build_trace(count, seed=42, sessions=200, mix=None):
+    """Запросы посетителей по каталогу, созданному generate_dataset"""
+    rng = _rng(seed, 'trace')
+    mix = mix or TRACE_MIX
+    ops, op_weights = list(mix), list(accumulate(mix.values()))
+
+    products = list(
+        Product.objects.filter(slug__startswith=PREFIX)
+        .order_by('id').values_list('id', 'slug', 'name', 'availability')
+    )
+    if not products:
+        return []
+    _rng(seed, 'trace-products').shuffle(products)
+    weights = _popularity(len(products))
+    buyable = [row for row in products if row[3] == 'available'] or products
+    buyable_weights = _popularity(len(buyable))
+    categories = list(Category.objects.filter(slug__startswith=PREFIX).order_by('id').values_list('slug', flat=True))
+    terms = sorted({' '.join(name.split()[:2]) for _, _, name, _ in products[:500]})
+    terms += ['pro', 'чип', 'беспроводной', 'титановый', '256 ГБ']
+
+    product_list = reverse('store:product_list')
+    carts = defaultdict(int)
+    trace = []
+    for _ in range(count):
+        session = rng.randrange(sessions)
+        op = ops[bisect_left(op_weights, rng.random() * op_weights[-1])]
+        if op == 'checkout' and not carts[session]:
+            op = 'add_to_cart'
+
+        if op == 'home':
+            entry = _get('store:home', reverse('store:home'))
+        elif op == 'browse':
+            query = {'sort': rng.choice(TRACE_SORTS)}
+            if rng.random() < 0.3:
+                query['price'] = rng.randrange(len(price_bounds()))
+            if rng.random() < 0.3:
+                query['category'] = rng.choice(categories)
+            if rng.random() < 0.3:
+                query['page'] = rng.randint(2, 5)
+            entry = _get('store:product_list', product_list, query)
+        elif op == 'category':
+            entry = _get('store:category_detail', reverse('store:category_detail', args=[rng.choice(categories)]),
+                         {'sort': rng.choice(TRACE_SORTS)})
+        elif op == 'search':
+            entry = _get('store:product_list', product_list, {'search': rng.choice(terms)})
+        elif op == 'product':
+            slug = _pick(rng, products, weights)[1]
+            entry = _get('store:product_detail', reverse('store:product_detail', args=[slug]))
+        elif op == 'add_to_cart':
+            product_id = _pick(rng, buyable, buyable_weights)[0]
+            entry = {
+                'view': 'store:add_to_cart', 'method': 'POST', 'path': reverse('store:add_to_cart'),
+                'json': {'product_id': product_id, 'quantity': 1},
+            }
+            carts[session] += 1
+        else:
+            entry = {
+                'view': 'store:checkout', 'method': 'POST', 'path': reverse('store:checkout'),
+                'data': {
+                    'first_name': 'Нагрузка', 'last_name': f'Сессия {session}',
+                    'email': f'session{session}@{EMAIL_DOMAIN}', 'phone': '+79000000000',
+                    'address': 'Москва, ул. Нагрузочная, д. 1',
+                },
+            }
+            carts[session] = 0
+        entry['session'] = session
+        trace.append(entry)
+    return trace
+
+
+def _get(view, path, query=None):
+    entry = {'view': view, 'method': 'GET', 'path': path}
+    if query:
+        entry['query'] = query
+    return entry
+
+
+def write_trace(trace, stream):
+    for entry in trace:
+        stream.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+
+def read_trace(stream):
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
@@ -0,0 +1,92 @@
+"""
+{% responsive_image obj 'card' %} — <picture> с srcset по вариантам изображения.
+
+Порядок выбора источника: варианты из ImageRendition (WebP и JPEG), исходный
+файл, пока варианты строятся, запасной адрес товара и общая заглушка.
+Списки товаров должны подгружать варианты через prefetch_related('renditions').
+"""
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from django import template
+from django.conf import settings
+from django.utils.html import format_html, format_html_join
+
+register = template.Library()
+
+# Слот: атрибут sizes и ширина, которую берём для src без поддержки srcset
+SLOTS = {
+    'card': ('(min-width: 1200px) 280px, (min-width: 768px) 33vw, 100vw', 560),
+    'detail': ('(min-width: 992px) 540px, 100vw', 800),
+    'thumbnail': ('80px', 160),
+    'banner': ('(min-width: 768px) 33vw, 100vw', 800),
+}
+CDN_WIDTHS = (160, 320, 560, 800)
+PLACEHOLDER = 'https://via.placeholder.com/400x400/F2F2F7/8E8E93?text=Apple+Product'
+
+
+@register.simple_tag
+def responsive_image(obj, slot='card', css_class='', style='', alt=None):
+    sizes, default_width = SLOTS[slot]
+    alt = obj.name if alt is None else alt
+    attrs = {'class': css_class, 'style': style, 'alt': alt, 'loading': 'eager' if slot == 'detail' else 'lazy'}
+
+    image = getattr(obj, 'image', None)
+    if image:
+        renditions = list(obj.renditions.all())
+        if renditions:
+            return _picture(renditions, sizes, default_width, attrs)
+        return _img(image.url, attrs)
+
+    fallback = getattr(obj, 'fallback_image_url', '') or getattr(settings, 'STORE_PLACEHOLDER_IMAGE', PLACEHOLDER)
+    srcset = _cdn_srcset(fallback)
+    if srcset:
+        return _img(_cdn_resized(fallback, default_width), dict(attrs, srcset=srcset, sizes=sizes))
+    return _img(fallback, attrs)
+
+
+def _picture(renditions, sizes, default_width, attrs):
+    by_format = {}
+    for rendition in renditions:
+        # Исходник меньше варианта не увеличивается — одинаковые ширины не дублируем
+        by_format.setdefault(rendition.format, {}).setdefault(rendition.width, rendition)
+    fallback_format = 'JPEG' if 'JPEG' in by_format else next(iter(by_format))
+    fallback = by_format[fallback_format]
+    src = min(fallback.values(), key=lambda r: (r.width < default_width, abs(r.width - default_width)))
+
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        (
+            (f'image/{image_format.lower()}', _srcset(variants), sizes)
+            for image_format, variants in by_format.items() if image_format != fallback_format
+        ),
+    )
+    img = _img(src.file.url, dict(
+        attrs, srcset=_srcset(fallback), sizes=sizes, width=src.width, height=src.height,
+    ))
+    return format_html('<picture>{}{}</picture>', sources, img)
+
+
+def _srcset(variants):
+    return ', '.join(f'{variants[width].file.url} {width}w' for width in sorted(variants))
+
+
+def _img(src, attrs):
+    rendered = format_html_join(' ', '{}="{}"', ((name, value) for name, value in attrs.items() if value != ''))
+    return format_html('<img src="{}" {} decoding="async">', src, rendered)
+
+
+def _cdn_srcset(url):
+    """srcset для CDN, который масштабирует изображение по параметрам wid/hei"""
+    query = dict(parse_qsl(urlsplit(url).query, keep_blank_values=True))
+    if 'wid' not in query:
+        return ''
+    return ', '.join(f'{_cdn_resized(url, width)} {width}w' for width in CDN_WIDTHS)
+
+
+def _cdn_resized(url, width):
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    if not any(key == 'wid' for key, _ in query):
+        return url
+    query = [(key, str(width) if key in ('wid', 'hei') else value) for key, value in query]
+    return urlunsplit(parts._replace(query=urlencode(query, safe='.')))
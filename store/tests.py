@@ -1,3 +1,1570 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache, caches
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.db.models import Sum
+from django.template import Context, Template
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from .analytics import rebuild_sales_rollups
+from .benchmark import build_scenarios, compare, run_benchmark, seed_dataset
+from .caching import get_version, stats as cache_stats
+from .carts import SESSION_KEY
+from .facets import facet_key, rebuild_facet_counts, signature, specification_keys
+from .fallback_images import fallback_image_for
+from .images import drain_queue, render_image
+from .instrumentation import QueryBudgetExceeded, registry
+from .management.commands.stress_checkout import CUSTOMER, run_checkout_stress
+from .models import CartItem, Category, CoPurchase, DailyCarts, DailyProductSales, DailySales, FacetCount, Product, Cart, Order, Recommendation, Stock, StockReservation, ImageJob, ImageRendition
+from .recommendations import rebuild_co_purchases
+from .search import get_search_backend
+from .synthetic import build_trace, clear_dataset, generate_dataset, read_trace, write_trace
+
+
+def make_product(category, slug, price, **extra):
+    extra.setdefault('name', slug.replace('-', ' ').title())
+    return Product.objects.create(
+        slug=slug,
+        category=category,
+        description='Описание',
+        price=price,
+        **extra
+    )
+
+
+class CartTotalsTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='iPhone', slug='iphone')
+        self.phone = make_product(self.category, 'iphone-15', Decimal('79990'))
+        self.case = make_product(self.category, 'iphone-case', Decimal('4990'))
+
+    def add(self, product, quantity=1):
+        return self.client.post(
+            reverse('store:add_to_cart'),
+            data=json.dumps({'product_id': product.id, 'quantity': quantity}),
+            content_type='application/json',
+        ).json()
+
+    def test_add_update_remove_keep_totals_consistent(self):
+        self.add(self.phone)
+        data = self.add(self.phone, 2)
+        self.assertEqual(data['cart_total_items'], 3)
+        self.assertEqual(data['cart_total_price'], 3 * 79990)
+
+        self.add(self.case)
+        cart = Cart.objects.get()
+        item = cart.items.get(product=self.phone)
+        data = self.client.post(
+            reverse('store:update_cart_item'),
+            data=json.dumps({'item_id': item.id, 'quantity': 1}),
+            content_type='application/json',
+        ).json()
+        self.assertEqual(data['cart_total_items'], 2)
+        self.assertEqual(data['cart_total_price'], 79990 + 4990)
+
+        self.client.get(reverse('store:remove_from_cart', args=[item.id]))
+        cart.refresh_from_db()
+        self.assertEqual(cart.items_count, 1)
+        self.assertEqual(cart.subtotal, Decimal('4990'))
+
+    def test_recalculate_command_repairs_drift(self):
+        self.add(self.phone, 2)
+        Cart.objects.update(items_count=0, subtotal=0)
+        call_command('recalculate_cart_totals', stdout=StringIO())
+        cart = Cart.objects.get()
+        self.assertEqual(cart.items_count, 2)
+        self.assertEqual(cart.subtotal, Decimal('159980'))
+
+    def test_first_add_merges_with_concurrent_insert(self):
+        cart = Cart.objects.create(session_key='race')
+        raced = []
+
+        def concurrent_add(execute, sql, params, many, context):
+            # Параллельный запрос вставляет ту же строку сразу после проверки (UPDATE) или перед вставкой
+            first = not raced and 'store_cartitem' in sql and sql.startswith(('UPDATE', 'INSERT'))
+            if first:
+                raced.append(sql)
+                if sql.startswith('INSERT'):
+                    CartItem.objects.bulk_create([CartItem(cart=cart, product=self.phone, quantity=1)])
+            result = execute(sql, params, many, context)
+            if first and sql.startswith('UPDATE'):
+                CartItem.objects.bulk_create([CartItem(cart=cart, product=self.phone, quantity=1)])
+            return result
+
+        with connection.execute_wrapper(concurrent_add):
+            cart.add_product(self.phone, 2)
+        self.assertEqual(cart.items.get().quantity, 3)
+        self.assertEqual(Cart.objects.get().items_count, 2)
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='AirPods', slug='airpods')
+        self.pods = make_product(
+            category, 'airpods-pro', Decimal('24990'),
+            specifications={'Чип': 'H2', 'Шумоподавление': 'Активное'},
+        )
+        self.phone = make_product(category, 'iphone-15', Decimal('79990'))
+        self.phone.description = 'Совместим с беспроводными наушниками'
+        self.phone.save()
+
+    def search(self, query):
+        response = self.client.get(reverse('store:product_list'), {'search': query})
+        return [product.slug for product in response.context['page_obj']]
+
+    def test_prefix_and_specification_values(self):
+        self.assertEqual(self.search('iph'), ['iphone-15'])
+        self.assertEqual(self.search('h2'), ['airpods-pro'])
+
+    def test_russian_stemming(self):
+        self.assertEqual(self.search('беспроводные наушники'), ['iphone-15'])
+        self.assertEqual(self.search('активным'), ['airpods-pro'])
+
+    def test_index_follows_delete(self):
+        self.phone.delete()
+        self.assertEqual(self.search('iphone'), [])
+
+
+class FacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.iphone = Category.objects.create(name='iPhone', slug='iphone')
+        self.mac = Category.objects.create(name='Mac', slug='mac')
+        make_product(self.iphone, 'iphone-15', Decimal('79990'),
+                     specifications={'Чип': 'A16 Bionic', 'Объем памяти': '128 ГБ'})
+        make_product(self.iphone, 'iphone-15-pro', Decimal('129990'),
+                     specifications={'Чип': 'A17 Pro', 'Объем памяти': '256 ГБ'})
+        make_product(self.mac, 'macbook-air', Decimal('134990'), availability='pre_order',
+                     specifications={'Чип': 'Apple M2'})
+
+    def facets(self, params):
+        response = self.client.get(reverse('store:product_list'), params)
+        return {
+            facet['name']: {option['value']: option['count'] for option in facet['values']}
+            for facet in response.context['facets']
+        }, [product.slug for product in response.context['page_obj']]
+
+    def test_counts_ignore_own_facet_selection(self):
+        facets, slugs = self.facets({'category': 'iphone'})
+        self.assertEqual(sorted(slugs), ['iphone-15', 'iphone-15-pro'])
+        self.assertEqual(facets['category'], {'iphone': 2, 'mac': 1})
+        self.assertEqual(facets['availability']['pre_order'], 0)
+        self.assertEqual(facets['Чип'], {'Чип:A16 Bionic': 1, 'Чип:A17 Pro': 1})
+
+    def test_specification_and_price_filters(self):
+        facets, slugs = self.facets({'spec': ['Чип:A17 Pro', 'Чип:Apple M2'], 'price': '3'})
+        self.assertEqual(sorted(slugs), ['iphone-15-pro', 'macbook-air'])
+        self.assertEqual(facets['price'][2], 0)
+
+    def test_counts_follow_product_changes(self):
+        product = Product.objects.get(slug='iphone-15')
+        product.category = self.mac
+        product.save()
+        Product.objects.get(slug='macbook-air').delete()
+        facets, _ = self.facets({})
+        self.assertEqual(facets['category'], {'iphone': 1, 'mac': 1})
+
+    def test_counts_with_search_query(self):
+        facets, slugs = self.facets({'search': 'iphone'})
+        self.assertEqual(facets['category'], {'iphone': 2, 'mac': 0})
+
+    def test_new_combination_merges_with_concurrent_insert(self):
+        key = facet_key(self.mac.pk, 'available', Decimal('99990'), {'Чип': 'Apple M3'})
+        raced = []
+
+        def concurrent_save(execute, sql, params, many, context):
+            # Другой товар той же новой комбинации создаёт строку сразу после проверки (UPDATE) или перед вставкой
+            first = not raced and 'store_facetcount' in sql and sql.startswith(('UPDATE', 'INSERT'))
+            if first:
+                raced.append(sql)
+            competitor = FacetCount(
+                signature=signature(key), category=self.mac, availability='available', price_bucket=key[2],
+                specifications=dict(zip(specification_keys(), key[3])), count=1,
+            )
+            if first and sql.startswith('INSERT'):
+                FacetCount.objects.bulk_create([competitor])
+            result = execute(sql, params, many, context)
+            if first and sql.startswith('UPDATE'):
+                FacetCount.objects.bulk_create([competitor])
+            return result
+
+        with connection.execute_wrapper(concurrent_save):
+            make_product(self.mac, 'macbook-pro', Decimal('99990'), specifications={'Чип': 'Apple M3'})
+        facet = FacetCount.objects.get(signature=signature(key))
+        self.assertEqual((facet.count, facet.specifications['Чип']), (2, 'Apple M3'))
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Mac', slug='mac')
+        for i in range(30):
+            make_product(self.category, f'mac-{i:02d}', Decimal(1000 + i % 7))
+
+    def walk(self, url, params):
+        slugs, cursor = [], None
+        while True:
+            data = self.client.get(url, {**params, 'format': 'json', **({'cursor': cursor} if cursor else {})}).json()
+            slugs += [item['slug'] for item in data['results']]
+            if not data['next']:
+                return slugs, data
+            cursor = data['next']
+
+    def test_cursor_pages_match_offset_ordering(self):
+        url = reverse('store:category_detail', args=['mac'])
+        slugs, data = self.walk(url, {'sort': 'price_asc'})
+        expected = list(Product.objects.order_by('price', 'id').values_list('slug', flat=True))
+        self.assertEqual(slugs, expected)
+        self.assertEqual(data['count'], 30)
+
+    def test_previous_cursor_returns_previous_page(self):
+        url = reverse('store:product_list')
+        first = self.client.get(url, {'format': 'json', 'sort': 'name'}).json()
+        second = self.client.get(url, {'format': 'json', 'sort': 'name', 'cursor': first['next']}).json()
+        back = self.client.get(url, {'format': 'json', 'sort': 'name', 'cursor': second['previous']}).json()
+        self.assertEqual(back['results'], first['results'])
+        self.assertIsNone(back['previous'])
+
+    def test_html_pages_render_in_both_modes(self):
+        url = reverse('store:category_detail', args=['mac'])
+        self.assertContains(self.client.get(url, {'page': 2}), 'mac-')
+        response = self.client.get(url, {'paginate': 'cursor'})
+        self.assertTrue(response.context['cursor_mode'])
+        self.assertContains(response, 'cursor=')
+
+
+class QueryPlanTests(TestCase):
+    """
+    EXPLAIN QUERY PLAN для запросов горячих страниц: ни один запрос к таблицам
+    товаров, корзин и заказов не должен сканировать таблицу целиком.
+    """
+
+    # Небольшие справочники читаются целиком намеренно
+    FULL_SCAN_ALLOWED = {'store_category', 'store_facetcount'}
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='iPhone', slug='iphone')
+        self.product = make_product(self.category, 'iphone-15', Decimal('79990'), featured=True)
+        make_product(self.category, 'iphone-14', Decimal('69990'))
+        self.order = Order.objects.create(
+            first_name='Иван', last_name='Иванов', email='ivan@example.com',
+            phone='+70000000000', address='Москва', total_amount=Decimal('79990'),
+        )
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin123')
+
+    def assert_no_full_scans(self, method, url, **kwargs):
+        with CaptureQueriesContext(connection) as ctx:
+            getattr(self.client, method)(url, **kwargs)
+        for query in ctx.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT') or 'store_' not in sql:
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plan = [row[-1] for row in cursor.fetchall()]
+            for step in plan:
+                match = re.match(r'SCAN (\w+)', step)
+                if not match or 'USING' in step or 'VIRTUAL TABLE' in step:
+                    continue
+                if match.group(1) not in self.FULL_SCAN_ALLOWED:
+                    self.fail(f'Full scan in {url}: {step}\n{sql}')
+
+    def test_catalogue_pages(self):
+        self.assert_no_full_scans('get', reverse('store:home'))
+        for sort in ('name', 'price_asc', 'price_desc', 'newest'):
+            self.assert_no_full_scans('get', reverse('store:product_list') + f'?sort={sort}')
+            self.assert_no_full_scans('get', reverse('store:product_list') + f'?sort={sort}&category=iphone')
+            self.assert_no_full_scans('get', reverse('store:category_detail', args=['iphone']) + f'?sort={sort}')
+            self.assert_no_full_scans('get', reverse('store:product_list') + f'?sort={sort}&paginate=cursor')
+        self.assert_no_full_scans('get', reverse('store:product_list') + '?category=iphone&availability=available')
+        self.assert_no_full_scans('get', reverse('store:product_list') + '?search=iphone')
+        self.assert_no_full_scans('get', reverse('store:product_detail', args=['iphone-15']))
+
+    def test_cart_and_checkout(self):
+        self.client.post(
+            reverse('store:add_to_cart'),
+            data=json.dumps({'product_id': self.product.id}),
+            content_type='application/json',
+        )
+        self.assert_no_full_scans(
+            'post', reverse('store:add_to_cart'),
+            data=json.dumps({'product_id': self.product.id}), content_type='application/json',
+        )
+        self.assert_no_full_scans('get', reverse('store:cart'))
+        self.assert_no_full_scans('get', reverse('store:checkout'))
+        self.assert_no_full_scans('get', reverse('store:order_success', args=[self.order.id]))
+
+    def test_admin_changelists(self):
+        self.client.login(username='admin', password='admin123')
+        self.assert_no_full_scans('get', reverse('admin:store_order_changelist') + '?status__exact=pending')
+        self.assert_no_full_scans('get', reverse('admin:store_order_changelist'))
+        self.assert_no_full_scans('get', reverse('admin:store_product_changelist'))
+
+
+@override_settings(STORE_INSTRUMENTATION=True, STORE_ENFORCE_QUERY_BUDGETS=True)
+class QueryBudgetTests(TestCase):
+    """Бюджеты запросов STORE_QUERY_BUDGETS не зависят от размера корзины и каталога"""
+
+    def setUp(self):
+        cache.clear()
+        caches['catalogue'].clear()
+        registry.reset()
+        self.category = Category.objects.create(name='iPhone', slug='iphone')
+        self.products = [
+            make_product(self.category, f'iphone-{i}', Decimal(10000 + i), featured=True)
+            for i in range(15)
+        ]
+        # Половина товаров с учётом остатков, чтобы бюджеты покрывали и резервирование
+        Stock.objects.bulk_create([Stock(product=product, on_hand=100) for product in self.products[::2]])
+        for product in self.products:
+            self.client.post(
+                reverse('store:add_to_cart'),
+                data=json.dumps({'product_id': product.id}),
+                content_type='application/json',
+            )
+
+    def test_views_stay_within_budget(self):
+        item = Cart.objects.get().items.first()
+        self.client.get(reverse('store:home'))
+        self.client.get(reverse('store:product_list'))
+        self.client.get(reverse('store:product_list'), {'search': 'iphone', 'category': 'iphone'})
+        self.client.get(reverse('store:product_detail', args=['iphone-1']))
+        self.client.get(reverse('store:category_detail', args=['iphone']))
+        self.client.get(reverse('store:api_category_list'))
+        self.client.get(reverse('store:api_product_list'), {'category': 'iphone', 'sort': 'price_asc'})
+        self.client.get(reverse('store:api_product_list'), {'search': 'iphone'})
+        self.client.get(reverse('store:api_product_detail', args=['iphone-1']))
+        self.client.get(reverse('store:api_suggestions'), {'q': 'iph'})
+        self.client.get(reverse('store:cart'))
+        self.client.get(reverse('store:checkout'))
+        self.client.post(
+            reverse('store:update_cart_item'),
+            data=json.dumps({'item_id': item.id, 'quantity': 3}),
+            content_type='application/json',
+        )
+        self.client.post(
+            reverse('store:cart_batch'),
+            data=json.dumps({'operations': [
+                {'op': 'set', 'product_id': product.id, 'quantity': 2} for product in self.products[:4]
+            ]}),
+            content_type='application/json',
+        )
+        self.client.post(reverse('store:checkout'), {
+            'first_name': 'Иван', 'last_name': 'Петров', 'email': 'ivan@example.com',
+            'phone': '+79990000000', 'address': 'Москва',
+        })
+
+        metrics = registry.snapshot()
+        self.assertEqual(metrics['store:cart']['requests'], 1)
+        self.assertGreater(metrics['store:cart']['template_ms']['max'], 0)
+
+    def test_budget_violation_raises(self):
+        with override_settings(STORE_QUERY_BUDGETS={'store:home': 0}):
+            client = Client()
+            with self.assertRaises(QueryBudgetExceeded):
+                client.get(reverse('store:home'))
+
+
+class CatalogueApiTests(TestCase):
+    def setUp(self):
+        caches['catalogue'].clear()
+        self.iphone = Category.objects.create(name='iPhone', slug='iphone')
+        self.mac = Category.objects.create(name='Mac', slug='mac')
+        self.products = [
+            make_product(self.iphone, f'iphone-{i}', Decimal(50000 + i * 1000), availability='available')
+            for i in range(7)
+        ] + [make_product(self.mac, 'macbook-air', Decimal('99990'), availability='out_of_stock')]
+
+    def test_list_matches_catalogue_filters_and_sorting(self):
+        params = {'category': 'iphone', 'sort': 'price_desc', 'limit': 3, 'fields': 'slug,price'}
+        slugs = []
+        page = self.client.get(reverse('store:api_product_list'), params).json()
+        self.assertEqual(page['count'], 7)
+        self.assertEqual(set(page['results'][0]), {'slug', 'price'})
+        while True:
+            slugs += [row['slug'] for row in page['results']]
+            if not page['next']:
+                break
+            page = self.client.get(reverse('store:api_product_list'), {**params, 'cursor': page['next']}).json()
+        self.assertEqual(slugs, [f'iphone-{i}' for i in reversed(range(7))])
+
+        html = self.client.get(reverse('store:product_list'), {'category': 'iphone', 'sort': 'price_desc'})
+        self.assertEqual([p.slug for p in html.context['page_obj']], slugs[:len(html.context['page_obj'])])
+
+        data = self.client.get(reverse('store:api_product_list'), {'availability': 'out_of_stock'}).json()
+        self.assertEqual([row['slug'] for row in data['results']], ['macbook-air'])
+        self.assertEqual(data['results'][0]['url'], '/product/macbook-air/')
+
+    def test_conditional_get(self):
+        url = reverse('store:api_product_detail', args=['iphone-1'])
+        response = self.client.get(url, {'fields': 'name,price'})
+        self.assertEqual(response.json(), {'name': 'Iphone 1', 'price': '51000.00'})
+        etag = response['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'fields': 'name,price'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        list_url = reverse('store:api_product_list')
+        list_etag = self.client.get(list_url)['ETag']
+        self.assertEqual(self.client.get(list_url, HTTP_IF_NONE_MATCH=list_etag).status_code, 304)
+
+        product = self.products[1]
+        product.price = Decimal('49990')
+        product.save()
+        self.assertEqual(self.client.get(url, {'fields': 'name,price'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get(list_url, HTTP_IF_NONE_MATCH=list_etag).status_code, 200)
+
+    def test_errors_are_json(self):
+        response = self.client.get(reverse('store:api_product_list'), {'fields': 'name,secret'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('secret', response.json()['error'])
+        self.assertEqual(self.client.get(reverse('store:api_product_detail', args=['nope'])).status_code, 404)
+        self.assertEqual(self.client.post(reverse('store:api_category_list')).status_code, 405)
+        categories = self.client.get(reverse('store:api_category_list'), {'fields': 'slug'}).json()
+        self.assertEqual(categories['results'], [{'slug': 'mac'}, {'slug': 'iphone'}])
+
+
+class TypeaheadTests(TestCase):
+    def setUp(self):
+        caches['catalogue'].clear()
+        self.iphone = Category.objects.create(name='iPhone', slug='iphone')
+        self.pro = make_product(
+            self.iphone, 'iphone-15-pro', Decimal('99990'), name='iPhone 15 Pro',
+            specifications={'Чип': 'A17 Pro', 'Цвет': 'Чёрный титан'},
+        )
+        self.phone = make_product(self.iphone, 'iphone-15', Decimal('79990'), name='iPhone 15')
+        DailyProductSales.objects.create(
+            day=timezone.localdate(), status='delivered', product=self.phone, category=self.iphone,
+            orders=3, units=5, revenue=Decimal('399950'),
+        )
+
+    def suggest(self, query):
+        return self.client.get(reverse('store:api_suggestions'), {'q': query}).json()['results']
+
+    def test_prefixes_of_every_word_ranked_by_sales(self):
+        self.assertEqual(
+            [(row['kind'], row['label']) for row in self.suggest('IPH')],
+            [('category', 'iPhone'), ('product', 'iPhone 15'), ('product', 'iPhone 15 Pro')],
+        )
+        self.assertEqual([row['url'] for row in self.suggest('15 pr')], ['/product/iphone-15-pro/'])
+        self.assertEqual(self.suggest('чер'), [{
+            'kind': 'specification', 'label': 'Чёрный титан', 'group': 'Цвет',
+            'url': '/products/?search=%D0%A7%D1%91%D1%80%D0%BD%D1%8B%D0%B9+%D1%82%D0%B8%D1%82%D0%B0%D0%BD',
+        }])
+        self.assertEqual(self.suggest('a17')[0]['url'], '/products/?spec=%D0%A7%D0%B8%D0%BF%3AA17+Pro')
+        self.assertEqual(self.suggest('ipad'), [])
+        self.assertEqual(self.suggest(' '), [])
+
+    def test_index_is_rebuilt_when_catalogue_changes(self):
+        self.suggest('iphone')
+        with self.assertNumQueries(0):
+            self.suggest('iphone')
+        self.pro.name = 'iPhone 15 Pro Max'
+        self.pro.save()
+        self.assertIn('iPhone 15 Pro Max', [row['label'] for row in self.suggest('max')])
+
+
+class CatalogueCacheTests(TestCase):
+    """Кеш страниц и фрагментов каталога сбрасывается изменениями товаров и категорий"""
+
+    def setUp(self):
+        caches['catalogue'].clear()
+        cache_stats.reset()
+        self.category = Category.objects.create(name='iPhone', slug='iphone')
+        self.product = make_product(self.category, 'iphone-15', Decimal('79990'), featured=True)
+        make_product(self.category, 'iphone-case', Decimal('4990'))
+
+    def test_category_page_is_served_from_cache(self):
+        url = reverse('store:category_detail', args=['iphone'])
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertContains(response, 'Iphone 15')
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(cache_stats.snapshot()['page']['hits'], 1)
+
+        self.product.name = 'iPhone 15 Plus'
+        self.product.save()
+        self.assertContains(self.client.get(url), 'iPhone 15 Plus')
+
+    def test_detail_fragment_is_reused_and_invalidated(self):
+        url = reverse('store:product_detail', args=['iphone-15'])
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        # Только сам товар: категория и похожие товары берутся из фрагментов
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(cache_stats.snapshot()['fragment:product_detail']['hits'], 1)
+
+        self.category.name = 'Смартфоны iPhone'
+        self.category.save()
+        self.assertContains(self.client.get(url), 'Смартфоны iPhone')
+
+    def test_stock_availability_refreshes_only_its_category(self):
+        mac = Category.objects.create(name='Mac', slug='mac')
+        make_product(mac, 'macbook-air', Decimal('99990'))
+        Stock.objects.create(product=self.product, on_hand=1)
+        iphone_url = reverse('store:category_detail', args=['iphone'])
+        mac_url = reverse('store:category_detail', args=['mac'])
+        self.client.get(iphone_url)
+        self.client.get(mac_url)
+        version = get_version('catalogue')
+
+        product = Product.objects.get(pk=self.product.pk)
+        product.description = 'Новое описание'
+        product.save()
+        Client().post(reverse('store:add_to_cart'), json.dumps({'product_id': self.product.id}),
+                      content_type='application/json')
+        self.assertEqual(Product.objects.get(pk=self.product.pk).availability, 'out_of_stock')
+        self.assertEqual(get_version('catalogue'), version)
+
+        self.assertContains(self.client.get(iphone_url), 'Нет в наличии')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(mac_url)
+        self.assertEqual(len(queries), 0)
+
+    def test_fragments_vary_by_language(self):
+        url = reverse('store:product_detail', args=['iphone-15'])
+        self.client.get(url, HTTP_ACCEPT_LANGUAGE='ru')
+        self.client.get(url, HTTP_ACCEPT_LANGUAGE='en')
+        self.assertEqual(cache_stats.snapshot()['fragment:product_detail']['hits'], 0)
+        self.client.get(url, HTTP_ACCEPT_LANGUAGE='en')
+        self.assertEqual(cache_stats.snapshot()['fragment:product_detail']['hits'], 1)
+
+    def test_admin_list_editable_invalidates_home(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        admin = Client()
+        admin.login(username='admin', password='password')
+        self.assertContains(self.client.get(reverse('store:home')), 'Iphone 15')
+
+        products = list(Product.objects.order_by('name'))
+        data = {
+            'form-TOTAL_FORMS': len(products),
+            'form-INITIAL_FORMS': len(products),
+            '_save': 'Сохранить',
+        }
+        for index, product in enumerate(products):
+            data.update({
+                f'form-{index}-id': product.id,
+                f'form-{index}-price': product.price,
+                f'form-{index}-availability': product.availability,
+                f'form-{index}-featured': 'on' if product.featured else '',
+            })
+        data[f'form-{products.index(self.product)}-featured'] = ''
+        response = admin.post(reverse('admin:store_product_changelist'), data)
+        self.assertEqual(response.status_code, 302)
+
+        self.assertNotContains(self.client.get(reverse('store:home')), 'Iphone 15')
+
+
+class CatalogueSnapshotTests(TestCase):
+    """Списки из снимка каталога совпадают с выдачей базы"""
+
+    def setUp(self):
+        caches['catalogue'].clear()
+        self.iphone = Category.objects.create(name='iPhone', slug='iphone')
+        self.mac = Category.objects.create(name='Mac', slug='mac')
+        chips = ['A16 Bionic', 'A17 Pro', 'Apple M2']
+        for i in range(30):
+            make_product(
+                self.iphone if i % 3 else self.mac, f'model-{i}', Decimal(20000 + (i * 7919) % 150000),
+                name=f'Model {i % 7}', featured=i % 4 == 0, availability='pre_order' if i % 5 == 0 else 'available',
+                specifications={'Чип': chips[i % 3]} if i % 4 else {},
+            )
+
+    def listing(self, url, params):
+        caches['catalogue'].clear()
+        context = self.client.get(url, params).context
+        if 'featured_products' in context:
+            return [product.id for product in context['featured_products']]
+        return (
+            [product.id for product in context['page_obj']],
+            context['page_obj'].paginator.count,
+            context.get('facets'),
+        )
+
+    def test_listings_match_database(self):
+        cases = [
+            (reverse('store:product_list'), {}),
+            (reverse('store:product_list'), {'sort': 'name', 'page': 2}),
+            (reverse('store:product_list'), {'sort': 'price_desc', 'category': 'iphone', 'availability': 'available'}),
+            (reverse('store:product_list'), {'spec': ['Чип:A17 Pro', 'Чип:Apple M2'], 'price': [2, 3], 'sort': 'price_asc'}),
+            (reverse('store:category_detail', args=['iphone']), {'sort': 'newest', 'page': 2}),
+            (reverse('store:home'), {}),
+        ]
+        for url, params in cases:
+            with self.subTest(url=url, params=params):
+                database = self.listing(url, params)
+                with override_settings(STORE_CATALOGUE_SOURCE='snapshot'):
+                    self.assertEqual(self.listing(url, params), database)
+
+    @override_settings(STORE_CATALOGUE_SOURCE='snapshot')
+    def test_warm_cards_need_no_product_queries(self):
+        url = reverse('store:product_list')
+        self.client.get(url, {'sort': 'name', 'category': 'iphone'})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'sort': 'name', 'category': 'iphone'})
+        self.assertEqual(len(response.context['page_obj']), 12)
+        self.assertFalse([query for query in queries if 'store_product' in query['sql']])
+        self.assertEqual(self.client.get(reverse('store:category_detail', args=['ipad'])).status_code, 404)
+
+    @override_settings(STORE_CATALOGUE_SOURCE='snapshot')
+    def test_snapshot_follows_product_changes(self):
+        url = reverse('store:product_list')
+        product = make_product(self.mac, 'macbook-pro', Decimal('999990'), name='MacBook Pro')
+        self.assertEqual(self.listing(url, {'sort': 'price_desc'})[0][0], product.id)
+        product.price = Decimal('990')
+        product.save()
+        self.assertEqual(self.listing(url, {'sort': 'price_asc'})[0][0], product.id)
+        product.delete()
+        self.assertEqual(self.listing(url, {})[1], 30)
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='iPhone', slug='iphone')
+        self.products = [make_product(self.category, f'iphone-{i}', Decimal(10000 + i)) for i in range(20)]
+        self.customer = {
+            'first_name': 'Иван',
+            'last_name': 'Петров',
+            'email': 'ivan@example.com',
+            'phone': '+79990000000',
+            'address': 'Москва',
+        }
+
+    def fill_cart(self, client, products):
+        for product in products:
+            client.post(
+                reverse('store:add_to_cart'),
+                data=json.dumps({'product_id': product.id, 'quantity': 2}),
+                content_type='application/json',
+            )
+
+    def checkout_queries(self, size):
+        client = Client()
+        self.fill_cart(client, self.products[:size])
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post(reverse('store:checkout'), self.customer)
+        order = Order.objects.latest('id')
+        self.assertRedirects(response, reverse('store:order_success', args=[order.id]), fetch_redirect_response=False)
+        self.assertEqual(order.items.count(), size)
+        self.assertEqual(order.total_amount, sum(p.price * 2 for p in self.products[:size]))
+        self.assertFalse(Cart.objects.get(session_key=client.session.session_key).items.exists())
+        return len(queries)
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        self.assertEqual(self.checkout_queries(1), self.checkout_queries(20))
+
+    def test_out_of_stock_product_blocks_checkout(self):
+        self.fill_cart(self.client, self.products[:2])
+        Product.objects.filter(pk=self.products[0].pk).update(availability='out_of_stock')
+        response = self.client.post(reverse('store:checkout'), self.customer)
+        self.assertRedirects(response, reverse('store:cart'), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Cart.objects.get().items.count(), 2)
+
+    def test_changed_price_resyncs_cart(self):
+        self.fill_cart(self.client, self.products[:1])
+        Product.objects.filter(pk=self.products[0].pk).update(price=Decimal('5000'))
+        response = self.client.post(reverse('store:checkout'), self.customer)
+        self.assertRedirects(response, reverse('store:cart'), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Cart.objects.get().subtotal, Decimal('10000'))
+
+        self.client.post(reverse('store:checkout'), self.customer)
+        self.assertEqual(Order.objects.get().total_amount, Decimal('10000'))
+
+
+class OrderExportTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='iPhone', slug='iphone')
+        self.products = [make_product(category, f'iphone-{i}', Decimal(10000 + i)) for i in range(3)]
+        customer = {'first_name': 'Иван', 'last_name': 'Петров', 'email': 'ivan@example.com', 'phone': '+7', 'address': 'Москва'}
+        self.orders = []
+        for status, products in (('pending', self.products[:2]), ('shipped', self.products[2:])):
+            order = Order.objects.create(status=status, total_amount=sum(p.price for p in products), **customer)
+            for product in products:
+                order.items.create(product=product, price=product.price, quantity=1)
+            self.orders.append(order)
+        Order.objects.filter(pk=self.orders[0].pk).update(created_at=timezone.now() - timedelta(days=10))
+
+    def export(self, *args):
+        out = StringIO()
+        call_command('export_orders', *args, stdout=out)
+        return out.getvalue()
+
+    def test_csv_has_row_per_item(self):
+        rows = list(csv.DictReader(StringIO(self.export())))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual([row['order_id'] for row in rows], [str(self.orders[0].pk)] * 2 + [str(self.orders[1].pk)])
+        self.assertEqual(rows[0]['product_name'], self.products[0].name)
+        self.assertEqual(rows[0]['first_name'], 'Иван')
+
+    def test_jsonl_groups_items_by_order_and_filters(self):
+        orders = [json.loads(line) for line in self.export('--format', 'jsonl').splitlines()]
+        self.assertEqual([len(order['items']) for order in orders], [2, 1])
+        self.assertEqual(orders[0]['items'][1]['price'], '10001.00')
+
+        shipped = self.export('--format', 'jsonl', '--status', 'shipped').splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in shipped], [self.orders[1].pk])
+        recent = self.export('--format', 'jsonl', '--start', (timezone.localdate() - timedelta(days=1)).isoformat())
+        self.assertEqual([json.loads(line)['id'] for line in recent.splitlines()], [self.orders[1].pk])
+
+    def test_orders_without_items_are_exported(self):
+        empty = Order.objects.create(
+            status='cancelled', total_amount=0, first_name='Анна', last_name='Смирнова',
+            email='anna@example.com', phone='+7', address='Казань',
+        )
+        rows = list(csv.DictReader(StringIO(self.export())))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[-1]['order_id'], str(empty.pk))
+        self.assertEqual((rows[-1]['first_name'], rows[-1]['item_id'], rows[-1]['product_name']), ('Анна', '', ''))
+
+        orders = [json.loads(line) for line in self.export('--format', 'jsonl').splitlines()]
+        self.assertEqual([(order['id'], len(order['items'])) for order in orders],
+                         [(self.orders[0].pk, 2), (self.orders[1].pk, 1), (empty.pk, 0)])
+
+    def test_endpoint_streams_for_staff_only(self):
+        url = reverse('store:export_orders')
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.client.force_login(User.objects.create_user('staff', password='x', is_staff=True))
+        response = self.client.get(url, {'format': 'jsonl', 'status': 'pending'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="orders-all.jsonl"')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines], [self.orders[0].pk])
+        self.assertEqual(self.client.get(url, {'start': 'вчера'}).status_code, 400)
+
+
+class ProductImportTests(TestCase):
+    def setUp(self):
+        self.iphone = Category.objects.create(name='iPhone', slug='iphone')
+        self.mac = Category.objects.create(name='Mac', slug='mac')
+        make_product(self.iphone, 'iphone-15', Decimal('79990'))
+        make_product(self.iphone, 'iphone-14', Decimal('69990'))
+
+    def run_import(self, text, *args):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8', delete=False) as stream:
+            stream.write(text)
+        self.addCleanup(os.unlink, stream.name)
+        out, err = StringIO(), StringIO()
+        call_command('import_products', stream.name, *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def facet_counts(self):
+        return dict(FacetCount.objects.filter(count__gt=0).values_list('signature', 'count'))
+
+    def test_upserts_by_slug_and_reports_invalid_rows(self):
+        out, err = self.run_import(
+            'slug,name,category,price,specifications\n'
+            'iphone-15,,,74990,\n'
+            'iphone-14,,,69990,\n'
+            'macbook-air,MacBook Air,mac,119990,"{""Чип"": ""Apple M3""}"\n'
+            'ipad,iPad,ipad,49990,\n'
+            'iphone-13,,,дорого,\n'
+            'iphone-12,iPhone 12,iphone,,\n'
+        )
+        self.assertIn('6 rows: 1 created, 1 updated, 1 unchanged, 3 invalid', out)
+        self.assertIn('line 5: Неизвестная категория: ipad', err)
+        self.assertIn('line 6: price:', err)
+        self.assertIn('line 7: Новый товар iphone-12: не указаны price', err)
+
+        self.assertEqual(Product.objects.get(slug='iphone-15').price, Decimal('74990'))
+        macbook = Product.objects.get(slug='macbook-air')
+        self.assertEqual((macbook.category, macbook.specifications), (self.mac, {'Чип': 'Apple M3'}))
+        self.assertEqual(list(get_search_backend().filter(Product.objects.all(), 'macbook')), [macbook])
+
+        # Счётчики фасетов поправлены так же, как при полном пересчёте
+        counts = self.facet_counts()
+        rebuild_facet_counts(Product.objects.all(), FacetCount)
+        self.assertEqual(counts, self.facet_counts())
+
+    def test_untouched_products_stay_searchable(self):
+        self.run_import('slug,name\niphone-15,iPhone 15 Plus\n')
+        found = get_search_backend().filter(Product.objects.all(), 'iphone')
+        self.assertEqual(sorted(product.slug for product in found), ['iphone-14', 'iphone-15'])
+        self.assertEqual([p.slug for p in get_search_backend().filter(Product.objects.all(), 'plus')], ['iphone-15'])
+
+    def test_dry_run_shows_diff_without_writing(self):
+        out, _ = self.run_import('slug,price\niphone-15,74990\n', '--dry-run')
+        self.assertIn("~ iphone-15: price Decimal('79990.00') → Decimal('74990')", out)
+        self.assertIn('Dry run, nothing written', out)
+        self.assertEqual(Product.objects.get(slug='iphone-15').price, Decimal('79990'))
+
+    def test_admin_import_view(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'x'))
+        upload = SimpleUploadedFile(
+            'prices.jsonl', '{"slug": "iphone-14", "price": 59990, "availability": "out_of_stock"}\n'.encode(),
+        )
+        response = self.client.post(reverse('admin:store_product_import'), {'file': upload})
+        self.assertContains(response, 'обновлено: 1')
+        product = Product.objects.get(slug='iphone-14')
+        self.assertEqual((product.price, product.availability), (Decimal('59990'), 'out_of_stock'))
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.iphone = Category.objects.create(name='iPhone', slug='iphone')
+        self.mac = Category.objects.create(name='Mac', slug='mac')
+        self.phone = make_product(self.iphone, 'iphone-15', Decimal('80000'))
+        self.laptop = make_product(self.mac, 'macbook-air', Decimal('120000'))
+        self.customer = {'first_name': 'Иван', 'last_name': 'Петров', 'email': 'ivan@example.com', 'phone': '+7', 'address': 'Москва'}
+
+    def place_order(self, *lines):
+        client = Client()
+        for product, quantity in lines:
+            client.post(reverse('store:add_to_cart'), json.dumps({'product_id': product.id, 'quantity': quantity}),
+                        content_type='application/json')
+        client.post(reverse('store:checkout'), self.customer)
+        return Order.objects.latest('id')
+
+    def rollups(self):
+        return (
+            sorted(DailySales.objects.values_list('day', 'status', 'orders', 'units', 'revenue').filter(orders__gt=0)),
+            sorted(DailyProductSales.objects.values_list('day', 'status', 'product_id', 'category_id', 'orders', 'units', 'revenue').filter(orders__gt=0)),
+            sorted(DailyCarts.objects.values_list('day', 'carts')),
+        )
+
+    def test_checkout_and_status_changes_match_rebuild(self):
+        first = self.place_order((self.phone, 2), (self.laptop, 1))
+        self.place_order((self.phone, 1))
+        today = timezone.localdate()
+        self.assertEqual(DailySales.objects.get().revenue, Decimal('360000'))
+        self.assertEqual(DailyProductSales.objects.get(product=self.phone).units, 3)
+        self.assertEqual(DailyCarts.objects.get(day=today).carts, 2)
+
+        order = Order.objects.get(pk=first.pk)
+        order.status = 'cancelled'
+        order.save()
+        self.assertEqual(DailySales.objects.get(status='pending').orders, 1)
+        self.assertEqual(DailySales.objects.get(status='cancelled').revenue, Decimal('280000'))
+
+        incremental = self.rollups()
+        rebuild_sales_rollups()
+        self.assertEqual(self.rollups(), incremental)
+
+        Order.objects.get(pk=first.pk).delete()
+        self.assertFalse(DailySales.objects.filter(status='cancelled', orders__gt=0).exists())
+
+    def test_rebuild_keeps_counters_of_deleted_carts(self):
+        self.place_order((self.phone, 1))
+        for i in range(3):
+            Cart.objects.create(session_key=f'abandoned-{i}')
+        Cart.objects.update(updated_at=timezone.now() - timedelta(days=60))
+        call_command('purge_carts', stdout=StringIO())
+        self.assertFalse(Cart.objects.exists())
+
+        rebuild_sales_rollups()
+        self.assertEqual(DailyCarts.objects.get().carts, 4)
+        # День без счётчика заполняется по оставшимся корзинам
+        DailyCarts.objects.all().delete()
+        Cart.objects.create(session_key='fresh')
+        rebuild_sales_rollups()
+        self.assertEqual(DailyCarts.objects.get().carts, 1)
+
+    def test_dashboard_reads_rollups_only(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'x'))
+        self.place_order((self.laptop, 1))
+        with CaptureQueriesContext(connection) as few:
+            response = self.client.get(reverse('admin:store_dailysales_changelist'))
+        self.assertContains(response, 'Macbook Air')
+        self.assertEqual(response.context['totals']['conversion'], 100)
+
+        for _ in range(3):
+            self.place_order((self.phone, 1), (self.laptop, 2))
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(reverse('admin:store_dailysales_changelist'), {'days': 7})
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(response.context['top_sellers'][0]['units'], 7)
+        self.assertFalse(any('store_order' in query['sql'] for query in many.captured_queries))
+
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.iphone = Category.objects.create(name='iPhone', slug='iphone')
+        self.accessories = Category.objects.create(name='Аксессуары', slug='accessories')
+        self.phone = make_product(self.iphone, 'iphone-15', Decimal('80000'))
+        self.other_phone = make_product(self.iphone, 'iphone-14', Decimal('70000'))
+        self.case = make_product(self.accessories, 'iphone-15-case', Decimal('5000'))
+        self.charger = make_product(self.accessories, 'magsafe', Decimal('4000'))
+        self.customer = {'first_name': 'Иван', 'last_name': 'Петров', 'email': 'ivan@example.com', 'phone': '+7', 'address': 'Москва'}
+
+    def place_order(self, *products):
+        client = Client()
+        for product in products:
+            client.post(reverse('store:add_to_cart'), json.dumps({'product_id': product.id}), content_type='application/json')
+        with self.captureOnCommitCallbacks(execute=True):
+            client.post(reverse('store:checkout'), self.customer)
+
+    def neighbours(self, product):
+        return list(Recommendation.objects.filter(product=product).order_by('rank').values_list('recommended_id', 'score'))
+
+    def test_orders_update_top_neighbours_incrementally(self):
+        self.place_order(self.phone, self.case)
+        self.place_order(self.phone, self.case, self.charger)
+        self.place_order(self.case, self.charger)
+        self.assertEqual(self.neighbours(self.phone), [(self.case.id, 2), (self.charger.id, 1)])
+        self.assertEqual(self.neighbours(self.case), [(self.phone.id, 2), (self.charger.id, 2)])
+
+        incremental = {product.id: self.neighbours(product) for product in Product.objects.all()}
+        self.assertEqual(rebuild_co_purchases(max_pairs=2), {'pairs': 6, 'recommendations': 6})
+        self.assertEqual({product.id: self.neighbours(product) for product in Product.objects.all()}, incremental)
+
+    def test_pages_fall_back_to_category_neighbours(self):
+        self.place_order(self.phone, self.charger)
+        response = self.client.get(reverse('store:product_detail', args=[self.phone.slug]))
+        self.assertEqual(list(response.context['related_products']), [self.charger, self.other_phone])
+
+        self.client.post(reverse('store:add_to_cart'), json.dumps({'product_id': self.charger.id}), content_type='application/json')
+        response = self.client.get(reverse('store:cart'))
+        self.assertEqual(response.context['recommended_products'], [self.phone, self.case])
+
+
+class AdminChangelistTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='iPhone', slug='iphone')
+        self.product = make_product(category, 'iphone-15', Decimal('79990'))
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'x'))
+
+    def add_rows(self, count):
+        for i in range(count):
+            user = User.objects.create_user(f'user-{User.objects.count()}')
+            cart = Cart.objects.create(user=user)
+            cart.add_product(self.product, 2)
+            order = Order.objects.create(user=user, first_name='Иван', last_name='Петров', email='i@example.com',
+                                         phone='+7', address='Москва', total_amount=Decimal('159980'))
+            order.items.create(product=self.product, price=self.product.price, quantity=2)
+            make_product(self.product.category, f'iphone-{User.objects.count()}', Decimal('1000'))
+
+    def changelist_queries(self, name):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(reverse(f'admin:store_{name}_changelist')).status_code, 200)
+        return len(queries)
+
+    def test_changelists_do_not_query_per_row(self):
+        self.add_rows(2)
+        few = {name: self.changelist_queries(name) for name in ('cart', 'order', 'product')}
+        self.add_rows(10)
+        self.assertEqual({name: self.changelist_queries(name) for name in few}, few)
+
+        response = self.client.get(reverse('admin:store_order_changelist'))
+        self.assertEqual(response.context['cl'].result_list[0].units, 2)
+        # Число строк берётся из кеша при повторном открытии списка
+        self.client.get(reverse('admin:store_cart_changelist'))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('admin:store_cart_changelist'))
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries.captured_queries))
+
+    def test_inlines_load_products_with_lines(self):
+        self.add_rows(1)
+        order = Order.objects.get()
+        order.items.create(product=make_product(self.product.category, 'iphone-14', Decimal('69990')), price=1, quantity=1)
+        with CaptureQueriesContext(connection) as one:
+            self.client.get(reverse('admin:store_order_change', args=[order.pk]))
+        order.items.create(product=make_product(self.product.category, 'iphone-13', Decimal('59990')), price=1, quantity=1)
+        with CaptureQueriesContext(connection) as two:
+            response = self.client.get(reverse('admin:store_order_change', args=[order.pk]))
+        self.assertContains(response, 'Iphone 13')
+        self.assertEqual(len(two), len(one))
+
+
+class InventoryTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='iPhone', slug='iphone')
+        self.phone = make_product(self.category, 'iphone-15', Decimal('79990'))
+        self.stock = Stock.objects.create(product=self.phone, on_hand=3)
+
+    def add(self, quantity):
+        return self.client.post(
+            reverse('store:add_to_cart'),
+            data=json.dumps({'product_id': self.phone.id, 'quantity': quantity}),
+            content_type='application/json',
+        ).json()
+
+    def test_add_to_cart_reserves_and_refuses_oversell(self):
+        self.assertTrue(self.add(2)['success'])
+        self.stock.refresh_from_db()
+        self.assertEqual((self.stock.on_hand, self.stock.reserved), (3, 2))
+
+        response = Client().post(
+            reverse('store:add_to_cart'),
+            data=json.dumps({'product_id': self.phone.id, 'quantity': 2}),
+            content_type='application/json',
+        ).json()
+        self.assertFalse(response['success'])
+        self.assertIn('Недостаточно', response['message'])
+
+        self.assertTrue(self.add(1)['success'])
+        self.phone.refresh_from_db()
+        self.assertEqual(self.phone.availability, 'out_of_stock')
+
+        item = Cart.objects.get(session_key=self.client.session.session_key).items.get()
+        self.client.get(reverse('store:remove_from_cart', args=[item.id]))
+        self.stock.refresh_from_db()
+        self.phone.refresh_from_db()
+        self.assertEqual(self.stock.reserved, 0)
+        self.assertEqual(self.phone.availability, 'available')
+
+    def test_untracked_product_skips_stock_queries(self):
+        case = make_product(self.category, 'case', Decimal('1990'))
+        post = lambda: self.client.post(
+            reverse('store:add_to_cart'),
+            data=json.dumps({'product_id': case.id}),
+            content_type='application/json',
+        ).json()
+        self.assertTrue(post()['success'])
+        # Товар с признаком учёта, сессия, корзина, строка и итоги корзины (и точка сохранения):
+        # ни резерва, ни проверки Stock
+        with self.assertNumQueries(7):
+            self.assertTrue(post()['success'])
+        self.assertEqual(Cart.objects.get().items.get().quantity, 2)
+
+    def test_checkout_takes_stock(self):
+        self.add(3)
+        self.client.post(reverse('store:checkout'), CUSTOMER)
+        self.stock.refresh_from_db()
+        self.assertEqual((self.stock.on_hand, self.stock.reserved), (0, 0))
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(Product.objects.get().availability, 'out_of_stock')
+
+    def test_changed_prices_keep_reservations(self):
+        self.add(2)
+        Product.objects.filter(pk=self.phone.pk).update(price=Decimal('74990'))
+        self.client.post(reverse('store:checkout'), CUSTOMER)
+        self.assertFalse(Order.objects.exists())
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.reserved, 2)
+        self.assertEqual(StockReservation.objects.get().quantity, 2)
+
+    def test_clearing_cart_restores_availability(self):
+        self.add(3)
+        self.phone.refresh_from_db()
+        self.assertEqual(self.phone.availability, 'out_of_stock')
+        Cart.objects.get(session_key=self.client.session.session_key).clear()
+        self.phone.refresh_from_db()
+        self.assertEqual(self.phone.availability, 'available')
+
+    def test_expired_reservations_are_released(self):
+        self.add(2)
+        StockReservation.objects.update(expires_at=timezone.now())
+        out = StringIO()
+        call_command('release_expired_reservations', stdout=out)
+        self.assertIn('Released 2', out.getvalue())
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.reserved, 0)
+
+        # Резерв истёк, но остаток ещё свободен — заказ оформляется
+        self.client.post(reverse('store:checkout'), CUSTOMER)
+        self.assertEqual(Order.objects.count(), 1)
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.on_hand, 1)
+
+
+class SessionCartTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='iPhone', slug='iphone')
+        self.phone = make_product(self.category, 'iphone-15', Decimal('79990'))
+        self.case = make_product(self.category, 'iphone-15-case', Decimal('4990'))
+        Stock.objects.create(product=self.phone, on_hand=5)
+        self.user = User.objects.create_user('ivan', 'ivan@example.com', 'secret')
+
+    def add(self, client, product, quantity=1):
+        return client.post(
+            reverse('store:add_to_cart'),
+            data=json.dumps({'product_id': product.id, 'quantity': quantity}),
+            content_type='application/json',
+        ).json()
+
+    def test_empty_cart_is_not_stored(self):
+        self.assertEqual(self.client.get(reverse('store:cart')).status_code, 200)
+        response = self.client.get(reverse('store:checkout'))
+        self.assertRedirects(response, reverse('store:cart'), fetch_redirect_response=False)
+        self.assertFalse(Cart.objects.exists())
+        self.assertFalse(Session.objects.exists())
+
+    def test_cart_is_created_on_first_add_and_found_by_id(self):
+        self.add(self.client, self.phone)
+        cart = Cart.objects.get()
+        self.assertEqual(self.client.session[SESSION_KEY], cart.pk)
+
+        self.add(self.client, self.case)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('store:cart'))
+        self.assertEqual(Cart.objects.get().items_count, 2)
+        self.assertFalse(any('"store_cart"."session_key" =' in query['sql'] for query in queries))
+
+    def test_login_merges_anonymous_cart(self):
+        user_cart = Cart.objects.create(user=self.user)
+        user_cart.add_product(self.phone, 1)
+        self.add(self.client, self.phone, 2)
+        self.add(self.client, self.case)
+
+        self.client.login(username='ivan', password='secret')
+        cart = Cart.objects.get()
+        self.assertEqual(cart.pk, user_cart.pk)
+        self.assertEqual(self.client.session[SESSION_KEY], cart.pk)
+        self.assertEqual(
+            dict(cart.items.values_list('product__slug', 'quantity')),
+            {'iphone-15': 3, 'iphone-15-case': 1},
+        )
+        self.assertEqual((cart.items_count, cart.subtotal), (4, Decimal('79990') * 3 + Decimal('4990')))
+        self.assertEqual(Stock.objects.get().reserved, 3)
+        self.assertEqual(StockReservation.objects.get().quantity, 3)
+
+    def test_login_adopts_anonymous_cart(self):
+        self.add(self.client, self.case)
+        self.client.login(username='ivan', password='secret')
+        self.assertEqual(Cart.objects.get().user, self.user)
+        self.assertContains(self.client.get(reverse('store:cart')), 'Iphone 15 Case')
+
+    def test_purge_deletes_stale_carts_in_batches(self):
+        old = timezone.now() - timedelta(days=60)
+        abandoned = Cart.objects.create(session_key='abandoned')
+        abandoned.add_product(self.phone, 2)
+        Cart.objects.create(user=self.user)
+        kept = Cart.objects.create(user=User.objects.create_user('petr'))
+        kept.add_product(self.case)
+        fresh = Cart.objects.create(session_key='fresh')
+        Cart.objects.exclude(pk=fresh.pk).update(updated_at=old)
+
+        out = StringIO()
+        call_command('purge_carts', '--batch-size', '1', stdout=out)
+        self.assertIn('Deleted 2 carts', out.getvalue())
+        self.assertQuerysetEqual(Cart.objects.order_by('pk'), [kept, fresh])
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(Stock.objects.get().reserved, 0)
+
+
+@override_settings(STORE_CART_BACKEND='cookie')
+class CookieCartTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='iPhone', slug='iphone')
+        self.phone = make_product(self.category, 'iphone-15', Decimal('79990'))
+        self.case = make_product(self.category, 'iphone-15-case', Decimal('4990'))
+        self.stock = Stock.objects.create(product=self.phone, on_hand=3)
+
+    def post(self, name, data):
+        return self.client.post(reverse(name), data=json.dumps(data), content_type='application/json').json()
+
+    def test_cart_changes_do_not_write_to_database(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(self.post('store:add_to_cart', {'product_id': self.phone.id, 'quantity': 2})['success'])
+            response = self.post('store:add_to_cart', {'product_id': self.case.id})
+            self.assertEqual((response['cart_total_items'], response['cart_total_price']), (3, 164970.0))
+            response = self.post('store:update_cart_item', {'item_id': self.case.id, 'quantity': 2})
+            self.assertEqual(response['item_total'], 9980.0)
+            page = self.client.get(reverse('store:cart'))
+        self.assertFalse([q['sql'] for q in queries if not q['sql'].startswith('SELECT')])
+        self.assertContains(page, 'Iphone 15 Case')
+        self.assertEqual(page.context['cart'].total_items, 4)
+        self.assertFalse(Cart.objects.exists())
+
+        # Резерв не берётся, но свободный остаток проверяется
+        response = self.post('store:add_to_cart', {'product_id': self.phone.id, 'quantity': 2})
+        self.assertFalse(response['success'])
+
+        self.client.get(reverse('store:remove_from_cart', args=[self.case.id]))
+        self.assertEqual(self.client.get(reverse('store:cart')).context['cart'].total_items, 2)
+
+    def test_checkout_materializes_cart(self):
+        self.post('store:add_to_cart', {'product_id': self.phone.id, 'quantity': 2})
+        self.post('store:add_to_cart', {'product_id': self.case.id})
+        response = self.client.post(reverse('store:checkout'), CUSTOMER)
+        order = Order.objects.get()
+        self.assertRedirects(response, reverse('store:order_success', args=[order.id]), fetch_redirect_response=False)
+        self.assertEqual(order.total_amount, Decimal('164970'))
+        self.assertEqual(response.cookies['store_cart'].value, '')
+        self.stock.refresh_from_db()
+        self.assertEqual((self.stock.on_hand, self.stock.reserved), (1, 0))
+        self.assertFalse(Cart.objects.exists())
+
+    def test_tampered_cookie_is_dropped(self):
+        self.client.cookies['store_cart'] = f'{self.phone.id}:1:forged'
+        response = self.client.get(reverse('store:cart'))
+        self.assertEqual(response.context['cart'].total_items, 0)
+        self.assertEqual(response.cookies['store_cart'].value, '')
+
+    def test_login_moves_cookie_cart_to_database(self):
+        self.post('store:add_to_cart', {'product_id': self.phone.id, 'quantity': 2})
+        User.objects.create_user('ivan', 'ivan@example.com', 'secret', is_staff=True)
+        response = self.client.post(reverse('admin:login'), {'username': 'ivan', 'password': 'secret'})
+        self.assertEqual(response.cookies['store_cart'].value, '')
+        cart = Cart.objects.get()
+        self.assertEqual(cart.user.username, 'ivan')
+        self.assertEqual(cart.items.get().quantity, 2)
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.reserved, 2)
+        self.assertEqual(self.client.get(reverse('store:cart')).context['cart'].total_items, 2)
+
+
+class CartBatchTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='iPhone', slug='iphone')
+        self.phone = make_product(self.category, 'iphone-15', Decimal('79990'))
+        self.case = make_product(self.category, 'iphone-15-case', Decimal('4990'))
+        self.cable = make_product(self.category, 'usb-c-cable', Decimal('1990'))
+        self.stock = Stock.objects.create(product=self.phone, on_hand=5)
+
+    def batch(self, *operations):
+        return self.client.post(
+            reverse('store:cart_batch'), data=json.dumps({'operations': list(operations)}),
+            content_type='application/json',
+        )
+
+    def quantities(self, data):
+        return {item['product_id']: item['quantity'] for item in data['cart']['items']}
+
+    def check_batch(self):
+        data = self.batch(
+            {'op': 'add', 'product_id': self.phone.id, 'quantity': 2},
+            {'op': 'add', 'product_id': self.case.id},
+            {'op': 'add', 'product_id': self.phone.id},
+            {'op': 'set', 'product_id': self.cable.id, 'quantity': 4},
+        ).json()
+        self.assertTrue(data['success'])
+        self.assertEqual(self.quantities(data), {self.phone.id: 3, self.case.id: 1, self.cable.id: 4})
+        self.assertEqual(data['cart']['total_items'], 8)
+
+        data = self.batch(
+            {'op': 'set', 'product_id': self.phone.id, 'quantity': 1},
+            {'op': 'remove', 'product_id': self.case.id},
+            {'op': 'set', 'product_id': self.cable.id, 'quantity': 0},
+        ).json()
+        self.assertEqual(self.quantities(data), {self.phone.id: 1})
+        self.assertEqual(data['cart']['total_price'], 79990.0)
+
+        # Нехватка остатка откатывает весь пакет
+        data = self.batch(
+            {'op': 'add', 'product_id': self.case.id},
+            {'op': 'set', 'product_id': self.phone.id, 'quantity': 6},
+        ).json()
+        self.assertFalse(data['success'])
+        self.assertIn('Недостаточно', data['message'])
+        self.assertEqual(self.quantities(data), {self.phone.id: 1})
+
+    def test_database_batch(self):
+        self.check_batch()
+        cart = Cart.objects.get()
+        self.assertEqual((cart.items_count, cart.subtotal), (1, Decimal('79990')))
+        self.assertEqual(cart.items.get().quantity, 1)
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.reserved, 1)
+
+    def test_queries_do_not_grow_with_tracked_products(self):
+        phones = [make_product(self.category, f'iphone-{i}', Decimal('79990')) for i in range(6)]
+        Stock.objects.bulk_create([Stock(product=phone, on_hand=5) for phone in phones])
+        counts = []
+        for size in (2, 6):
+            client = Client()
+            client.post(reverse('store:add_to_cart'), json.dumps({'product_id': self.cable.id}),
+                        content_type='application/json')
+            for quantity in (2, 0):
+                with CaptureQueriesContext(connection) as queries:
+                    response = client.post(reverse('store:cart_batch'), data=json.dumps({'operations': [
+                        {'op': 'set', 'product_id': phone.id, 'quantity': quantity} for phone in phones[:size]
+                    ]}), content_type='application/json')
+                self.assertTrue(response.json()['success'])
+                counts.append(len(queries))
+            self.assertFalse(StockReservation.objects.filter(product__in=phones).exists())
+        self.assertEqual(counts[:2], counts[2:])
+        self.assertFalse(Stock.objects.filter(product__in=phones, reserved__gt=0).exists())
+
+    @override_settings(STORE_CART_BACKEND='cookie')
+    def test_cookie_batch(self):
+        self.check_batch()
+        self.assertFalse(Cart.objects.exists())
+        self.assertEqual(Stock.objects.get().reserved, 0)
+
+    def test_invalid_batches_are_rejected(self):
+        for operations in ([], [{'op': 'double', 'product_id': self.phone.id}],
+                           [{'op': 'add', 'product_id': self.phone.id, 'quantity': 0}],
+                           [{'op': 'set', 'product_id': 0, 'quantity': 1}]):
+            response = self.batch(*operations)
+            self.assertEqual(response.status_code, 400, operations)
+            self.assertFalse(response.json()['success'])
+        self.assertFalse(Cart.objects.exists())
+
+
+class DatabaseRoutingTests(TransactionTestCase):
+    """Чтение каталога идёт в соединение только для чтения, запись и транзакции — в default"""
+
+    databases = {'default', 'catalogue_read'}
+
+    def test_catalogue_reads_use_read_connection(self):
+        category = Category.objects.create(name='iPhone', slug='iphone')
+        make_product(category, 'iphone-15', Decimal('79990'))
+        self.assertEqual(Product.objects.all().db, 'catalogue_read')
+        self.assertEqual(Cart.objects.all().db, 'default')
+        with transaction.atomic():
+            self.assertEqual(Product.objects.all().db, 'default')
+
+        product = Product.objects.get()
+        product.price = Decimal('74990')
+        product.save()
+        cart = Cart.objects.create(session_key='routing')
+        cart.add_product(product)
+        self.assertEqual(cart.items.get().product, product)
+        self.assertEqual(Product.objects.get().price, Decimal('74990'))
+
+    def test_pragmas_and_read_only_connection(self):
+        with connections['default'].cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 20000)
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+        with self.assertRaises(OperationalError):
+            Category.objects.using('catalogue_read').create(name='Mac', slug='mac')
+
+    def test_journal_mode_changes_only_on_request(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        connections['scratch'] = type(connections['default'])(
+            {**connection.settings_dict, 'NAME': os.path.join(directory, 'scratch.sqlite3')}, alias='scratch',
+        )
+        self.addCleanup(connections['scratch'].close)
+        self.addCleanup(connections.__delitem__, 'scratch')
+
+        def journal_mode():
+            with connections['scratch'].cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                return cursor.fetchone()[0]
+
+        with override_settings(STORE_SQLITE_PRAGMAS={'journal_mode': 'wal', 'busy_timeout': 20000}):
+            self.assertEqual(journal_mode(), 'delete')
+        call_command('set_journal_mode', 'wal', '--database', 'scratch', stdout=StringIO())
+        connections['scratch'].close()
+        self.assertEqual(journal_mode(), 'wal')
+
+
+class CheckoutConcurrencyTests(TransactionTestCase):
+    """Много потоков покупают один товар: продаётся ровно остаток, без перепродажи"""
+
+    databases = {'default', 'catalogue_read'}
+
+    def test_hot_sku_is_never_oversold(self):
+        category = Category.objects.create(name='iPhone', slug='iphone')
+        phone = make_product(category, 'iphone-15', Decimal('79990'))
+        Stock.objects.create(product=phone, on_hand=25)
+
+        stats = run_checkout_stress(phone, customers=60, threads=8)
+
+        self.assertEqual(stats['orders'], 25)
+        self.assertEqual(stats['sold_out'], 35)
+        stock = Stock.objects.get()
+        self.assertEqual((stock.on_hand, stock.reserved), (0, 0))
+        self.assertEqual(Order.objects.count(), 25)
+        self.assertEqual(Product.objects.get().availability, 'out_of_stock')
+
+
+def image_upload(name='phone.png', size=(1600, 1200), mode='RGBA', color=(200, 30, 30)):
+    buffer = io.BytesIO()
+    Image.new(mode, size, color + (255,) if mode == 'RGBA' else color).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+@override_settings(STORE_IMAGE_WORKER='external')
+class ImagePipelineTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.category = Category.objects.create(name='iPhone', slug='iphone')
+        self.phone = make_product(self.category, 'iphone-15', Decimal('79990'), image=image_upload())
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_only_image_changes_are_queued(self):
+        self.assertEqual(ImageJob.objects.filter(status=ImageJob.PENDING).count(), 1)
+
+        phone = Product.objects.get()
+        phone.price = Decimal('69990')
+        phone.save()
+        self.assertEqual(ImageJob.objects.count(), 1)
+
+        phone.image = image_upload('phone-2.png')
+        phone.save()
+        job = ImageJob.objects.get()
+        self.assertEqual(job.image_name, phone.image.name)
+
+    def test_worker_builds_renditions_and_keeps_original(self):
+        self.assertEqual(drain_queue(), 1)
+        self.assertEqual(ImageJob.objects.get().status, ImageJob.DONE)
+
+        renditions = {(r.name, r.format): r for r in ImageRendition.objects.all()}
+        self.assertEqual(len(renditions), 10)
+        card = renditions['card', 'WEBP']
+        self.assertEqual((card.width, card.height), (560, 420))
+        with Image.open(card.file.path) as stored:
+            self.assertEqual(stored.size, (560, 420))
+        self.assertEqual(renditions['thumbnail', 'JPEG'].width, 160)
+        with Image.open(Product.objects.get().image.path) as original:
+            self.assertEqual(original.size, (1600, 1200))
+
+    def test_superseded_job_is_skipped(self):
+        job = ImageJob.objects.get()
+        Product.objects.filter(pk=self.phone.pk).update(image='products/other.png')
+        drain_queue()
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImageJob.SUPERSEDED)
+        self.assertFalse(ImageRendition.objects.exists())
+
+    def test_backfill_command(self):
+        ImageJob.objects.all().delete()
+        out = StringIO()
+        call_command('backfill_image_renditions', '--workers=1', stdout=out)
+        self.assertIn('Queued 1 images', out.getvalue())
+        self.assertEqual(ImageRendition.objects.count(), 10)
+
+        out = StringIO()
+        call_command('backfill_image_renditions', '--workers=1', stdout=out)
+        self.assertIn('Queued 0 images', out.getvalue())
+
+    def test_rendition_names_follow_content(self):
+        drain_queue()
+        names = set(ImageRendition.objects.values_list('file', flat=True))
+        self.assertRegex(min(names), r'^products/renditions/\d+/\w+\.[0-9a-f]{12}\.(jpg|webp)$')
+
+        # Повторная обработка того же файла даёт те же адреса
+        render_image(Product.objects.get())
+        self.assertEqual(set(ImageRendition.objects.values_list('file', flat=True)), names)
+
+        phone = Product.objects.get()
+        phone.image = image_upload('phone-2.png', color=(30, 30, 200))
+        phone.save()
+        drain_queue()
+        renamed = set(ImageRendition.objects.values_list('file', flat=True))
+        self.assertFalse(names & renamed)
+        self.assertFalse(any(default_storage.exists(name) for name in names))
+
+    def test_category_image_is_processed(self):
+        self.category.image = image_upload('category.png')
+        self.category.save()
+        drain_queue()
+        self.assertEqual(self.category.renditions.count(), 10)
+
+    def test_responsive_image_tag(self):
+        drain_queue()
+        product = Product.objects.prefetch_related('renditions').get()
+        html = Template("{% load store_images %}{% responsive_image product 'card' 'card-img-top' %}").render(
+            Context({'product': product})
+        )
+        self.assertIn('<source type="image/webp"', html)
+        card = product.renditions.get(name='card', format='JPEG')
+        self.assertIn(f'src="{card.file.url}"', html)
+        self.assertIn(' 1200w', html)
+        self.assertIn('width="560" height="420"', html)
+        self.assertIn('loading="lazy"', html)
+
+
+class FallbackImageTests(TestCase):
+    def test_fallback_url_is_filled_on_save(self):
+        category = Category.objects.create(name='iPhone', slug='iphone')
+        phone = make_product(category, 'iphone-15-pro', Decimal('99990'), name='iPhone 15 Pro Max')
+        self.assertIn('iphone-15-pro-finish-select', phone.fallback_image_url)
+        cable = make_product(category, 'cable', Decimal('1990'), name='USB-C кабель')
+        self.assertEqual(cable.fallback_image_url, '')
+
+    def test_fallback_srcset_resizes_on_cdn(self):
+        product = Product(name='AirPods Pro', fallback_image_url=fallback_image_for('AirPods Pro'))
+        html = Template("{% load store_images %}{% responsive_image product 'thumbnail' %}").render(
+            Context({'product': product})
+        )
+        self.assertIn('wid=160&amp;hei=160', html)
+        self.assertIn(' 800w', html)
+        self.assertNotIn('<picture>', html)
+
+
+class SyntheticDataTests(TestCase):
+    def test_generated_data_is_deterministic_and_consistent(self):
+        counts = generate_dataset(categories=8, products=300, carts=20, orders=100, seed=7)
+        self.assertEqual(counts['products'], 300)
+        self.assertEqual(Product.objects.filter(slug__startswith='load-').count(), 300)
+        self.assertEqual(Stock.objects.count(), counts['stock'])
+        self.assertFalse(Stock.objects.filter(on_hand=0, product__availability='available').exists())
+        names = list(Product.objects.order_by('slug').values_list('name', 'price'))
+
+        cart = Cart.objects.filter(session_key__startswith='load-').first()
+        self.assertEqual(cart.items_count, sum(item.quantity for item in cart.items.all()))
+        order = Order.objects.first()
+        self.assertEqual(order.total_amount, sum(item.price * item.quantity for item in order.items.all()))
+        self.assertLess(Order.objects.order_by('created_at').first().created_at, timezone.now() - timedelta(days=7))
+        self.assertTrue(get_search_backend().filter(Product.objects.all(), 'iphone').exists())
+        # История попадает в итоги продаж и рекомендации
+        self.assertEqual(DailySales.objects.aggregate(orders=Sum('orders'))['orders'], 100)
+        self.assertEqual(DailyCarts.objects.aggregate(carts=Sum('carts'))['carts'], 20)
+        self.assertTrue(Recommendation.objects.exists())
+
+        self.assertEqual(clear_dataset(), 300)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(DailyCarts.objects.aggregate(carts=Sum('carts'))['carts'], 0)
+        for model in (DailySales, DailyProductSales, CoPurchase, Recommendation):
+            self.assertFalse(model.objects.exists(), model)
+        generate_dataset(categories=8, products=300, carts=0, orders=0, seed=7)
+        self.assertEqual(list(Product.objects.order_by('slug').values_list('name', 'price')), names)
+
+    def test_trace_replays_against_views(self):
+        generate_dataset(categories=6, products=60, carts=0, orders=0, seed=3)
+        stream = StringIO()
+        write_trace(build_trace(60, seed=3, sessions=5), stream)
+        stream.seek(0)
+        clients = {}
+        for entry in read_trace(stream):
+            client = clients.setdefault(entry['session'], Client())
+            if entry['method'] == 'GET':
+                response = client.get(entry['path'], entry.get('query'))
+            elif 'json' in entry:
+                response = client.post(entry['path'], json.dumps(entry['json']), content_type='application/json')
+            else:
+                response = client.post(entry['path'], entry['data'])
+            self.assertLess(response.status_code, 400, entry)
+
+
+class ViewBenchmarkTests(TestCase):
+    def test_every_scenario_succeeds(self):
+        fixtures = seed_dataset(products=60, orders=10, seed=1)
+        results = run_benchmark(build_scenarios(fixtures), iterations=2, warmup=1, alloc_iterations=1, rounds=2)
+        self.assertIn('checkout:submit', results)
+        for name, result in results.items():
+            self.assertTrue(all(status < 400 for status in result['status']), name)
+            self.assertEqual(result['requests'], 2)
+            self.assertGreater(result['alloc_peak_kib'], 0)
+        self.assertEqual(results['checkout:submit']['status'], [302])
+
+    def test_compare_flags_slowdowns_and_extra_queries(self):
+        baseline = {'scenarios': {
+            'cart': {'p50_ms': 10.0, 'p95_ms': 20.0, 'queries': 4},
+            'home': {'p50_ms': 1.0, 'p95_ms': 2.0, 'queries': 0},
+        }}
+        results = {'scenarios': {
+            'cart': {'p50_ms': 14.0, 'p95_ms': 21.0, 'queries': 5},
+            # +50%, но меньше min_delta_ms — шум
+            'home': {'p50_ms': 1.5, 'p95_ms': 3.0, 'queries': 0},
+            'order_success': {'p50_ms': 5.0, 'p95_ms': 6.0, 'queries': 4},
+        }}
+        regressions = compare(results, baseline, threshold=0.25, min_delta_ms=2.0)
+        self.assertEqual(regressions, ['cart: p50_ms 10.00 -> 14.00 (+40%)', 'cart: queries 4 -> 5'])
@@ -0,0 +1,210 @@
+"""
+Подсказки поиска по мере ввода из индекса в памяти процесса.
+
+Подсказки — товары, категории и значения характеристик
+STORE_TYPEAHEAD_SPECIFICATIONS. Индекс — отсортированный список слов их
+подписей, и для каждого слова массив номеров подсказок. Подсказки пронумерованы
+по убыванию популярности, поэтому массивы уже упорядочены по рангу: слова
+с префиксом запроса находятся bisect'ом, а первые limit подсказок берутся
+ленивым слиянием массивов, без сортировки всех совпадений.
+
+Индекс строится при первом запросе и перестраивается, когда меняется версия
+каталога (сигналы сохранения товаров и категорий, импорт) или истекает
+STORE_TYPEAHEAD_MAX_AGE — популярность берётся из итогов продаж
+(caching.VersionedObject).
+"""
+import heapq
+import re
+import sys
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from itertools import accumulate
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.db.models import Sum
+from django.urls import reverse
+
+from .analytics import EXCLUDED_STATUSES
+from .caching import VersionedObject
+from .facets import specification_keys
+from .models import Category, DailyProductSales, Product
+
+
+PRODUCT, CATEGORY, SPECIFICATION = 'product', 'category', 'specification'
+KINDS = (PRODUCT, CATEGORY, SPECIFICATION)
+MAX_LIMIT = 20
+# Слияние стольких массивов и больше дороже запроса к словарю — такие префиксы запоминаются
+MEMO_RANGE = 32
+
+_WORD = re.compile(r'\w+')
+
+
+def words(text):
+    """Слова текста в нижнем регистре, ё как е"""
+    return _WORD.findall(str(text).lower().replace('ё', 'е'))
+
+
+def specifications():
+    return list(getattr(settings, 'STORE_TYPEAHEAD_SPECIFICATIONS', specification_keys()))
+
+
+class TypeaheadIndex:
+    """Неизменяемый индекс подсказок из кортежей (вид, подпись, ключ, популярность)"""
+
+    def __init__(self, suggestions):
+        self.kinds = bytearray()
+        self.labels = []
+        # slug товара или категории; (характеристика, значение) для характеристик
+        self.keys = []
+        self.entry_words = []
+        self._memo = {}
+
+        postings = defaultdict(lambda: array('I'))
+        vocabulary = {}
+        # Номер подсказки — её место по убыванию популярности
+        for number, (kind, label, key, _) in enumerate(sorted(suggestions, key=lambda row: (-row[3], row[1]))):
+            self.kinds.append(KINDS.index(kind))
+            self.labels.append(label)
+            self.keys.append(key)
+            # Одинаковые слова разных подсказок хранятся одной строкой
+            entry = tuple(dict.fromkeys(vocabulary.setdefault(word, word) for word in words(label)))
+            self.entry_words.append(entry)
+            for word in entry:
+                postings[word].append(number)
+
+        self.words = sorted(postings)
+        self.postings = [postings[word] for word in self.words]
+        # Число вхождений слов words[lo:hi] — offsets[hi] - offsets[lo]
+        self.offsets = array('Q', accumulate((len(numbers) for numbers in self.postings), initial=0))
+
+        # Адреса собираются по шаблонам: reverse на каждую подсказку дороже самого поиска
+        self._urls = {
+            PRODUCT: reverse('store:product_detail', args=['__slug__']).replace('__slug__', '{}'),
+            CATEGORY: reverse('store:category_detail', args=['__slug__']).replace('__slug__', '{}'),
+            SPECIFICATION: reverse('store:product_list') + '?',
+        }
+        self._facets = set(specification_keys())
+
+    def __len__(self):
+        return len(self.labels)
+
+    def _range(self, prefix):
+        lo = bisect_left(self.words, prefix)
+        return lo, bisect_left(self.words, prefix + '\uffff', lo)
+
+    def _ranked(self, lo, hi):
+        """Номера подсказок со словами words[lo:hi] по возрастанию, без повторов"""
+        if hi - lo == 1:
+            yield from self.postings[lo]
+            return
+        previous = None
+        for number in heapq.merge(*self.postings[lo:hi]):
+            if number != previous:
+                previous = number
+                yield number
+
+    def search(self, query, limit=8):
+        """Номера первых limit подсказок, в словах которых есть префикс каждого слова запроса"""
+        terms = words(query)
+        if not terms:
+            return []
+        ranges = [self._range(term) for term in terms]
+        if any(lo == hi for lo, hi in ranges):
+            return []
+        # Перебираются подсказки самого редкого слова запроса; для остальных слов
+        # у подсказки должно найтись слово из их диапазона словаря
+        rarest = min(range(len(terms)), key=lambda i: self.offsets[ranges[i][1]] - self.offsets[ranges[i][0]])
+        lo, hi = ranges.pop(rarest)
+        others = [set(self.words[other_lo:other_hi]) for other_lo, other_hi in ranges]
+
+        if not others and hi - lo >= MEMO_RANGE and limit <= MAX_LIMIT:
+            top = self._memo.get(terms[0])
+            if top is None:
+                top = self._memo[terms[0]] = self._top(self._ranked(lo, hi), others, MAX_LIMIT)
+            return top[:limit]
+        return self._top(self._ranked(lo, hi), others, limit)
+
+    def _top(self, numbers, others, limit):
+        found = []
+        for number in numbers:
+            entry = self.entry_words[number]
+            if all(not matching.isdisjoint(entry) for matching in others):
+                found.append(number)
+                if len(found) >= limit:
+                    break
+        return found
+
+    def suggestion(self, number):
+        kind, label, key = KINDS[self.kinds[number]], self.labels[number], self.keys[number]
+        if kind != SPECIFICATION:
+            return {'kind': kind, 'label': label, 'url': self._urls[kind].format(key)}
+        name, value = key
+        # Фасетные характеристики открывают фильтр каталога, остальные — поиск по значению
+        params = {'spec': f'{name}:{value}'} if name in self._facets else {'search': value}
+        return {'kind': kind, 'label': label, 'group': name, 'url': self._urls[kind] + urlencode(params)}
+
+    def suggest(self, query, limit=8):
+        return [self.suggestion(number) for number in self.search(query, limit)]
+
+    def memory_usage(self):
+        """Байты по частям индекса (sys.getsizeof контейнеров и уникальных объектов в них)"""
+        def size(*objects):
+            return sum(sys.getsizeof(obj) for obj in objects)
+
+        keys = {id(key): key for key in self.keys}.values()
+        return {
+            'words': size(self.words, *self.words),
+            'postings': size(self.postings, self.offsets, *self.postings),
+            'suggestion words': size(self.entry_words, *self.entry_words),
+            'labels': size(self.labels, *self.labels),
+            'keys': size(self.keys, *keys) + sum(size(*key) for key in keys if isinstance(key, tuple)),
+            'kinds': size(self.kinds),
+        }
+
+
+def load_suggestions(batch_size=5000):
+    """
+    Подсказки (вид, подпись, ключ, популярность) из базы.
+
+    Популярность товара — продано штук; категории и значения характеристики —
+    продажи её товаров плюс их число, чтобы без истории заказов выше были
+    крупные группы.
+    """
+    sold = dict(
+        DailyProductSales.objects.exclude(status__in=EXCLUDED_STATUSES)
+        .values('product_id').annotate(units=Sum('units')).order_by().values_list('product_id', 'units')
+    )
+    keys = specifications()
+    category_scores, spec_scores = Counter(), Counter()
+    suggestions = []
+    products = Product.objects.values_list('id', 'name', 'slug', 'category_id', 'specifications').order_by()
+    for product_id, name, slug, category_id, specs in products.iterator(chunk_size=batch_size):
+        units = sold.get(product_id, 0)
+        suggestions.append((PRODUCT, name, slug, units))
+        category_scores[category_id] += units + 1
+        if isinstance(specs, dict):
+            for key in keys:
+                if specs.get(key) not in (None, ''):
+                    spec_scores[key, str(specs[key])] += units + 1
+    for category_id, name, slug in Category.objects.values_list('id', 'name', 'slug'):
+        suggestions.append((CATEGORY, name, slug, category_scores[category_id]))
+    for (key, value), score in spec_scores.items():
+        suggestions.append((SPECIFICATION, value, (key, value), score))
+    return suggestions
+
+
+def build_index():
+    return TypeaheadIndex(load_suggestions())
+
+
+_index = VersionedObject(build_index, 'catalogue', max_age_setting='STORE_TYPEAHEAD_MAX_AGE')
+
+
+def get_index():
+    return _index.get()
+
+
+def suggest(query, limit=8):
+    return get_index().suggest(query, min(limit, MAX_LIMIT))
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 app_name = 'store'
 
@@ -11,7 +11,14 @@ urlpatterns = [
     path('cart/', views.cart_view, name='cart'),
     path('add-to-cart/', views.add_to_cart, name='add_to_cart'),
     path('update-cart-item/', views.update_cart_item, name='update_cart_item'),
+    path('cart-batch/', views.cart_batch, name='cart_batch'),
     path('remove-from-cart/<int:item_id>/', views.remove_from_cart, name='remove_from_cart'),
     path('checkout/', views.checkout, name='checkout'),
     path('order-success/<int:order_id>/', views.order_success, name='order_success'),
+    path('metrics/views/', views.view_metrics, name='view_metrics'),
+    path('orders/export/', views.export_orders, name='export_orders'),
+    path('api/categories/', api.category_list, name='api_category_list'),
+    path('api/products/', api.product_list, name='api_product_list'),
+    path('api/suggestions/', api.suggestions, name='api_suggestions'),
+    path('api/products/<slug:slug>/', api.product_detail, name='api_product_detail'),
 ]
\ No newline at end of file
@@ -1,18 +1,36 @@
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.views.static import serve
 from django.core.paginator import Paginator
-from django.db.models import Q
-from .models import Category, Product, Cart, CartItem, Order, OrderItem
+from django.db.models import Exists, OuterRef
+from django.utils.functional import SimpleLazyObject
+from .caching import VersionedObject, cache_catalogue_page, get_version, stats as cache_stats
+from .carts import cart_json, open_cart, parse_operations
+from .catalogue import CatalogueQuery
+from .instrumentation import registry
+from .exports import FORMATS, STATUSES, export_filename, export_lines, parse_day
+from .facets import compute_facets, cube_from_queryset, cube_from_table
+from .models import Category, Product, CheckoutError, Order, FacetCount, Stock
+from .pagination import SORT_KEYS, CursorPaginator, cached_count, use_cursor_pagination
+from .recommendations import cart_recommendations, recommendations_version, recommended_products
+from .snapshot import enabled as snapshot_enabled, get_snapshot
 import json
 
 
 def home(request):
     """Главная страница с рекомендуемыми товарами"""
-    featured_products = Product.objects.filter(featured=True)[:8]
-    categories = Category.objects.all()[:6]
+    if snapshot_enabled():
+        catalogue = get_snapshot()
+        featured_products = catalogue.featured_products(8)
+        categories = catalogue.categories[:6]
+    else:
+        featured_products = Product.objects.filter(featured=True).prefetch_related('renditions')[:8]
+        categories = Category.objects.all()[:6]
     context = {
         'featured_products': featured_products,
         'categories': categories,
@@ -21,52 +39,41 @@ def home(request):
 
 
 def product_list(request):
-    """Список всех товаров с фильтрацией и поиском"""
-    products = Product.objects.all()
-    categories = Category.objects.all()
-    
-    # Фильтрация по категории
-    category_slug = request.GET.get('category')
-    if category_slug:
-        category = get_object_or_404(Category, slug=category_slug)
-        products = products.filter(category=category)
-    
-    # Поиск
-    search_query = request.GET.get('search')
-    if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) | 
-            Q(description__icontains=search_query)
-        )
-    
-    # Фильтрация по наличию
-    availability = request.GET.get('availability')
-    if availability:
-        products = products.filter(availability=availability)
+    """Список всех товаров с фильтрацией, фасетами и поиском"""
+    # Поиск идёт по полнотекстовому индексу в базе, остальное может отдать снимок каталога
+    catalogue = get_snapshot() if snapshot_enabled(request) and not request.GET.get('search') else None
+    categories = list(catalogue.categories if catalogue else Category.objects.all())
+    query = CatalogueQuery(request, categories)
     
-    # Сортировка
-    sort_by = request.GET.get('sort', 'name')
-    if sort_by == 'price_asc':
-        products = products.order_by('price')
-    elif sort_by == 'price_desc':
-        products = products.order_by('-price')
-    elif sort_by == 'newest':
-        products = products.order_by('-created_at')
+    # Поиск, фильтрация и сортировка
+    if catalogue:
+        products = catalogue.select(query.sort_by, query.category_ids or None, query.selection)
     else:
-        products = products.order_by('name')
+        unfiltered_products = query.search(Product.objects.prefetch_related('renditions'))
+        products = query.order(query.filter(unfiltered_products))
     
     # Пагинация
-    paginator = Paginator(products, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    pagination = paginate_products(request, products, query.sort_by)
+    if request.GET.get('format') == 'json':
+        return JsonResponse(products_page_json(pagination))
+    
+    # Фасеты: при поиске считаем по найденным товарам, иначе по предрасчитанной таблице
+    if catalogue:
+        cube = catalogue.cube
+    elif query.search_query:
+        cube = cube_from_queryset(unfiltered_products)
+    else:
+        cube = cube_from_table(FacetCount)
+    facets = compute_facets(cube, query.selection, categories, Product.AVAILABILITY_CHOICES)
     
     context = {
-        'page_obj': page_obj,
+        **pagination,
         'categories': categories,
-        'current_category': category_slug,
-        'search_query': search_query,
-        'current_availability': availability,
-        'current_sort': sort_by,
+        'facets': facets,
+        'current_category': request.GET.get('category'),
+        'search_query': query.search_query,
+        'current_availability': request.GET.get('availability'),
+        'current_sort': query.sort_by,
     }
     return render(request, 'store/product_list.html', context)
 
@@ -74,50 +81,119 @@ def product_list(request):
 def product_detail(request, slug):
     """Детальная страница товара"""
     product = get_object_or_404(Product, slug=slug)
-    related_products = Product.objects.filter(category=product.category).exclude(id=product.id)[:4]
-    
+    # Запросы категории и рекомендаций выполняются только при промахе кеша фрагментов
     context = {
         'product': product,
-        'related_products': related_products,
+        'related_products': SimpleLazyObject(lambda: recommended_products(product)),
+        'recommendations_version': recommendations_version(product.id),
+        'category_version': get_version('category', product.category_id),
     }
     return render(request, 'store/product_detail.html', context)
 
 
+# id категорий по slug для ключа кеша страниц категорий: без запроса при попадании в кеш
+_category_ids = VersionedObject(lambda: dict(Category.objects.values_list('slug', 'id')), 'catalogue')
+
+
+def category_scope(request, slug):
+    """Версия категории страницы: её сбрасывает и смена наличия товара категории"""
+    return [('category', _category_ids.get().get(slug))]
+
+
+@cache_catalogue_page(scope=category_scope)
 def category_detail(request, slug):
     """Страница категории"""
-    category = get_object_or_404(Category, slug=slug)
-    products = Product.objects.filter(category=category)
+    # Сортировка
+    sort_by = request.GET.get('sort', 'newest')
+    if sort_by not in SORT_KEYS:
+        sort_by = 'newest'
+
+    if snapshot_enabled(request):
+        catalogue = get_snapshot()
+        category = catalogue.category_by_slug.get(slug)
+        if category is None:
+            raise Http404('Категория не найдена')
+        products = catalogue.select(sort_by, [category.id])
+    else:
+        category = get_object_or_404(Category, slug=slug)
+        products = Product.objects.filter(category=category).prefetch_related('renditions')
+        products = products.order_by(*SORT_KEYS[sort_by])
     
     # Пагинация
-    paginator = Paginator(products, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    pagination = paginate_products(request, products, sort_by)
+    if request.GET.get('format') == 'json':
+        return JsonResponse(products_page_json(pagination))
     
     context = {
+        **pagination,
         'category': category,
-        'page_obj': page_obj,
+        'current_sort': sort_by,
     }
     return render(request, 'store/category_detail.html', context)
 
 
-def get_or_create_cart(request):
-    """Получить или создать корзину для пользователя"""
-    if request.user.is_authenticated:
-        cart, created = Cart.objects.get_or_create(user=request.user)
+def paginate_products(request, products, sort_by, per_page=12):
+    """Контекст пагинации: OFFSET по умолчанию или курсорный режим по запросу"""
+    query_params = request.GET.copy()
+    query_params.pop('page', None)
+    query_params.pop('cursor', None)
+    query_params.pop('format', None)
+    
+    if use_cursor_pagination(request) and sort_by in SORT_KEYS:
+        paginator = CursorPaginator(products, SORT_KEYS[sort_by], per_page)
+        return {
+            'page_obj': paginator.page(request.GET.get('cursor')),
+            'cursor_mode': True,
+            'total_count': cached_count(products),
+            'query_string': query_params.urlencode(),
+        }
+    
+    paginator = Paginator(products, per_page)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    return {
+        'page_obj': page_obj,
+        'cursor_mode': False,
+        'page_range': paginator.get_elided_page_range(page_obj.number, on_each_side=2, on_ends=0),
+        'total_count': paginator.count,
+        'query_string': query_params.urlencode(),
+    }
+
+
+def products_page_json(pagination):
+    """JSON-представление страницы товаров"""
+    page_obj = pagination['page_obj']
+    data = {
+        'count': pagination['total_count'],
+        'results': [
+            {
+                'id': product.id,
+                'name': product.name,
+                'slug': product.slug,
+                'price': str(product.price),
+                'availability': product.availability,
+                'url': product.get_absolute_url(),
+                'image': product.image.url if product.image else None,
+            }
+            for product in page_obj
+        ],
+    }
+    if pagination['cursor_mode']:
+        data['next'] = page_obj.next_cursor
+        data['previous'] = page_obj.previous_cursor
     else:
-        session_key = request.session.session_key
-        if not session_key:
-            request.session.create()
-            session_key = request.session.session_key
-        cart, created = Cart.objects.get_or_create(session_key=session_key)
-    return cart
+        data['next'] = page_obj.next_page_number() if page_obj.has_next() else None
+        data['previous'] = page_obj.previous_page_number() if page_obj.has_previous() else None
+    return data
 
 
 def cart_view(request):
     """Просмотр корзины"""
-    cart = get_or_create_cart(request)
+    cart = open_cart(request)
+    cart_items = cart.items()
     context = {
         'cart': cart,
+        'cart_items': cart_items,
+        'recommended_products': cart_recommendations([item.product.pk for item in cart_items]),
     }
     return render(request, 'store/cart.html', context)
 
@@ -131,18 +207,15 @@ def add_to_cart(request):
             product_id = data.get('product_id')
             quantity = int(data.get('quantity', 1))
             
-            product = get_object_or_404(Product, id=product_id)
-            cart = get_or_create_cart(request)
-            
-            cart_item, created = CartItem.objects.get_or_create(
-                cart=cart,
-                product=product,
-                defaults={'quantity': quantity}
+            # Признак учёта остатка — тем же запросом, чтобы резерв не проверял Stock отдельно
+            product = get_object_or_404(
+                Product.objects.only('id', 'name', 'price').annotate(
+                    stock_tracked=Exists(Stock.objects.filter(product=OuterRef('pk'))),
+                ),
+                id=product_id,
             )
-            
-            if not created:
-                cart_item.quantity += quantity
-                cart_item.save()
+            cart = open_cart(request)
+            cart.add(product, quantity)
             
             return JsonResponse({
                 'success': True,
@@ -151,6 +224,8 @@ def add_to_cart(request):
                 'cart_total_price': float(cart.total_price)
             })
             
+        except CheckoutError as error:
+            return JsonResponse({'success': False, 'message': str(error)})
         except Exception as e:
             return JsonResponse({
                 'success': False,
@@ -169,22 +244,18 @@ def update_cart_item(request):
             item_id = data.get('item_id')
             quantity = int(data.get('quantity'))
             
-            cart = get_or_create_cart(request)
-            cart_item = get_object_or_404(CartItem, id=item_id, cart=cart)
-            
-            if quantity > 0:
-                cart_item.quantity = quantity
-                cart_item.save()
-            else:
-                cart_item.delete()
+            cart = open_cart(request)
+            item_total = cart.update(item_id, quantity)
             
             return JsonResponse({
                 'success': True,
                 'cart_total_items': cart.total_items,
                 'cart_total_price': float(cart.total_price),
-                'item_total': float(cart_item.total_price) if quantity > 0 else 0
+                'item_total': float(item_total)
             })
             
+        except CheckoutError as error:
+            return JsonResponse({'success': False, 'message': str(error)})
         except Exception as e:
             return JsonResponse({
                 'success': False,
@@ -194,12 +265,25 @@ def update_cart_item(request):
     return JsonResponse({'success': False, 'message': 'Неверный запрос'})
 
 
+@csrf_exempt
+def cart_batch(request):
+    """Пакет операций add/set/remove над корзиной (AJAX); в ответе — вся пересчитанная корзина"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Неверный запрос'}, status=405)
+    cart = open_cart(request)
+    try:
+        payload = json.loads(request.body)
+        cart.apply(parse_operations(payload.get('operations') if isinstance(payload, dict) else None))
+    except ValueError as error:
+        return JsonResponse({'success': False, 'message': str(error)}, status=400)
+    except CheckoutError as error:
+        return JsonResponse({'success': False, 'message': str(error), 'cart': cart_json(cart)})
+    return JsonResponse({'success': True, 'cart': cart_json(cart)})
+
+
 def remove_from_cart(request, item_id):
     """Удалить товар из корзины"""
-    cart = get_or_create_cart(request)
-    cart_item = get_object_or_404(CartItem, id=item_id, cart=cart)
-    product_name = cart_item.product.name
-    cart_item.delete()
+    product_name = open_cart(request).remove(item_id)
     
     messages.success(request, f'{product_name} удалён из корзины')
     return redirect('store:cart')
@@ -207,49 +291,81 @@ def remove_from_cart(request, item_id):
 
 def checkout(request):
     """Оформление заказа"""
-    cart = get_or_create_cart(request)
-    
-    if not cart.items.exists():
-        messages.warning(request, 'Ваша корзина пуста')
-        return redirect('store:cart')
+    cart = open_cart(request)
     
     if request.method == 'POST':
-        # Создание заказа
-        order = Order.objects.create(
-            user=request.user if request.user.is_authenticated else None,
-            first_name=request.POST.get('first_name'),
-            last_name=request.POST.get('last_name'),
-            email=request.POST.get('email'),
-            phone=request.POST.get('phone'),
-            address=request.POST.get('address'),
-            total_amount=cart.total_price
-        )
-        
-        # Создание элементов заказа
-        for item in cart.items.all():
-            OrderItem.objects.create(
-                order=order,
-                product=item.product,
-                price=item.product.price,
-                quantity=item.quantity
+        # Заказ создаётся одной транзакцией по снимку корзины
+        try:
+            order = cart.checkout(
+                user=request.user if request.user.is_authenticated else None,
+                first_name=request.POST.get('first_name'),
+                last_name=request.POST.get('last_name'),
+                email=request.POST.get('email'),
+                phone=request.POST.get('phone'),
+                address=request.POST.get('address'),
             )
-        
-        # Очистка корзины
-        cart.items.all().delete()
+        except CheckoutError as error:
+            messages.warning(request, str(error))
+            return redirect('store:cart')
         
         messages.success(request, f'Заказ #{order.id} успешно оформлен!')
         return redirect('store:order_success', order_id=order.id)
     
+    if not cart.total_items:
+        messages.warning(request, 'Ваша корзина пуста')
+        return redirect('store:cart')
+    
     context = {
         'cart': cart,
+        'cart_items': cart.items(),
     }
     return render(request, 'store/checkout.html', context)
 
 
 def order_success(request, order_id):
     """Страница успешного оформления заказа"""
-    order = get_object_or_404(Order, id=order_id)
+    order = get_object_or_404(Order.objects.prefetch_related('items__product__renditions'), id=order_id)
     context = {
         'order': order,
     }
     return render(request, 'store/order_success.html', context)
+
+
+def serve_rendition(request, path):
+    """Вариант изображения для разработки; имя содержит хеш, поэтому кешируется навсегда"""
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
+@staff_member_required
+def export_orders(request):
+    """Потоковая выгрузка заказов с позициями (только для сотрудников): ?format=csv|jsonl&start=&end=&status="""
+    export_format = request.GET.get('format', 'csv')
+    statuses = request.GET.getlist('status')
+    try:
+        start, end = parse_day(request.GET.get('start')), parse_day(request.GET.get('end'))
+        if export_format not in FORMATS or not set(statuses) <= set(STATUSES):
+            raise ValueError('Неверный формат или статус')
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+
+    response = StreamingHttpResponse(
+        export_lines(export_format, start=start, end=end, statuses=statuses),
+        content_type=FORMATS[export_format],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{export_filename(export_format, start, end)}"'
+    return response
+
+
+@staff_member_required
+def view_metrics(request):
+    """Метрики представлений и кеша каталога в JSON (только для сотрудников); POST сбрасывает окно"""
+    if request.method == 'POST':
+        registry.reset()
+        cache_stats.reset()
+    return JsonResponse({
+        'enabled': getattr(settings, 'STORE_INSTRUMENTATION', False),
+        'views': registry.snapshot(),
+        'cache': cache_stats.snapshot(),
+    })